@@ -141,7 +141,7 @@ class snapshot(Analyzer):
         """
         for t in self.timesteps:
             if np.isclose(sim.i, t):
-                self.snapshots[str(sim.i)] = sc.dcp(sim.people) # Take snapshot!
+                self.snapshots[str(sim.i)] = sim.people.copy() # Take snapshot!
         return
 
 
@@ -154,7 +154,7 @@ class timeseries_recorder(Analyzer):
         self.i: The list of timesteps (ie, 0 to 261 steps).
         self.t: The time elapsed in years given how many timesteps have passed (ie, 25.75 years).
         self.y: The calendar year of timestep (ie, 1975.75).
-        self.keys: A list of people states excluding 'dobs'.
+        self.keys: A list of people states excluding event histories such as 'dobs'.
         self.data: A dictionary where self.data[state][timestep] is the mean of the state at that timestep.
     '''
 
@@ -174,8 +174,7 @@ class timeseries_recorder(Analyzer):
         Initializes self.keys from sim.people
         """
         super().initialize()
-        self.keys = sim.people.keys()
-        self.keys.remove('dobs')
+        self.keys = [key for key in sim.people.keys() if not fpd.person_states[key].ragged] # Event histories do not have a mean
         for key in self.keys:
             self.data[key] = []
         return
@@ -257,10 +256,15 @@ class age_pyramids(Analyzer):
     def apply(self, sim):
         """
         Records histogram of ages of all alive individuals at a timestep such that
-        self.data[timestep] = list of proportions where index signifies age
+        self.data[timestep] = list of proportions where index signifies age,
+        including men counted by age rather than as agents (pars['aggregate_men'])
         """
-        ages = sim.people.age[sc.findinds(sim.people.alive)]
-        self._raw[sim.i, :] = np.histogram(ages, self.bins)[0]
+        ppl = sim.people
+        alive = sc.findinds(ppl.alive)
+        self._raw[sim.i, :] = np.histogram(ppl.age[alive], self.bins, weights=ppl.weight[alive])[0]
+        if ppl.male_counts is not None:
+            male_ages = np.arange(len(ppl.male_counts)) / fpd.mpy # Counts are by age in months
+            self._raw[sim.i, :] += np.histogram(male_ages, self.bins, weights=ppl.male_counts)[0]
         self.data[sim.i, :] = self._raw[sim.i, :]/self._raw[sim.i, :].sum()
 
     def plot(self):
@@ -304,7 +308,7 @@ class verbose_sim(Analyzer):
         self.events = sc.ddict(dict)
         self.channels = ["Births", "Conceptions", "Miscarriages", "Deaths"]
         self.set_baseline = False
-        self.states = list(fpd.person_defaults.keys()) + ['dobs'] # states saved by timestep
+        self.states = [key for key,state in fpd.person_states.items() if state.export] # states saved by timestep
 
     def apply(self, sim):
         """
@@ -13,7 +13,7 @@ obj_get = object.__getattribute__ # Alias the default getattribute method
 obj_set = object.__setattr__
 
 
-__all__ = ['ParsObj', 'BasePeople', 'BaseSim']
+__all__ = ['ParsObj', 'Ragged', 'Calendar', 'BasePeople', 'PeopleView', 'Results', 'BaseSim']
 
 
 class FlexPretty(sc.prettyobj):
@@ -113,15 +113,296 @@ class ParsObj(FlexPretty):
         return
 
 
+def _reserve(buf, n):
+    ''' Return the buffer, or a copy of it with at least double the capacity if it cannot hold n items '''
+    if len(buf) < n:
+        new = np.empty(max(n, 2*len(buf)), dtype=buf.dtype)
+        new[:len(buf)] = buf
+        buf = new
+    return buf
+
+
+class Ragged:
+    '''
+    A history of events for each person, e.g. the ages at which each woman gave
+    birth, stored as flat arrays of owners and values rather than a list of lists
+
+    Args:
+        n (int): the number of people
+        dtype (type): the data type of the values
+    '''
+
+    def __init__(self, n=0, dtype=np.float64):
+        self._n      = int(n)
+        self._counts = np.zeros(self._n, dtype=np.int64) # Number of events for each person
+        self._owners = np.empty(0, dtype=np.int64) # Buffers with spare capacity; see _reserve()
+        self._values = np.empty(0, dtype=dtype)
+        self._size   = 0 # Number of events stored
+        self._sorted = None # Cache of the events sorted by person; see _compile()
+        return
+
+
+    def __len__(self):
+        return self._n
+
+
+    def __repr__(self):
+        return f'<Ragged: {self._n} people, {self._size} events>'
+
+
+    def __getitem__(self, key):
+        ''' Return the events of a single person as an array, or a Ragged of a subset of people '''
+        if sc.isnumber(key):
+            key = int(key)
+            if key < 0:
+                key += self._n
+            offsets, values = self._compile()
+            return values[offsets[key]:offsets[key+1]]
+        else:
+            return self.subset(key)
+
+
+    def __iter__(self):
+        offsets, values = self._compile()
+        for i in range(self._n):
+            yield values[offsets[i]:offsets[i+1]]
+
+
+    def __getstate__(self):
+        ''' Do not copy or pickle spare capacity or the cache '''
+        state = self.__dict__.copy()
+        state['_counts'] = self.counts.copy()
+        state['_owners'] = self.owners.copy()
+        state['_values'] = self.values.copy()
+        state['_sorted'] = None
+        return state
+
+
+    @property
+    def counts(self):
+        ''' Number of events for each person '''
+        return self._counts[:self._n]
+
+
+    @property
+    def owners(self):
+        ''' Index of the person each event belongs to, in the order added '''
+        return self._owners[:self._size]
+
+
+    @property
+    def values(self):
+        ''' Value of each event, in the order added '''
+        return self._values[:self._size]
+
+
+    def _compile(self):
+        ''' Sort the events by person (keeping the order of each person's events) and compute offsets '''
+        if self._sorted is None:
+            order   = np.argsort(self.owners, kind='stable')
+            offsets = np.zeros(self._n+1, dtype=np.int64)
+            np.cumsum(self.counts, out=offsets[1:])
+            self._sorted = (offsets, self.values[order])
+        return self._sorted
+
+
+    def append(self, inds, values):
+        '''
+        Add one event for each of the people specified.
+
+        Args:
+            inds (int/array): indices of the people
+            values (scalar/array): the value of each event (broadcast if a scalar)
+        '''
+        inds   = np.atleast_1d(np.asarray(inds, dtype=np.int64))
+        n_new  = len(inds)
+        if n_new:
+            size = self._size + n_new
+            self._owners = _reserve(self._owners, size)
+            self._values = _reserve(self._values, size)
+            self._owners[self._size:size] = inds
+            self._values[self._size:size] = values
+            self._size = size
+            np.add.at(self._counts, inds, 1)
+            self._sorted = None
+        return
+
+
+    def extend(self, other):
+        '''
+        Add people to the end, either another Ragged (whose events are added too)
+        or a number of people with no events.
+        '''
+        n_old = self._n
+        if isinstance(other, Ragged):
+            n_new = len(other)
+            if other._size:
+                size = self._size + other._size
+                self._owners = _reserve(self._owners, size)
+                self._values = _reserve(self._values, size)
+                self._owners[self._size:size] = other.owners + n_old
+                self._values[self._size:size] = other.values
+                self._size = size
+        else:
+            n_new = int(other)
+        self._n += n_new
+        self._counts = _reserve(self._counts, self._n)
+        self._counts[n_old:self._n] = other.counts if isinstance(other, Ragged) else 0
+        self._sorted = None
+        return self
+
+
+    def set_values(self, events, values):
+        ''' Change the values of existing events, specified by their indices into ``owners`` and ``values`` '''
+        self.values[events] = values
+        self._sorted = None
+        return
+
+
+    def subset(self, inds):
+        '''
+        Return a new Ragged with only the people specified (by unique indices or
+        a boolean array), in that order.
+        '''
+        inds = np.asarray(inds)
+        if inds.dtype == bool:
+            inds = inds.nonzero()[0]
+        mapping = np.full(self._n, -1, dtype=np.int64)
+        mapping[inds] = np.arange(len(inds))
+        new_owners = mapping[self.owners]
+        keep = new_owners >= 0
+        out = Ragged(len(inds), dtype=self._values.dtype)
+        out._owners = new_owners[keep]
+        out._values = self.values[keep]
+        out._size   = len(out._values)
+        out._counts = self.counts[inds].copy()
+        return out
+
+
+    def first(self, default=np.nan):
+        ''' The first event of each person, or the default for people with no events '''
+        offsets, values = self._compile()
+        has = self.counts > 0
+        out = np.full(self._n, default, dtype=np.result_type(values.dtype, np.min_scalar_type(default)))
+        out[has] = values[offsets[:-1][has]]
+        return out
+
+
+    def last(self, default=np.nan):
+        ''' The most recent event of each person, or the default for people with no events '''
+        offsets, values = self._compile()
+        has = self.counts > 0
+        out = np.full(self._n, default, dtype=np.result_type(values.dtype, np.min_scalar_type(default)))
+        out[has] = values[offsets[1:][has]-1]
+        return out
+
+
+    def diff(self):
+        ''' The differences between consecutive events of the same person, e.g. birth spacing, as a flat array '''
+        offsets, values = self._compile()
+        same = np.ones(len(values), dtype=bool)
+        same[offsets[:-1][self.counts > 0]] = False # The first event of each person has no previous event
+        return (values[1:] - values[:-1])[same[1:]]
+
+
+    def to_list(self):
+        ''' Convert to a list of lists '''
+        return [v.tolist() for v in self]
+
+
+    def to_json(self):
+        ''' Used by sc.jsonify() '''
+        return self.to_list()
+
+
+class Calendar:
+    '''
+    A calendar of scheduled events, e.g. deliveries, storing the UIDs of the
+    people with each kind of event due at each timestep
+    '''
+
+    def __init__(self):
+        self.events = {} # For each event, a dict of lists of arrays of UIDs by timestep
+        return
+
+
+    def __len__(self):
+        ''' Number of events scheduled '''
+        return sum(len(uids) for buckets in self.events.values() for chunks in buckets.values() for uids in chunks)
+
+
+    def __repr__(self):
+        return f'Calendar({len(self)} events: {sc.strjoin(self.events.keys())})'
+
+
+    def schedule(self, event, steps, uids):
+        '''
+        Schedule an event for each person.
+
+        Args:
+            event (str): the kind of event, e.g. 'delivery'
+            steps (int/array): the timestep (index) in which each event is due
+            uids (array): the UIDs of the people
+        '''
+        uids  = np.array(uids, dtype=np.int64)
+        steps = np.broadcast_to(np.asarray(steps, dtype=np.int64), uids.shape)
+        buckets = self.events.setdefault(event, {})
+        if len(steps) and steps.min() == steps.max(): # Usually all due in the same timestep
+            buckets.setdefault(int(steps[0]), []).append(uids)
+        else:
+            for step in np.unique(steps):
+                buckets.setdefault(int(step), []).append(uids[steps == step])
+        return
+
+
+    def pop(self, event, step):
+        '''
+        Remove and return the UIDs of the people with an event due in this
+        timestep, in no particular order. Events from earlier timesteps that
+        were not checked are discarded.
+
+        Args:
+            event (str): the kind of event
+            step (int): the timestep (index)
+        '''
+        buckets = self.events.get(event, {})
+        for past in [k for k in buckets if k < step]:
+            del buckets[past]
+        chunks = buckets.pop(step, [])
+        return np.concatenate(chunks) if chunks else np.zeros(0, dtype=np.int64)
+
+
+    def get(self, event, step):
+        ''' Return the UIDs of the people with an event in this timestep without removing them, e.g. for yearly events '''
+        chunks = self.events.get(event, {}).get(step, [])
+        return np.concatenate(chunks) if chunks else np.zeros(0, dtype=np.int64)
+
+
+    def replace(self, event, step, uids):
+        ''' Replace the UIDs of the people with an event in this timestep, e.g. to drop people who no longer need it '''
+        self.events.setdefault(event, {})[step] = [np.array(uids, dtype=np.int64)]
+        return
+
+
+    def cancel(self, event):
+        ''' Remove all the scheduled events of a kind, e.g. to reschedule them '''
+        self.events.pop(event, None)
+        return
+
+
 class BasePeople(sc.prettyobj):
     '''
     Class for all the people in the simulation.
     '''
 
+    _keys = () # Names of the states, set by People from fpd.person_states; empty until then, e.g. while unpickling
+
     def __init__(self):
         ''' Initialize essential attributes used for filtering '''
-        obj_set(self, '_keys', []) # Since getattribute is overwritten
-        obj_set(self, '_inds', None)
+        obj_set(self, '_keys', [])
+        obj_set(self, '_next_uid', 0) # The UID to assign to the next person added
+        obj_set(self, '_buffers', {}) # Backing arrays with spare capacity for each state; see _grow()
+        obj_set(self, '_archive', sc.ddict(list)) # People removed by compact(), stored as chunks for each key
         return
 
 
@@ -153,38 +434,31 @@ class BasePeople(sc.prettyobj):
         return
 
 
-    def _is_filtered(self, attr):
-        ''' Determine if a given attribute is filtered (e.g. people.age is, people.inds isn't) '''
-        is_filtered = (self._inds is not None and attr in self._keys)
-        return is_filtered
+    def __getstate__(self):
+        ''' Do not copy or pickle the spare capacity of the buffers; they are recreated when needed '''
+        state = self.__dict__.copy()
+        state['_buffers'] = {}
+        return state
 
 
-    def __getattribute__(self, attr):
-        ''' For array quantities, handle filtering '''
-        output  = obj_get(self, attr)
-        if attr[0] == '_': # Short-circuit for built-in methods to save time
-            return output
-        else:
-            try: # Unclear wy this fails, but sometimes it does during initialization/pickling
-                keys = obj_get(self, '_keys')
-            except:
-                keys = []
-            if attr not in keys:
-                return output
-            else:
-                if self._is_filtered(attr):
-                    output = output[self.inds]
-        return output
-
+    def _grow(self, key, n):
+        '''
+        Ensure the buffer backing a state can hold n people, doubling its capacity as needed
 
-    def __setattr__(self, attr, value):
-        ''' Ditto '''
-        if self._is_filtered(attr):
-            array = obj_get(self, attr)
-            array[self.inds] = value
-        else:   # If not initialized, rely on the default behavior
-            obj_set(self, attr, value)
-        return
+        Args:
+            key (str): the state to grow
+            n (int): the number of people the buffer needs to hold
+        '''
+        val = obj_get(self, key)
+        buf = self._buffers.get(key)
+        stale = buf is None or val.base is not buf
+        if stale or len(buf) < n:
+            capacity = max(n, len(val)) if stale else max(n, 2*len(buf))
+            buf = np.empty((capacity,) + val.shape[1:], dtype=val.dtype)
+            buf[:len(val)] = val
+            self._buffers[key] = buf
+            obj_set(self, key, buf[:len(val)])
+        return buf
 
 
     def __add__(self, people2):
@@ -194,25 +468,24 @@ class BasePeople(sc.prettyobj):
         newpeople = self
         keys      = self.keys()
         n_orig    = len(newpeople)
-        max_uid   = newpeople.uid.max() + 1
+        first_uid = newpeople._next_uid # Not uid.max()+1, since the oldest agents may have been removed by compact()
         n_new     = len(people2)
+        n_total   = n_orig + n_new
 
         # Merge arrays
         for key in keys:
-            npval = newpeople[key]
-            p2val = people2[key]
-            if isinstance(npval, np.ndarray):
-                newpeople[key] = np.concatenate([npval, p2val], axis=0)
-            elif isinstance(npval, list):
-                newpeople[key] += p2val
-            else:
-                errormsg = f'Not sure what to do with object of type {type(npval)}'
-                raise TypeError(errormsg)
+            if fpd.person_states[key].ragged:
+                newpeople[key].extend(people2[key])
+            else: # Append to the end of the buffer, growing it if needed
+                buf = newpeople._grow(key, n_total)
+                buf[n_orig:n_total] = people2[key]
+                obj_set(newpeople, key, buf[:n_total])
 
         # Validate
         for key in keys:
             assert len(newpeople[key]) == len(newpeople)
-        newpeople.uid[n_orig:] = max_uid + np.arange(n_new) # Reassign UIDs so they're unique
+        newpeople.uid[n_orig:] = first_uid + np.arange(n_new) # Reassign UIDs so they're unique
+        newpeople._next_uid = first_uid + n_new
 
         return newpeople
 
@@ -224,12 +497,121 @@ class BasePeople(sc.prettyobj):
 
 
     def keys(self):
-        ''' Returns keys for all properties of the people object '''
-        try: # Unclear wy this fails, but sometimes it does during initialization/pickling
-            keys = obj_get(self, '_keys')[:]
-        except:
-            keys = []
-        return keys
+        ''' Returns the names of the states of the people; see fpd.person_states '''
+        return list(self._keys)
+
+
+    def export(self):
+        '''
+        Return the exported states (see fpd.person_states) as a dict. Arrays are
+        the states themselves rather than copies, so use people.copy() first if
+        the people will be changed afterwards.
+        '''
+        return sc.objdict({key:self[key] for key in self.keys() if fpd.person_states[key].export})
+
+
+    def copy(self):
+        '''
+        Return a copy of the people, e.g. to take a snapshot. Everything is copied
+        except the spare capacity of the buffers and the parameters, which are
+        shared with the original.
+        '''
+        state = self.__getstate__()
+        pars = state.pop('pars', None)
+        new = object.__new__(self.__class__)
+        new.__dict__.update(sc.dcp(state))
+        obj_set(new, 'pars', pars)
+        return new
+
+
+    def uid2ind(self, uids):
+        '''
+        Convert UIDs to indices into the people arrays. UIDs are assigned in
+        increasing order and compact() preserves that order, so this is a binary
+        search. UIDs that are no longer present (e.g. archived) are dropped.
+
+        Args:
+            uids (array): the UIDs to look up
+
+        Returns:
+            Array of indices of the people with those UIDs
+        '''
+        uid  = self.uid
+        uids = np.asarray(uids, dtype=np.int64)
+        inds = np.minimum(np.searchsorted(uid, uids), max(len(uid)-1, 0))
+        if len(uid):
+            inds = inds[uid[inds] == uids]
+        else:
+            inds = inds[:0]
+        return inds
+
+
+    def set(self, **kwargs):
+        '''
+        Set the values of states for everyone, e.g. ``people.set(lam=False)``;
+        the same call on a view, e.g. ``people.filter(people.pregnant).set(lam=False)``,
+        sets them only for the people in the view.
+        '''
+        for key,value in kwargs.items():
+            self.__dict__[key][:] = value
+        return
+
+
+    def increment(self, **kwargs):
+        ''' Add to the values of states for everyone, e.g. ``people.increment(parity=1)``; see set() '''
+        for key,value in kwargs.items():
+            self.__dict__[key][:] += value
+        return
+
+
+    def compact(self):
+        '''
+        Move dead people from the people arrays to the archive (see ``get_archive()``);
+        UIDs are unchanged
+
+        Returns:
+            The number of people removed
+        '''
+        if self.unfilter() is not self: # pragma: no cover
+            errormsg = 'Cannot compact a view of people; use people.unfilter() first'
+            raise RuntimeError(errormsg)
+
+        dead = sc.findinds(~self.alive)
+        n_dead = len(dead)
+        if n_dead:
+            live = sc.findinds(self.alive)
+            n_live = len(live)
+            for key in self.keys():
+                val = self[key]
+                self._archive[key].append(val[dead])
+                if fpd.person_states[key].ragged:
+                    self[key] = val[live]
+                else: # Move the people still alive to the start of the buffer
+                    buf = self._grow(key, n_live)
+                    buf[:n_live] = buf[live]
+                    obj_set(self, key, buf[:n_live])
+        return n_dead
+
+
+    def get_archive(self):
+        '''
+        Return the states of everyone removed by compact(), in the order in which
+        they were removed, as a dict of arrays (or lists) with the same keys as
+        the people object.
+        '''
+        archive = sc.objdict()
+        for key in self.keys():
+            chunks = self._archive.get(key, [])
+            val = self[key]
+            if fpd.person_states[key].ragged:
+                archive[key] = Ragged(0, dtype=val.values.dtype)
+                for chunk in chunks:
+                    archive[key].extend(chunk)
+            elif len(chunks):
+                archive[key] = np.concatenate(chunks)
+            else:
+                archive[key] = val[:0].copy()
+        return archive
 
     @property
     def is_female(self):
@@ -261,18 +643,58 @@ class BasePeople(sc.prettyobj):
         ''' Number of people alive '''
         return self.alive.sum()
 
+    def count(self, mask=None):
+        '''
+        Number of people represented by the agents, i.e. the sum of their sampling
+        weights (see pars['sampling_rates']), or the number of agents if they are
+        not weighted.
+
+        Args:
+            mask (array): if supplied, only count the agents for which it is True
+        '''
+        if self.pars['sampling_rates'] is None:
+            return len(self) if mask is None else np.count_nonzero(mask)
+        weight = self.weight
+        return weight.sum() if mask is None else weight[np.asarray(mask, dtype=bool)].sum()
+
+    def count_by(self, groups, n):
+        '''
+        Number of people represented by the agents in each group, as for count().
+
+        Args:
+            groups (array): the group of each agent, from 0 to n-1, or -1 for agents in no group
+            n (int): the number of groups
+        '''
+        valid   = groups >= 0
+        weights = None if self.pars['sampling_rates'] is None else self.weight[valid]
+        return np.bincount(groups[valid], weights=weights, minlength=n)
+
+    def contains(self, inds):
+        '''
+        Whether each of the people with these indices (into the full people
+        arrays) is selected, i.e. everyone for people, and only the people in
+        the view for a view.
+        '''
+        return np.ones(len(inds), dtype=bool)
+
+    def mask(self, view):
+        '''
+        Boolean array of whether each person is in a view of the same people, e.g.
+        ``preg.mask(preg.filter(preg.age > 30))``, without searching by UID.
+        '''
+        mask = np.zeros(len(self.unfilter()), dtype=bool)
+        mask[view.inds] = True
+        return mask[self.inds]
+
     @property
     def inds(self):
-        ''' Alias to self._inds to prevent accidental overwrite & increase speed '''
-        return self._inds
+        ''' Indices of everyone (for a view, only the people in the view) '''
+        return np.arange(len(self))
 
     @property
     def len_inds(self):
         ''' Alias to len(self) '''
-        if self._inds is not None:
-            return len(self._inds)
-        else:
-            return len(self)
+        return len(self)
 
     @property
     def len_people(self):
@@ -308,52 +730,56 @@ class BasePeople(sc.prettyobj):
 
     def filter(self, criteria=None, inds=None):
         '''
-        Store indices to allow for easy filtering of the People object.
+        Select a subset of people, e.g. ``people.filter(people.pregnant)``.
 
         Args:
             criteria (array): a boolean array for the filtering critria
             inds (array): alternatively, explicitly filter by these indices
 
         Returns:
-            A filtered People object, which works just like a normal People object
-            except only operates on a subset of indices.
-        '''
-
-        # Create a new People object with the same properties as the original
-        filtered = object.__new__(self.__class__) # Create a new People instance
-        BasePeople.__init__(filtered) # Perform essential initialization
-        filtered.__dict__ = {k:v for k,v in self.__dict__.items()} # Copy pointers to the arrays in People
-
-        # Perform the filtering
-        if criteria is None: # No filtering: reset
-            filtered._inds = None
-            if inds is not None: # Unless indices are supplied directly, in which case use them
-                filtered._inds = inds
-        else: # Main use case: perform filtering
-            if len(criteria) == len(self): # Main use case: a new filter applied on an already filtered object, e.g. filtered.filter(filtered.age > 5)
-                new_inds = criteria.nonzero()[0] # Criteria is already filtered, just get the indices
-            elif len(criteria) == self.len_people: # Alternative: a filter on the underlying People object is applied to the filtered object, e.g. filtered.filter(people.age > 5)
-                new_inds = criteria[filtered.inds].nonzero()[0] # Apply filtering before getting the new indices
-            else:
-                errormsg = f'"criteria" must be boolean array matching either current filter length ({self.len_inds}) or else the total number of people ({self.len_people}), not {len(criteria)}'
+            A PeopleView of the selected people, or the people themselves if
+            neither criteria nor inds are supplied
+        '''
+        if criteria is not None:
+            if len(criteria) != len(self):
+                errormsg = f'"criteria" must be boolean array matching the number of people ({len(self)}), not {len(criteria)}'
                 raise ValueError(errormsg)
-            if filtered.inds is None: # Not yet filtered: use the indices directly
-                filtered._inds = new_inds
-            else: # Already filtered: map them back onto the original People indices
-                filtered._inds = filtered.inds[new_inds]
-
-        return filtered
+            return PeopleView(self, mask=criteria)
+        elif inds is not None:
+            return PeopleView(self, inds=inds)
+        else:
+            return self
 
 
     def unfilter(self):
         '''
-        An easy way of unfiltering the People object, returning the original.
+        Return the people object itself; a view returns the people it was created from.
         '''
-        unfiltered = self.filter(criteria=None)
-        return unfiltered
+        return self
 
 
-    def binomial(self, prob, as_inds=False, as_filter=False):
+    def random(self, stream=None, size=None):
+        '''
+        Uniform random numbers in [0, 1), one per person, from the global random state
+        or, with ``pars['rng'] = 'streams'``, from each person's own stream (see ``fpu.stream_random()``)
+
+        Args:
+            stream (str): the name of the kind of draw, e.g. 'death'; if None, always use the global random state
+            size (int): if supplied, the number of draws per person, returned as an array of shape (size, len(people))
+        '''
+        if stream is None or self.pars['rng'] != 'streams':
+            return np.random.random(len(self) if size is None else (size, len(self)))
+        return fpu.stream_random(self.pars['seed'], stream, self.i, self.uid, size=size)
+
+
+    def randint(self, low, high, stream=None):
+        ''' Random integers from low to high inclusive, one per person; see random() for the stream '''
+        if stream is None or self.pars['rng'] != 'streams':
+            return np.random.randint(low, high+1, size=len(self))
+        return low + (self.random(stream)*(high - low + 1)).astype(np.int64)
+
+
+    def binomial(self, prob, as_inds=False, as_filter=False, stream=None):
         '''
         Return indices either by a single probability or by an array of probabilities.
         By default just return the boolean array, but can also return the indices,
@@ -363,14 +789,12 @@ class BasePeople(sc.prettyobj):
             prob (float/array): either a scalar probability, or an array of probabilities of the same length as People
             as_inds (bool): return as list of indices instead of a boolean array
             as_filter (bool): return as filter instead than boolean array
+            stream (str): the name of the kind of draw, for pars['rng'] = 'streams'; see random()
         '''
-        if sc.isnumber(prob):
-            arr = fpu.n_binomial(prob, len(self))
-        elif sc.isarray(prob):
-            arr = fpu.binomial_arr(prob)
-        else:
+        if not (sc.isnumber(prob) or sc.isarray(prob)):
             errormsg = f'Could not recognize {type(prob)} as a scalar or array'
             raise TypeError(errormsg)
+        arr = self.random(stream) < prob
         if as_inds:
             output = sc.findinds(arr)
         elif as_filter:
@@ -380,6 +804,202 @@ class BasePeople(sc.prettyobj):
         return output
 
 
+class PeopleView:
+    '''
+    A read-only subset of people, returned by ``people.filter()``; write states
+    with ``view.set()`` and ``view.increment()``
+
+    Args:
+        people (People): the people to select from
+        inds (array): the indices of the people to select
+        mask (array): alternatively, a boolean array of the people to select
+    '''
+
+    __slots__ = ('people', '_inds', '_mask', '_len')
+
+    dense = 0.25 # Fraction of people selected above which the view stores a boolean mask rather than indices
+
+    def __init__(self, people, inds=None, mask=None):
+        if mask is not None:
+            mask = np.array(mask, dtype=bool) # Copy, since the criteria may be a state that is later changed
+            n = np.count_nonzero(mask)
+            if n <= self.dense*len(mask):
+                inds, mask = mask.nonzero()[0], None
+        else:
+            inds = np.asarray(inds, dtype=np.int64)
+            n = len(inds)
+        obj_set(self, 'people', people)
+        obj_set(self, '_inds', inds)
+        obj_set(self, '_mask', mask)
+        obj_set(self, '_len', n)
+        return
+
+
+    def __len__(self):
+        return self._len
+
+
+    def __repr__(self):
+        return f'<PeopleView: {self._len} of {len(self.people)} people>'
+
+
+    @property
+    def inds(self):
+        ''' Indices of the people in the view '''
+        if self._inds is None:
+            obj_set(self, '_inds', self._mask.nonzero()[0])
+        return self._inds
+
+
+    @property
+    def _index(self):
+        ''' The mask if there is one, since it is faster than indices for dense subsets '''
+        return self._mask if self._mask is not None else self._inds
+
+
+    def __getattr__(self, attr):
+        ''' Only called for attributes not defined by the view: gather states, bind People methods, otherwise defer to people '''
+        people = obj_get(self, 'people')
+        if attr in people._keys:
+            return people.__dict__[attr][self._index]
+        value = getattr(type(people), attr, None)
+        if hasattr(value, '__get__'): # Methods and properties operate on the view
+            return value.__get__(self)
+        return getattr(people, attr)
+
+
+    def __getitem__(self, key):
+        return getattr(self, key)
+
+
+    def keys(self):
+        return self.people.keys()
+
+
+    def __setattr__(self, attr, value):
+        errormsg = f'Cannot set "{attr}" on a view of people; use view.set({attr}=...) instead'
+        raise AttributeError(errormsg)
+
+
+    def set(self, **kwargs):
+        ''' Set the values of states for the people in the view, e.g. ``view.set(pregnant=False, gestation=0)`` '''
+        index = self._index
+        states = self.people.__dict__
+        for key,value in kwargs.items():
+            states[key][index] = value
+        return
+
+
+    def increment(self, **kwargs):
+        ''' Add to the values of states for the people in the view, e.g. ``view.increment(parity=1)`` '''
+        index = self._index
+        states = self.people.__dict__
+        for key,value in kwargs.items():
+            states[key][index] += value
+        return
+
+
+    def filter(self, criteria=None, inds=None):
+        '''
+        Select a subset of the people in the view.
+
+        Args:
+            criteria (array): a boolean array matching either the view (e.g. ``view.filter(view.age > 5)``) or all the people (e.g. ``view.filter(people.age > 5)``)
+            inds (array): alternatively, the indices of the people to select (into the full people arrays)
+
+        Returns:
+            A PeopleView
+        '''
+        if criteria is not None:
+            criteria = np.asarray(criteria, dtype=bool)
+            if len(criteria) == self._len:
+                inds = self.inds[criteria]
+            elif len(criteria) == len(self.people):
+                inds = self.inds[criteria[self.inds]]
+            else:
+                errormsg = f'"criteria" must be boolean array matching either current filter length ({self._len}) or else the total number of people ({len(self.people)}), not {len(criteria)}'
+                raise ValueError(errormsg)
+            return PeopleView(self.people, inds=inds)
+        elif inds is not None:
+            return PeopleView(self.people, inds=inds)
+        else:
+            return self
+
+
+    def contains(self, inds):
+        ''' Whether each of the people with these indices (into the full people arrays) is in the view '''
+        inds = np.asarray(inds, dtype=np.int64)
+        if self._mask is not None:
+            return self._mask[inds]
+        view_inds = self._inds
+        if not len(view_inds):
+            return np.zeros(len(inds), dtype=bool)
+        pos = np.minimum(np.searchsorted(view_inds, inds), len(view_inds)-1)
+        return view_inds[pos] == inds
+
+
+    def unfilter(self):
+        ''' Return the people the view was created from '''
+        return self.people
+
+
+class Results(sc.objdict):
+    '''
+    The results of a sim, with each channel by timestep or by year a view of a row
+    of a preallocated 2D array (see block())
+
+    Args:
+        npts (int): the number of timesteps
+        nyears (int): the number of years
+        keys (list): the channels by timestep
+        year_keys (list): the channels by year
+    '''
+
+    def __init__(self, npts=0, nyears=0, keys=None, year_keys=None):
+        super().__init__()
+        channels = {'timestep': list(sc.tolist(keys)), 'year': list(sc.tolist(year_keys))}
+        blocks = {'timestep': np.zeros((len(channels['timestep']), npts)), 'year': np.zeros((len(channels['year']), nyears))}
+        self.setattribute('_channels', channels)
+        self.setattribute('_blocks', blocks)
+        for key,row in self._views().items():
+            self[key] = row
+        return
+
+
+    def _views(self):
+        ''' The row of its block for each channel '''
+        return {key:row for kind,keys in self._channels.items() for key,row in zip(keys, self._blocks[kind])}
+
+
+    def block(self, kind='timestep'):
+        ''' The channels by timestep, or by year (kind='year'), as one 2D array (channel × time); see channels() for the order '''
+        return self._blocks[kind]
+
+
+    def channels(self, kind='timestep'):
+        ''' The names of the channels by timestep, or by year (kind='year'), in the order of the rows of the block '''
+        return self._channels[kind]
+
+
+    def __reduce__(self):
+        ''' Copy or pickle the blocks once, and recreate the channels as views of them; see _rebuild_results() '''
+        blocks = list(self._blocks.values())
+        shared = lambda v: isinstance(v, np.ndarray) and any(v.base is block for block in blocks)
+        items = [(key, None if shared(value) else value) for key,value in self.items()]
+        return (_rebuild_results, (self._channels, self._blocks, items))
+
+
+def _rebuild_results(channels, blocks, items):
+    ''' Recreate results from their blocks and other items, e.g. when copied; see Results.__reduce__() '''
+    results = Results()
+    results.setattribute('_channels', channels)
+    results.setattribute('_blocks', blocks)
+    views = results._views()
+    for key,value in items:
+        results[key] = views[key] if value is None else value
+    return results
+
+
 class BaseSim(ParsObj):
     '''
     The BaseSim class handles the dynamics of the simulation.
@@ -415,7 +1035,7 @@ class BaseSim(ParsObj):
 
     @property
     def n(self):
-        return self.people.alive.sum()
+        return self.people.n
 
 
     def _brief(self):
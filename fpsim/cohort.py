@@ -0,0 +1,476 @@
+'''
+Deterministic cohort-component model, used by the sim when pars['engine'] is 'cohort'.
+'''
+
+import numpy as np
+import sciris as sc
+from . import utils as fpu
+from . import defaults as fpd
+
+
+__all__ = ['Cohort']
+
+
+class Cohort(sc.prettyobj):
+    '''
+    Expected numbers of people, used in place of People when pars['engine'] is
+    'cohort'. Instead of drawing random outcomes for each agent, the expected
+    number of women in each combination of states is propagated through the
+    same steps as People.update(), using the same parameters, and the same step
+    results are returned. Results are therefore deterministic, and the run time
+    does not depend on the number of agents.
+
+    Non-pregnant women of reproductive age are stored by age (in years), parity
+    (with a final bin for women with primary infertility), postpartum month (0
+    if not postpartum), and method; pregnant women by age, parity, and month of
+    gestation; and women who have not reached their age of sexual debut by age,
+    fertility, and method. Older women and men are counted by age only. Each
+    timestep, the fraction timestep/12 of each age moves to the next year of age,
+    and gestation and postpartum durations advance by the timestep.
+
+    States that only matter through their averages are not stored: personal
+    fecundity is averaged over its range, and the probability of still
+    breastfeeding is computed from its distribution.
+
+    Limitations: ages are tracked in 1-year bins rather than months, so events
+    by age (e.g. method switching on birthdays) are spread evenly over each year;
+    and age-specific tracking (track_as), method switching tracking
+    (track_switching), random streams (rng='streams'), and sampled times of death
+    (mortality_sampling='times') are not supported, since they have no meaning
+    without individual agents.
+
+    Args:
+        pars (dict): the sim parameters
+    '''
+
+    def __init__(self, pars):
+        self.pars = pars
+        self.i = 0
+        self.t = 0
+        self.n_ages     = int(pars['age_limit_fecundity']) # Ages with reproductive states
+        self.n_parities = fpd.max_parity + 2 # Parities 0 to max_parity, plus primary infertility
+        self.n_pp       = int(pars['postpartum_dur']) + 2 # Not postpartum, then postpartum months 0 to postpartum_dur
+        self.n_methods  = len(pars['methods']['map'])
+        self.n_gest     = int(pars['preg_dur_high']) + int(pars['timestep']) # Gestation can pass the longest pregnancy by up to a timestep before delivery
+        self.parities   = np.append(np.arange(fpd.max_parity+1), 0)
+        self.fertile    = np.append(np.ones(fpd.max_parity+1), 0)
+
+        # Expected number of people in each state
+        n_all = int(pars['max_age']) + 1
+        self.nonpreg = np.zeros((self.n_ages, self.n_parities, self.n_pp, self.n_methods)) # Non-pregnant women by age, parity, postpartum month, method
+        self.preg    = np.zeros((self.n_ages, self.n_parities, self.n_gest)) # Pregnant women by age, parity, gestation
+        self.undebuted = np.zeros((self.n_ages, 2, self.n_methods)) # Women before sexual debut by age, fertility (fertile, infertile), method
+        self.older   = np.zeros(n_all) # Women past reproductive age, by age
+        self.men     = np.zeros(n_all) # Men, by age
+
+        # Initial population, as in Sim.get_age_sex()
+        pyramid  = pars['age_pyramid']
+        self.m_frac = pyramid[:,1].sum() / pyramid[:,1:3].sum()
+        age_min = pyramid[:,0].astype(int)
+        age_max = np.append(pyramid[1:,0], pars['max_age']).astype(int)
+        for i,sex_frac in enumerate([self.m_frac, 1-self.m_frac]):
+            counts = np.zeros(n_all)
+            probs  = pyramid[:,i+1] / pyramid[:,i+1].sum()
+            for low,high,prob in zip(age_min, age_max, probs):
+                counts[low:high] += prob/(high-low) # Uniformly distributed within each age bin
+            counts *= pars['n_agents']*sex_frac
+            if i == 0:
+                self.men += counts
+            else:
+                self.add_women(counts)
+
+        return
+
+
+    def add_women(self, counts):
+        ''' Add women by age who are not pregnant, not postpartum, on no method, and with no children '''
+        A = self.n_ages
+        infertile = self.pars['primary_infertility']
+        not_debuted, _ = self.debut_probs()
+        for i,frac in enumerate([1-infertile, infertile]):
+            self.undebuted[:,i,0] += counts[:A]*frac*not_debuted
+            self.nonpreg[:,[0,-1][i],0,0] += counts[:A]*frac*(1-not_debuted)
+        self.older[A:] += counts[A:len(self.older)]
+        return
+
+
+    def debut_probs(self):
+        ''' Probability of not having reached the age of sexual debut by each year of age, and of reaching it at each year of age if not before '''
+        debut = self.pars['debut_age']
+        ages  = np.arange(self.n_ages)
+        probs = debut['probs'] / debut['probs'].sum()
+        debut_now   = np.bincount(debut['ages'].astype(int), weights=probs, minlength=self.n_ages)[:self.n_ages]
+        not_debuted = 1 - np.cumsum(debut_now)
+        return not_debuted, sc.safedivide(debut_now, not_debuted + debut_now)
+
+
+    @property
+    def women(self):
+        ''' Expected number of women of reproductive age, by age '''
+        return np.einsum('apkm->a', self.nonpreg) + np.einsum('apg->a', self.preg) + np.einsum('afm->a', self.undebuted) # Faster than sum() over several axes
+
+
+    @property
+    def n(self):
+        ''' Expected number of people alive '''
+        return self.women.sum() + self.older.sum() + self.men.sum()
+
+
+    def __len__(self):
+        return int(round(self.n))
+
+
+    def method_usage(self):
+        ''' Proportion of women aged 15 to age_limit_fecundity on each method, as in Sim.compute_method_usage() '''
+        counts = np.einsum('apkm->m', self.nonpreg[15:]) + np.einsum('afm->m', self.undebuted[15:])
+        counts[0] += self.preg[15:].sum()
+        return list(counts/counts.sum())
+
+
+    def init_step_results(self):
+        ''' The step results from People.init_step_results() that are not age-specific '''
+        self.step_results = dict(
+            deaths          = 0,
+            births          = 0,
+            stillbirths     = 0,
+            total_births    = 0,
+            maternal_deaths = 0,
+            infant_deaths   = 0,
+            on_methods_mcpr = 0,
+            no_methods_mcpr = 0,
+            on_methods_cpr  = 0,
+            no_methods_cpr  = 0,
+            on_methods_acpr = 0,
+            no_methods_acpr = 0,
+            miscarriages    = 0,
+            abortions       = 0,
+            pp0to5          = 0,
+            pp6to11         = 0,
+            pp12to23        = 0,
+            total_women_fecund = 0,
+            pregnancies      = 0,
+            unintended_pregs = 0,
+            birth_bins     = {key:0 for key in fpd.age_bin_map.keys()},
+            age_bin_totals = {key:0 for key in fpd.age_bin_map.keys()},
+        )
+        return
+
+
+    def age_inds(self, age_map, min_age=0):
+        ''' Map each key of an age map, e.g. fpd.method_age_map, to a slice of the years of reproductive age it covers '''
+        return {key:slice(max(int(low), min_age), min(int(high), self.n_ages)) for key,(low,high) in age_map.items()}
+
+
+    def nearest(self, data_ages):
+        ''' Index of the nearest age in data_ages to the middle of each year of reproductive age, as sc.findnearest() for agents' ages '''
+        ages = np.arange(self.n_ages) + 0.5
+        return np.abs(np.subtract.outer(ages, data_ages)).argmin(axis=1)
+
+
+    def shift_parity(self, counts, n):
+        ''' Move women by age and parity up by n children, keeping the maximum parity in the last fertile bin '''
+        P = fpd.max_parity
+        shifted = np.zeros_like(counts)
+        shifted[:,n:P+1] = counts[:,:P+1-n]
+        shifted[:,P]    += counts[:,P+1-n:P+1].sum(axis=1)
+        return shifted
+
+
+    def check_mortality(self):
+        ''' Apply age-specific mortality to everyone over one year old '''
+        pars = self.pars
+        A = self.n_ages
+        surv = {}
+        for sex in ['f', 'm']:
+            surv[sex] = 1 - pars['mortality_probs'][f'{sex}_probs']
+            surv[sex][0] = 1 # No general mortality under one year of age
+        women = self.women
+        self.step_results['deaths'] += (women*(1-surv['f'][:A])).sum() + (self.older[A:]*(1-surv['f'][A:])).sum() + (self.men*(1-surv['m'])).sum()
+        self.nonpreg   *= surv['f'][:A,None,None,None]
+        self.preg      *= surv['f'][:A,None,None]
+        self.undebuted *= surv['f'][:A,None,None]
+        self.older     *= surv['f']
+        self.men       *= surv['m']
+        return
+
+
+    def check_delivery(self):
+        ''' Deliver women who reach the end of their pregnancy, and return the probability that a live birth is followed by breastfeeding '''
+        pars = self.pars
+        r = self.step_results
+
+        # Pregnancy durations are uniform, so the probability of delivering at each gestation is that of a duration reached in this timestep, out of those not reached before
+        gest = np.arange(self.n_gest)
+        low, high = pars['preg_dur_low'], pars['preg_dur_high']
+        reached = lambda g: np.clip((g - low + 1)/(high - low + 1), 0, 1) # Probability that the duration is at most g
+        deliv_probs = sc.safedivide(reached(gest) - reached(gest - pars['timestep']), 1 - reached(gest - pars['timestep']))
+        deliv = (self.preg * deliv_probs).sum(axis=2)
+        self.preg *= 1 - deliv_probs
+
+        # Stillbirths and live births
+        still_rate = pars['stillbirth_rate']
+        still_probs = pars['mortality_probs']['stillbirth'] * still_rate['age_probs'][self.nearest(still_rate['ages'])]
+        still = deliv * still_probs[:,None]
+        live  = deliv - still
+        r['stillbirths'] = still.sum()
+        r['births'] += live.sum() * (1 + pars['twins_prob'])
+        r['total_births'] = r['stillbirths'] + r['births']
+        live_ages = live.sum(axis=1)
+        for key,inds in self.age_inds(fpd.age_bin_map).items():
+            r['birth_bins'][key] += live_ages[inds].sum()
+
+        # Maternal and infant mortality
+        mat_prob = pars['mortality_probs']['maternal'] * pars['maternal_mortality_factor']
+        inf_mort = pars['infant_mortality']
+        inf_probs = pars['mortality_probs']['infant'] * inf_mort['age_probs'][self.nearest(inf_mort['ages'])]
+        r['maternal_deaths'] += live.sum() * mat_prob
+        r['deaths']          += live.sum() * mat_prob
+        r['infant_deaths']   += (live_ages * inf_probs).sum()
+
+        # Mothers start postpartum on no method, with one or two more children if born alive
+        live *= 1 - mat_prob
+        twins = pars['twins_prob']
+        self.nonpreg[:,:,1,0] += still + self.shift_parity(live*(1-twins), 1) + self.shift_parity(live*twins, 2)
+        breastfeeding = (1 - still_probs) * (1 - inf_probs) # Stillbirths and infant deaths stop breastfeeding
+        return breastfeeding
+
+
+    def update_pregnancy(self):
+        ''' Advance gestation, and return women by age and parity who miscarry at the end of the first trimester '''
+        pars = self.pars
+        ts = pars['timestep']
+        preg = np.zeros_like(self.preg)
+        preg[:,:,ts:]  = self.preg[:,:,:-ts]
+        preg[:,:,-1]  += self.preg[:,:,-ts:].sum(axis=2) # Should be empty after delivery
+        end_first_tri  = slice(pars['end_first_tri'], pars['end_first_tri'] + ts) # Gestations reaching the end of the first trimester in this timestep
+        miscarried     = preg[:,:,end_first_tri] * self.miscarriage_probs()[:,None,None]
+        preg[:,:,end_first_tri] -= miscarried
+        self.preg = preg
+        self.step_results['miscarriages'] = miscarried.sum()
+        return miscarried.sum(axis=2)
+
+
+    def miscarriage_probs(self):
+        ''' Probability of miscarriage at the end of the first trimester, by age '''
+        return self.pars['miscarriage_rates'][np.minimum(np.arange(self.n_ages), fpd.max_age_preg)]
+
+
+    def sexual_activity(self):
+        ''' Probability of being sexually active by age and postpartum state, as in People.check_sexually_active() '''
+        pars = self.pars
+        ages = np.arange(self.n_ages)
+        pref = pars['spacing_pref']
+        pp_durs = np.minimum(np.arange(self.n_pp-1) + pars['timestep']//2, pars['postpartum_dur']) # Duration in the middle of the timestep
+        spacing_bins = np.minimum(pp_durs / pref['interval'], pref['n_bins']).astype(int)
+        active = np.zeros((self.n_ages, self.n_pp))
+        active[:,0]  = pars['sexual_activity'][ages] # Women before sexual debut are stored separately, and not active
+        active[:,1:] = pars['sexual_activity_pp']['percent_active'][pp_durs] * pref['preference'][spacing_bins]
+        return np.minimum(active, 1) # Spacing preferences can increase probabilities above 1
+
+
+    def update_methods(self):
+        ''' Switch methods postpartum and on birthdays, as in People.update_methods() '''
+        pars = self.pars
+        if self.i % pars['method_timestep']:
+            return
+        methods = pars['methods']['adjusted']
+        ts = pars['timestep']
+        pp_switch = 1 + fpd.postpartum_map['pp0to5'][1] # Postpartum month 6, since index 0 is not postpartum
+        pp_switch = slice(pp_switch, min(pp_switch + ts, self.n_pp)) # The first timestep at or after it, as in People.update_method_pp()
+        birthday_frac = ts * pars['method_timestep'] / fpd.mpy # Fraction with a birthday since the last update
+        high_parity = (self.parities >= pars['high_parity'])[:,None]
+        changes = np.zeros((self.n_ages, self.n_methods, self.n_methods))
+        for key,ages in self.age_inds(fpd.method_age_map, min_age=int(pars['method_age'])).items():
+            counts = self.nonpreg[ages] # A view, so updated in place
+
+            # Initiation in the first month postpartum, from no method
+            choices = methods['pp0to1'][key]
+            choices_high_parity = choices.copy()
+            choices_high_parity[0] *= pars['high_parity_nonuse']
+            choices_high_parity /= choices_high_parity.sum()
+            choices = np.where(high_parity, choices_high_parity, choices/choices.sum())
+            counts[:,:,1,:] = counts[:,:,1,:].sum(axis=2)[:,:,None] * choices
+
+            # Switching at 6 months postpartum, and on birthdays for everyone else
+            counts[:,:,pp_switch,:] = counts[:,:,pp_switch,:] @ self.transitions(methods['pp1to6'][key])
+            changes[ages] = (self.transitions(methods['annual'][key]) - np.eye(self.n_methods)) * birthday_frac
+
+        birthdays = np.ones(self.n_pp, dtype=bool) # Not postpartum, or past postpartum switching
+        birthdays[1:pp_switch.stop] = False
+        fpu.switch_cohorts(self.nonpreg, changes, birthdays)
+        fpu.switch_cohorts(self.undebuted[:,:,None,:], changes, birthdays[:1])
+        return
+
+
+    def transitions(self, matrix):
+        ''' Normalize the rows of a switching matrix, leaving anyone on a method with no data on it '''
+        matrix = np.array(matrix, dtype=float)
+        totals = matrix.sum(axis=1)
+        empty  = totals == 0
+        matrix[empty] = np.eye(len(matrix))[empty]
+        return matrix / matrix.sum(axis=1)[:,None]
+
+
+    def end_postpartum(self):
+        ''' End postpartum at the maximum duration, and return the women who ended it '''
+        ended = self.nonpreg[:,:,-1,:].copy()
+        self.nonpreg[:,:,-1,:] = 0
+        return ended
+
+
+    def lam_probs(self, breastfeeding):
+        ''' Probability of LAM by age and postpartum state after this timestep, as in People.update_breastfeeding() and People.check_lam() '''
+        pars = self.pars
+        ts = pars['timestep']
+        pp_durs = np.arange(self.n_pp-1)
+        new_durs = pp_durs + ts
+
+        # Breastfeeding stops when its duration reaches that drawn from |Gumbel(mu, beta)| each month
+        mu, beta = pars['breastfeeding_dur_mu'], pars['breastfeeding_dur_beta']
+        gumbel_cdf = lambda x: np.exp(-np.exp(-(x - mu)/beta))
+        stop_probs = gumbel_cdf(pp_durs) - gumbel_cdf(-pp_durs)
+        step_bf = np.where(pp_durs % ts == 0, (1 - stop_probs)**ts, 1) # One draw per month, checked at the durations reached each timestep
+        still_bf = np.cumprod(step_bf)
+
+        lam = np.zeros((self.n_ages, self.n_pp))
+        candidates = new_durs <= pars['max_lam_dur']
+        rates = pars['lactational_amenorrhea']['rate'][new_durs[candidates]] * still_bf[candidates]
+        lam[:,1:][:,candidates] = breastfeeding[:,None] * rates
+        return lam
+
+
+    def conception_probs(self, active, lam):
+        '''
+        Probability of conception as in People.check_conception(), as the product
+        of a factor by age and parity and a probability by age, postpartum state,
+        and method.
+        '''
+        pars = self.pars
+        ts = pars['timestep']
+        ages = np.arange(self.n_ages)
+        clip = np.minimum(ages, fpd.max_age_preg)
+
+        # Average over the range of personal fecundity
+        n_quad = 8
+        fv = [pars['fecundity_var_low'], pars['fecundity_var_high']]
+        fecundity = fv[0] + (fv[1]-fv[0]) * (np.arange(n_quad) + 0.5)/n_quad
+        age_fecundity = pars['age_fecundity'][clip]
+        method_eff = np.array(list(pars['methods']['eff'].values()))
+        nonlam_probs = fpu.annprob2ts((1-method_eff)[None,:,None] * age_fecundity[:,None,None] * fecundity, ts).mean(axis=2)
+        lam_probs = fpu.annprob2ts((1-pars['LAM_efficacy']) * age_fecundity[:,None] * fecundity, ts).mean(axis=1)
+
+        # Adjustments for parity and exposure
+        factor = np.ones((self.n_ages, self.n_parities))
+        factor[:, self.parities == 0] *= pars['fecundity_ratio_nullip'][clip][:,None]
+        factor *= pars['exposure_factor'] * pars['exposure_age'][clip][:,None]
+        factor *= pars['exposure_parity'][np.minimum(self.parities, fpd.max_parity)] * self.fertile
+
+        probs = active[:,:,None] * (lam[:,:,None]*lam_probs[:,None,None] + (1-lam[:,:,None])*nonlam_probs[:,None,:])
+        return factor, probs
+
+
+    def track(self, users, active):
+        '''
+        Tabulate contraceptive prevalence, women by age bin, and fecund women, as
+        at the end of People.update(), from the numbers of non-pregnant women by
+        age and method, and the numbers of them sexually active
+        '''
+        pars = self.pars
+        r = self.step_results
+        women = users.sum(axis=1) + np.einsum('apg->a', self.preg)
+        for key,ages in self.age_inds(fpd.age_bin_map).items():
+            r['age_bin_totals'][key] += women[ages].sum()
+
+        ages = slice(int(pars['method_age']), None)
+        users  = users[ages].sum(axis=0)
+        active = active[ages].sum(axis=0)
+        users[0] += self.preg[ages].sum()
+        modern = sc.findinds(list(pars['methods']['modern'].values())) # As in People.track_prevalence()
+        r['on_methods_mcpr'] += users[modern].sum()
+        r['no_methods_mcpr'] += users[0]
+        r['on_methods_cpr']  += users[1:].sum()
+        r['no_methods_cpr']  += users[0]
+        r['on_methods_acpr'] += active[1:].sum()
+        r['no_methods_acpr'] += active[0]
+        r['total_women_fecund'] = women[15:].sum()
+        return
+
+
+    def update_age(self):
+        ''' Move the fraction timestep/12 of each year of age to the next, with reproductive states for women under age_limit_fecundity '''
+        f = self.pars['timestep'] / fpd.mpy
+        A = self.n_ages
+        to_older = 0
+        for counts in [self.nonpreg, self.preg, self.undebuted]:
+            to_older += fpu.age_cohorts(counts.reshape(A, -1), f).sum()
+
+        # Women reaching their age of sexual debut
+        _, debut_now = self.debut_probs()
+        debuted = self.undebuted[1:] * f * debut_now[1:,None,None]
+        self.undebuted[1:]      -= debuted
+        self.nonpreg[1:,0,0,:]  += debuted[:,0,:]
+        self.nonpreg[1:,-1,0,:] += debuted[:,1,:]
+
+        # Everyone at the maximum age stays there
+        for counts in [self.older, self.men]:
+            aged_out = fpu.age_cohorts(counts[:,None], f)[0] # Not added in place, since the last age also receives the next youngest
+            counts[-1] += aged_out
+        self.older[A] += to_older
+        return
+
+
+    def update(self):
+        ''' Update everyone for one timestep, following People.update(), and return the step results '''
+        self.init_step_results()
+        pars = self.pars
+        r = self.step_results
+
+        # Mortality and delivery
+        self.check_mortality()
+        breastfeeding = self.check_delivery()
+        miscarried = self.update_pregnancy() # Miscarriages happen after the non-pregnant are selected
+
+        # Sexual activity and method switching, by the postpartum month at the start of the step
+        active = self.sexual_activity()
+        self.update_methods()
+        ended  = self.end_postpartum()
+        lam    = self.lam_probs(breastfeeding)
+
+        # Conception, advancing postpartum months for those who do not conceive
+        factor, probs = self.conception_probs(active, lam)
+        conceived, active_counts, users, by_pp = fpu.conceive_cohorts(self.nonpreg, factor, probs, active, pars['timestep'])
+        for key,(pp_low, pp_high) in fpd.postpartum_map.items():
+            r[key] += by_pp[1+pp_low:1+pp_high].sum()
+
+        # Women whose postpartum period has just ended can also conceive
+        active_counts  += ended.sum(axis=1) * active[:,-1,None]
+        ended_conceived = ended * factor[:,:,None] * probs[:,None,-1,:]
+        ended     -= ended_conceived
+        conceived += ended_conceived
+
+        # Abortions and pregnancies; those who ended postpartum, aborted, or miscarried are not postpartum
+        aborted = conceived * pars['abortion_prob']
+        r['pregnancies']      += conceived.sum()
+        r['unintended_pregs'] += conceived[:,:,1:].sum()
+        r['abortions'] = aborted.sum()
+        pregnant = (conceived - aborted).sum(axis=2) # Pregnant women are on no method
+        if pars['timestep'] >= pars['end_first_tri']: # The first trimester ends in this timestep, as in People.check_conception()
+            conceived_miscarried = pregnant * self.miscarriage_probs()[:,None]
+            pregnant   -= conceived_miscarried
+            miscarried += conceived_miscarried
+            r['miscarriages'] += conceived_miscarried.sum()
+        self.preg[:,:,pars['timestep']] += pregnant
+        self.nonpreg[:,:,0]   += ended + aborted
+        self.nonpreg[:,:,0,0] += miscarried
+        users += (ended + aborted).sum(axis=1)
+        users[:,0] += miscarried.sum(axis=1)
+        active_counts += (aborted - conceived).sum(axis=1)
+        active_counts[:,0] += miscarried.sum(axis=1) # Sexual activity is not updated while pregnant
+
+        # Results, then age and add births
+        self.track(users + self.undebuted.sum(axis=1), active_counts)
+        self.update_age()
+        new_people = r['births'] - r['infant_deaths'] # Do not add children who died before age 1 to the population
+        self.men[0] += new_people * self.m_frac
+        self.add_women(np.append(new_people * (1-self.m_frac), np.zeros(len(self.older)-1)))
+        return r
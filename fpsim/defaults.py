@@ -13,36 +13,84 @@ max_age        = 99   # Maximum age
 max_age_preg   = 50   # Maximum age to become pregnant
 max_parity     = 20   # Maximum number of children
 
-#%% Defaults when creating a new person
-person_defaults = dict(
-    uid                  = -1,
-    age                  = 0,
-    age_by_group         = 0,
-    sex                  = 0,
-    parity               = 0,
-    method               = 0,
-    barrier              = 0,
-    postpartum_dur       = 0,
-    gestation            = 0,
-    preg_dur             = 0,
-    stillbirth           = 0,
-    miscarriage          = 0,
-    abortion             = 0,
-    pregnancies          = 0,
-    remainder_months     = 0,
-    breastfeed_dur       = 0,
-    breastfeed_dur_total = 0,
-    alive                = True,
-    pregnant             = False,
-    sexually_active      = False,
-    sexual_debut         = False,
-    sexual_debut_age     = -1,
-    first_birth_age      = -1,
-    lactating            = False,
-    postpartum           = False,
-    lam                  = False,
-    mothers              = -1,
-)
+#%% States of each person
+
+class State:
+    '''
+    The definition of a state of each person; see fp.People. People are allocated,
+    grown, compacted, copied, and exported from the registry of these states,
+    ``person_states``, so adding a state only requires adding it there.
+
+    Args:
+        name    (str):  the name of the state, e.g. 'age'
+        dtype   (type): the data type in the default 'compact' mode, chosen to hold the full range of the state; see the 'dtypes' parameter
+        default (any):  the value for new people, unless supplied; None if it must be supplied
+        ragged  (bool): whether the state is a history of events (see fpsim.base.Ragged) rather than one value per person
+        export  (bool): whether the state is exported, e.g. by People.export() and the verbose_sim analyzer
+        label   (str):  a description of the state
+    '''
+
+    __slots__ = ('name', 'dtype', 'default', 'ragged', 'export', 'label')
+
+    def __init__(self, name, dtype, default=0, ragged=False, export=True, label=None):
+        self.name    = name
+        self.dtype   = dtype
+        self.default = default
+        self.ragged  = ragged
+        self.export  = export
+        self.label   = label
+        return
+
+    def __repr__(self):
+        return f'State({self.name}, {np.dtype(self.dtype).name}, default={self.default}, ragged={self.ragged}, export={self.export})'
+
+
+person_states = {state.name:state for state in [
+    State('uid',                  np.int64,   -1,    label='Unique identifier; see People.uid2ind()'),
+    State('age',                  np.float64, 0,     label='Age of the person (in years)'),
+    State('age_by_group',         np.int8,    0,     label='Age by which method bin the age falls into, as integer'),
+    State('sex',                  np.int8,    0,     label='Female (0) or male (1)'),
+    State('parity',               np.int8,    0,     label='Number of children'),
+    State('method',               np.int8,    0,     label="Contraceptive method 0-9, see pars['methods']['map'], excludes LAM as method"),
+    State('barrier',              np.int8,    0,     label='Reason for non-use'),
+    State('alive',                bool,       True),
+    State('pregnant',             bool,       False),
+    State('fertile',              bool,       None,  export=False, label='Assigned likelihood of remaining childfree throughout reproductive years'),
+    State('sexually_active',      bool,       False),
+    State('sexual_debut',         bool,       False),
+    State('sexual_debut_age',     np.float64, -1,    label='Age at first sexual debut in years, If not debuted, -1'),
+    State('fated_debut',          np.float64, None,  export=False, label='Age at which sexual debut will happen; supplied as debut_age'),
+    State('first_birth_age',      np.float64, -1,    label='Age at first birth.  If no births, -1'),
+    State('lactating',            bool,       False),
+    State('gestation',            np.int8,    0),
+    State('preg_dur',             np.int8,    0),
+    State('stillbirth',           np.int8,    0,     label='Number of stillbirths'),
+    State('miscarriage',          np.int8,    0,     label='Number of miscarriages'),
+    State('abortion',             np.int8,    0,     label='Number of abortions'),
+    State('pregnancies',          np.int8,    0,     label='Number of conceptions (before abortion)'),
+    State('postpartum',           bool,       False),
+    State('mothers',              np.int64,   -1,    label='UID of mother, if tracked'),
+    State('weight',               np.float64, 1.0,   label="Number of people the agent represents; see pars['sampling_rates']"),
+    State('postpartum_dur',       np.int16,   0,     label='Tracks # months postpartum'),
+    State('lam',                  bool,       False, label='Separately tracks lactational amenorrhea, can be using both LAM and another method'),
+    State('breastfeed_dur',       np.int16,   0),
+    State('breastfeed_dur_total', np.int16,   0),
+    State('children',             np.int64,   ragged=True, export=False, label="UIDs of children (-1 for sons if pars['aggregate_men'])"),
+    State('dobs',                 np.float64, ragged=True, label='Ages at live births'),
+    State('still_dates',          np.float64, ragged=True, export=False, label='Ages at stillbirths'),
+    State('miscarriage_dates',    np.float64, ragged=True, export=False, label='Ages at miscarriages'),
+    State('abortion_dates',       np.float64, ragged=True, export=False, label='Ages at abortions'),
+    State('personal_fecundity',   np.float64, None,  export=False, label="Stretch fecundity by a factor bounded by pars['fecundity_var_low'] and pars['fecundity_var_high']; drawn at random unless supplied"),
+    State('remainder_months',     np.int8,    0),
+]}
+
+# Defaults and data types by state, derived from the registry above. In 'reference'
+# mode all states use 64-bit types, and in 'compact32' mode the float states
+# (ages) are also stored as float32; see fp.People and the 'dtypes' parameter.
+person_defaults = {key:state.default for key,state in person_states.items() if not state.ragged}
+person_dtypes   = {key:state.dtype for key,state in person_states.items()}
+
+dtype_modes = ['reference', 'compact', 'compact32']
 
 # Postpartum keys to months
 postpartum_map = {
@@ -103,4 +151,10 @@ method_youth_age_map = {
     '>25': [26, max_age+1]
 }
 
-age_specific_channel_bins = method_youth_age_map
\ No newline at end of file
+age_specific_channel_bins = method_youth_age_map
+
+# Rows of the age-specific counts accumulated each timestep when tracking by age (track_as); the
+# age-specific contraceptive prevalence is the ratio of each method channel to its "_women" row,
+# and the age-specific IMR and MMR are the ratios of the deaths to the births over the last year
+age_specific_counts = ['acpr', 'cpr', 'mcpr', 'acpr_women', 'cpr_women', 'mcpr_women', 'pregnancies', 'births',
+                       'stillbirths', 'infant_deaths', 'maternal_deaths']
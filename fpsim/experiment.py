@@ -11,6 +11,7 @@ import sciris as sc
 from .settings import options as fpo
 from . import defaults as fpd
 from . import parameters as fpp
+from . import utils as fpu
 from . import sim as fps
 
 
@@ -147,10 +148,15 @@ class Experiment(sc.prettyobj):
         self.people = self.sim.people  # Extract people objects from sim
         self.model_results = self.sim.results  # Stores dictionary of results
 
-        # Store dataframe of agent's age, pregnancy status, and parity
-        model_pregnancy_parity = self.sim.store_postpartum()
-        model_pregnancy_parity = model_pregnancy_parity.drop(['PP0to5', 'PP6to11', 'PP12to23', 'NonPP'], axis=1)
-        self.model['pregnancy_parity'] = model_pregnancy_parity
+        # The cohort engine has no agents, so skip the analyses that need them
+        if self.sim['engine'] == 'cohort':
+            for key in ['skyscrapers', 'birth_space', 'methods', 'age_pregnancy']:
+                self.flags[key] = 0
+        else:
+            # Store dataframe of agent's age, pregnancy status, and parity
+            model_pregnancy_parity = self.sim.store_postpartum()
+            model_pregnancy_parity = model_pregnancy_parity.drop(['PP0to5', 'PP6to11', 'PP12to23', 'NonPP'], axis=1)
+            self.model['pregnancy_parity'] = model_pregnancy_parity
         self.method_keys = list(self.sim['methods']['map'].keys())
         return
 
@@ -200,8 +206,9 @@ class Experiment(sc.prettyobj):
         Calculate maternal mortality in model over most recent 3 years
         '''
 
-        maternal_deaths = np.sum(self.model_results['maternal_deaths'][-mpy * 3:])
-        births_last_3_years = np.sum(self.model_results['births'][-mpy * 3:])
+        spy = mpy // self.sim['timestep'] # Timesteps per year
+        maternal_deaths = np.sum(self.model_results['maternal_deaths'][-spy * 3:])
+        births_last_3_years = np.sum(self.model_results['births'][-spy * 3:])
         self.model['maternal_mortality_ratio'] = (maternal_deaths / births_last_3_years) * 100000
 
         return
@@ -209,23 +216,26 @@ class Experiment(sc.prettyobj):
 
     def model_infant_mortality_rate(self):
 
-        infant_deaths = np.sum(self.model_results['infant_deaths'][-mpy:])
-        births_last_year = np.sum(self.model_results['births'][-mpy:])
+        spy = mpy // self.sim['timestep']
+        infant_deaths = np.sum(self.model_results['infant_deaths'][-spy:])
+        births_last_year = np.sum(self.model_results['births'][-spy:])
         self.model['infant_mortality_rate'] = (infant_deaths / births_last_year) * 1000
 
         return
 
 
     def model_crude_death_rate(self):
-        total_deaths = np.sum(self.model_results['deaths'][-mpy:]) + \
-                       np.sum(self.model_results['infant_deaths'][-mpy:]) + \
-                       np.sum(self.model_results['maternal_deaths'][-mpy:])
+        spy = mpy // self.sim['timestep']
+        total_deaths = np.sum(self.model_results['deaths'][-spy:]) + \
+                       np.sum(self.model_results['infant_deaths'][-spy:]) + \
+                       np.sum(self.model_results['maternal_deaths'][-spy:])
         self.model['crude_death_rate'] = (total_deaths / self.model_results['pop_size'][-1]) * 1000
         return
 
 
     def model_crude_birth_rate(self):
-        births_last_year = np.sum(self.model_results['births'][-mpy:])
+        spy = mpy // self.sim['timestep']
+        births_last_year = np.sum(self.model_results['births'][-spy:])
         self.model['crude_birth_rate'] = (births_last_year / self.model_results['pop_size'][-1]) * 1000
         return
 
@@ -299,7 +309,7 @@ class Experiment(sc.prettyobj):
             if ppl.alive[i] and not ppl.sex[i] and ppl.age[i] >= min_age and ppl.age[i] < max_age:
                 age_bin = sc.findinds(age_bins <= ppl.age[i])[-1]
                 parity_bin = sc.findinds(parity_bins <= ppl.parity[i])[-1]
-                sky_arr['Model'][age_bin, parity_bin] += 1
+                sky_arr['Model'][age_bin, parity_bin] += ppl.weight[i]
 
         # Normalize
         for key in ['Data', 'Model']:
@@ -345,31 +355,23 @@ class Experiment(sc.prettyobj):
         self.data['age_first_stats'] = data_age_first_stats
 
         # From model
-        model_age_first = []
-        model_spacing = []
         model_spacing_counts = sc.odict().make(keys=spacing_bins.keys(), vals=0.0)
         ppl = self.people
-        for i in  range(len(ppl)):
-            if ppl.alive[i] and not ppl.sex[i] and ppl.age[i] >= min_age and ppl.age[i] < max_age:
-                if len(ppl.dobs[i]):
-                    model_age_first.append(ppl.dobs[i][0])
-                if len(ppl.dobs[i]) > 1:
-                    for d in range(len(ppl.dobs[i]) - 1):
-                        space = ppl.dobs[i][d + 1] - ppl.dobs[i][d]
-                        ind = sc.findinds(space > spacing_bins[:])[-1]
-                        model_spacing_counts[ind] += 1
-
-                        model_spacing.append(space)
+        women = ppl.alive * (ppl.sex == 0) * (ppl.age >= min_age) * (ppl.age < max_age)
+        dobs = ppl.dobs[women]
+        weights = ppl.weight[women]
+        model_age_first = dobs.first()[dobs.counts > 0]
+        first_weights = weights[dobs.counts > 0]
+        model_spacing = dobs.diff()
+        spacing_weights = np.repeat(weights, np.maximum(dobs.counts - 1, 0)) # One spacing per birth after the first, in order by woman
+        bin_inds = np.searchsorted(spacing_bins[:], model_spacing, side='left') - 1 # Index of the last bin that the spacing exceeds
+        model_spacing_counts[:] += np.bincount(bin_inds, weights=spacing_weights, minlength=len(spacing_bins))
 
         model_spacing_counts[:] /= model_spacing_counts[:].sum()
         model_spacing_counts[:] *= 100
         try:
-            model_spacing_stats = np.array([np.percentile(model_spacing, 25),
-                                            np.percentile(model_spacing, 50),
-                                            np.percentile(model_spacing, 75)])
-            model_age_first_stats = np.array([np.percentile(model_age_first, 25),
-                                            np.percentile(model_age_first, 50),
-                                            np.percentile(model_age_first, 75)])
+            model_spacing_stats = fpu.weighted_percentile(model_spacing, [25, 50, 75], spacing_weights)
+            model_age_first_stats = fpu.weighted_percentile(model_age_first, [25, 50, 75], first_weights)
         except Exception as E: # pragma: nocover
             print(f'Could not calculate birth spacing, returning zeros: {E}')
             model_spacing_counts = {k:0 for k in spacing_bins.keys()}
@@ -419,7 +421,7 @@ class Experiment(sc.prettyobj):
         ppl = self.people
         for i in range(len(ppl)):
             if ppl.alive[i] and not ppl.sex[i] and ppl.age[i] >= min_age and ppl.age[i] < max_age:
-                model_method_counts[ppl.method[i]] += 1
+                model_method_counts[ppl.method[i]] += ppl.weight[i]
         model_method_counts[:] /= model_method_counts[:].sum()
 
         # Make labels
@@ -456,9 +458,7 @@ class Experiment(sc.prettyobj):
 
         model = self.model['pregnancy_parity']  # Copy DataFrame for manipulation
         pregnant = model[model['Pregnant'] == 1]
-        stats = pregnant['Age'].describe()
-        model_stats_all = stats.to_numpy()
-        model_stats = np.delete(model_stats_all, index)
+        model_stats = fpu.weighted_percentile(pregnant['Age'], [25, 50, 75], pregnant['Weight'].to_numpy()) # As in describe(), weighted by the sampling weights
 
         self.model['age_pregnant_stats'] = model_stats
 
@@ -470,11 +470,8 @@ class Experiment(sc.prettyobj):
 
         self.data['age_parity_stats'] = parity_data_stats
 
-        parity_model = model.groupby('Parity')['Age'].describe()
-        parity_model = parity_model.head(11)
-        parity_model = parity_model.drop(['count', 'mean', 'std', 'min', 'max'], axis = 1)
-        parity_model.fillna(0)
-        parity_model_stats = parity_model.to_numpy()
+        parity_model = [fpu.weighted_percentile(group['Age'], [25, 50, 75], group['Weight'].to_numpy()) for _,group in model.groupby('Parity')]
+        parity_model_stats = np.array(parity_model[:11])
 
         self.model['age_parity_stats'] = parity_model_stats
 
@@ -505,8 +502,8 @@ class Experiment(sc.prettyobj):
             del self.people
 
         # Remove raw dataframes of pregnancy / parity data from dictionary
-        del self.data['pregnancy_parity']
-        del self.model['pregnancy_parity']
+        self.data.pop('pregnancy_parity', None)
+        self.model.pop('pregnancy_parity', None)
 
         # Compute comparison
         self.df = self.compare()
@@ -278,7 +278,8 @@ class change_par(Intervention):
                 val = self.vals[self.counter]
                 if val == 'reset':
                     val = self.orig_val
-                sim[self.par] = val # Update the parameter value -- that's it!
+                sim[self.par] = val # Update the parameter value
+                sim.init_timelines() # Recompile the parameters by timestep, in case they depend on it
                 if self.verbose:
                     label = f'Sim "{sim.label}": ' if sim.label else ''
                     print(f'{label}On {sim.y}, change {self.counter+1}/{len(self.inds)} applied: "{self.par}" from {curr_val} to {sim[self.par]}')
@@ -17,12 +17,19 @@ def scalar_pars():
         'scaled_pop'             : None, # Scaled population / total population size
         'start_year'             : 1960, # Start year of simulation
         'end_year'               : 2020, # End year of simulation
-        'timestep'               : 1, # The simulation timestep in months
+        'timestep'               : 1, # The simulation timestep in months (1, 2, 3, 4, 6, or 12)
         'method_timestep'        : 1, # How many simulation timesteps to go for every method update step
         'seed'                   : 1, # Random seed
         'verbose'                : 1, # How much detail to print during the simulation
         'track_switching'        : 0, # Whether to track method switching
         'track_as'               : 0, # Whether to track age-specific channels
+        'compact_dead'           : 0, # How often (in timesteps) to remove dead agents from People; 0 to keep them
+        'dtypes'                 : 'compact', # Data types of the People states: 'compact', 'compact32' (ages as float32), or 'reference' (64-bit)
+        'engine'                 : 'numpy', # How to update people: 'numpy'; 'numba' for a single compiled pass (statistically equivalent, not identical, results); or 'cohort' for expected numbers of people (deterministic)
+        'rng'                    : 'global', # Random numbers for the numpy engine: 'global' (NumPy's random state) or 'streams' (a counter-based stream for each person and kind of draw, so that sims with the same seed share common random numbers; see fpsim.utils.stream_random())
+        'mortality_sampling'     : 'trials', # How to decide general mortality in the numpy engine: 'trials' for a trial for each person each timestep, or 'times' to sample each person's time of death once (statistically equivalent); see People.schedule_deaths()
+        'aggregate_men'          : False, # Whether to count men by age rather than create them as agents, since only women's fertility is modeled
+        'sampling_rates'         : None, # Relative rates of sampling agents by age bin of the age pyramid (rows) and sex (columns: male, female), e.g. [0.25, 1] to sample women four times as often as men; results are then sums of the agents' weights. None to sample everyone equally
 
         # Age limits (in years)
         'method_age'             : 15,
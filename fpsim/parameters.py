@@ -335,6 +335,7 @@ class Pars(dict):
                 if verbose:
                     print(f'Matrix {matrix} for age group {k} was changed from:\n{orig}\nto\n{arr[source, dest]}')
 
+        self.reset_method_cache()
         return self
 
 
@@ -392,6 +393,7 @@ class Pars(dict):
 
         # Validate
         self.validate()
+        self.reset_method_cache()
 
         return self
 
@@ -441,6 +443,7 @@ class Pars(dict):
 
         # Validate
         self.validate()
+        self.reset_method_cache()
 
         return self
 
@@ -498,10 +501,77 @@ class Pars(dict):
 
         # Validate
         self.validate()
+        self.reset_method_cache()
 
         return self
 
 
+    def reset_method_cache(self):
+        '''
+        Clear the cache of adjusted switching matrices (see ``method_matrices()``).
+        This is done automatically by the methods that modify the matrices; call
+        it if ``pars['methods']['raw']`` is modified directly during a run.
+        '''
+        self._method_cache = {}
+        return self
+
+
+    def method_matrices(self, trend):
+        '''
+        Get the switching matrices adjusted for the trend in mCPR, along with the
+        cumulative probability tables used to sample new methods. These are cached
+        by trend value, since the trend only changes with the nearest year of data.
+
+        Args:
+            trend (float): the mCPR trend, normalized to 1 in the normalization year
+
+        Returns:
+            An objdict of the adjusted matrices (``adjusted``), the cumulative annual
+            switching probabilities, stacked by age group (``annual``), and the
+            postpartum table (``pp``): the initiation probabilities for each age group
+            for low and then high parity, followed by the 6-month switching matrices
+        '''
+        cache = getattr(self, '_method_cache', None)
+        if cache is None:
+            cache = self.reset_method_cache()._method_cache
+        key = (trend, self['high_parity_nonuse'])
+        if key in cache:
+            return cache[key]
+
+        adjusted = sc.dcp(self['methods']['raw'])
+
+        # Update annual (non-postpartum) population and postpartum switching matrices for current year mCPR - stratified by age
+        for switchkey in ['annual', 'pp1to6']:
+            for matrix in adjusted[switchkey].values():
+                matrix[0, 0] /= trend  # Takes into account mCPR during year of sim
+                for i in range(len(matrix)):
+                    denom = matrix[i,:].sum()
+                    if denom > 0:
+                        matrix[i,:] = matrix[i, :] / denom  # Normalize so probabilities add to 1
+
+        # Update postpartum initiation matrices for current year mCPR - stratified by age
+        for matrix in adjusted['pp0to1'].values():
+            matrix[0] /= trend  # Takes into account mCPR during year of sim
+            matrix /= matrix.sum()
+
+        # Stack the matrices by age group, and adjust non-use for high parity
+        keys   = list(fpd.method_age_map.keys())
+        annual = np.array([adjusted['annual'][k] for k in keys])
+        pp0to1 = np.array([adjusted['pp0to1'][k] for k in keys])
+        pp0to1_high_parity = pp0to1.copy()
+        pp0to1_high_parity[:,0] *= self['high_parity_nonuse']
+        pp1to6 = np.array([adjusted['pp1to6'][k] for k in keys])
+        pp = np.concatenate([pp0to1, pp0to1_high_parity, pp1to6.reshape(-1, pp1to6.shape[-1])])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            annual = np.cumsum(annual/annual.sum(axis=2, keepdims=True), axis=2)
+            pp     = np.cumsum(pp/pp.sum(axis=1, keepdims=True), axis=1)
+
+        if len(cache) >= 100: # The trend changes every timestep when extrapolating, so limit the size
+            cache.clear()
+        cache[key] = sc.objdict(adjusted=adjusted, annual=annual, pp=pp)
+        return cache[key]
+
+
 #%% Parameter creation functions
 
 def sim_pars():
@@ -8,11 +8,13 @@ import pylab as pl
 import seaborn as sns
 import sciris as sc
 import pandas as pd
+import scipy.sparse as sps
 from .settings import options as fpo
 from . import utils as fpu
 from . import defaults as fpd
 from . import base as fpb
 from . import parameters as fpp
+from . import cohort as fpc
 
 
 # Specify all externally visible things this file defines
@@ -20,128 +22,145 @@ __all__ = ['People', 'Sim', 'MultiSim', 'parallel']
 
 
 #%% Define classes
-def arr(n=None, val=0):
+def arr(n=None, val=0, dtype=None):
     ''' Shortcut for defining an empty array with the correct value and data type '''
     if isinstance(val, np.ndarray):
         assert len(val) == n
-        arr = val
+        arr = val if dtype is None else val.astype(dtype, copy=False)
     elif isinstance(val, list):
         arr = [[] for _ in range(n)]
     else:
-        dtype = object if isinstance(val, str) else None
+        if dtype is None:
+            dtype = object if isinstance(val, str) else None
         arr = np.full(shape=n, fill_value=val, dtype=dtype)
     return arr
 
 
+def get_dtypes(mode='compact'):
+    '''
+    Get the data types of the People states.
+
+    Args:
+        mode (str): 'compact' (default) to use the smallest integer types that hold each state;
+            'compact32' to also store ages as float32; or 'reference' to use int64 and float64
+            throughout, e.g. to validate the other modes
+
+    Returns:
+        A dict of data types by state
+    '''
+    if mode not in fpd.dtype_modes:
+        errormsg = f'Data type mode "{mode}" not recognized; choices are: {sc.strjoin(fpd.dtype_modes)}'
+        raise ValueError(errormsg)
+    dtypes = sc.dcp(fpd.person_dtypes)
+    for key,dtype in dtypes.items():
+        if mode == 'reference' and dtype is not bool:
+            dtypes[key] = np.float64 if np.issubdtype(dtype, np.floating) else np.int64
+        elif mode == 'compact32' and np.issubdtype(dtype, np.floating):
+            dtypes[key] = np.float32
+    return dtypes
+
+
 class People(fpb.BasePeople):
     '''
     Class for all the people in the simulation.
     '''
-    def __init__(self, pars, n=None, **kwargs):
+    def __init__(self, pars, n=None, i=0, **kwargs):
 
         # Initialization
         super().__init__()
         self.pars = pars # Set parameters
-        d = sc.mergedicts(fpd.person_defaults, kwargs) # d = defaults
         if n is None:
             n = int(self.pars['n_agents'])
-
-        # Basic states
-        init_states = dir(self)
-        self.uid            = arr(n, np.arange(n))
-        self.age            = arr(n, np.float64(d['age'])) # Age of the person (in years)
-        self.age_by_group   = arr(n, np.float64(d['age_by_group'])) # Age by which method bin the age falls into, as integer
-        self.sex            = arr(n, d['sex']) # Female (0) or male (1)
-        self.parity         = arr(n, d['parity']) # Number of children
-        self.method         = arr(n, d['method'])  # Contraceptive method 0-9, see pars['methods']['map'], excludes LAM as method
-        self.barrier        = arr(n, d['barrier'])  # Reason for non-use
-        self.alive          = arr(n, d['alive'])
-        self.pregnant       = arr(n, d['pregnant'])
-        self.fertile        = arr(n, d['fertile'])  # assigned likelihood of remaining childfree throughout reproductive years
-
-        # Sexual and reproductive history
-        self.sexually_active  = arr(n, d['sexually_active'])
-        self.sexual_debut     = arr(n, d['sexual_debut'])
-        self.sexual_debut_age = arr(n, np.float64(d['sexual_debut_age'])) # Age at first sexual debut in years, If not debuted, -1
-        self.fated_debut      = arr(n, np.float64(d['debut_age']))
-        self.first_birth_age  = arr(n, np.float64(d['first_birth_age'])) # Age at first birth.  If no births, -1
-        self.lactating        = arr(n, d['lactating'])
-        self.gestation        = arr(n, d['gestation'])
-        self.preg_dur         = arr(n, d['preg_dur'])
-        self.stillbirth       = arr(n, d['stillbirth']) # Number of stillbirths
-        self.miscarriage      = arr(n, d['miscarriage']) # Number of miscarriages
-        self.abortion         = arr(n, d['abortion']) # Number of abortions
-        self.pregnancies      = arr(n, d['pregnancies']) #Number of conceptions (before abortion)
-        self.postpartum       = arr(n, d['postpartum'])
-        self.mothers          = arr(n, d['mothers'])
-
-        self.postpartum_dur       = arr(n, d['postpartum_dur']) # Tracks # months postpartum
-        self.lam                  = arr(n, d['lam']) # Separately tracks lactational amenorrhea, can be using both LAM and another method
-        self.breastfeed_dur       = arr(n, d['breastfeed_dur'])
-        self.breastfeed_dur_total = arr(n, d['breastfeed_dur_total'])
-
-        self.children          = arr(n, []) # Indices of children -- list of lists
-        self.dobs              = arr(n, []) # Dates of births -- list of lists
-        self.still_dates       = arr(n, []) # Dates of stillbirths -- list of lists
-        self.miscarriage_dates = arr(n, []) # Dates of miscarriages -- list of lists
-        self.abortion_dates    = arr(n, []) # Dates of abortions -- list of lists
-
-        # Fecundity variation
-        fv = [self.pars['fecundity_var_low'], self.pars['fecundity_var_high']]
-        self.personal_fecundity = arr(n, np.random.random(n)*(fv[1]-fv[0])+fv[0]) # Stretch fecundity by a factor bounded by [f_var[0], f_var[1]]
-        self.remainder_months = arr(n, d['remainder_months'])
-
-        # Store keys
-        final_states = dir(self)
-        self._keys = [s for s in final_states if s not in init_states]
+        if 'debut_age' in kwargs:
+            kwargs['fated_debut'] = kwargs.pop('debut_age')
+        if 'personal_fecundity' not in kwargs:
+            fv = [self.pars['fecundity_var_low'], self.pars['fecundity_var_high']]
+            kwargs['personal_fecundity'] = np.random.random(n)*(fv[1]-fv[0])+fv[0]
+
+        # States, allocated from the registry in fpd.person_states
+        dt = get_dtypes(self.pars['dtypes']) # dt = data types
+        for key,state in fpd.person_states.items():
+            if state.ragged:
+                value = fpb.Ragged(n, dtype=dt[key])
+            else:
+                value = kwargs.get(key, state.default)
+                if value is None:
+                    errormsg = f'People state "{key}" has no default value, so must be supplied'
+                    raise ValueError(errormsg)
+                value = arr(n, value, dt[key])
+            setattr(self, key, value)
+        self.uid[:] = np.arange(n)
+        self._next_uid = n
+        self._keys = list(fpd.person_states.keys())
+
+        # Events scheduled by timestep, for anyone already pregnant or postpartum, and women's birthdays; see schedule()
+        self.i = i # Timestep, set by the sim; people created during a timestep (e.g. births) are first updated in the next one
+        self.calendar = fpb.Calendar()
+        if self.pars['engine'] == 'numpy': # The numba engine checks these states itself, and only uses the calendar for deaths
+            preg = self.filter(self.pregnant)
+            preg.schedule('delivery',  preg.gestation, preg.preg_dur)
+            preg.schedule('first_tri', preg.gestation + self.pars['timestep'], self.pars['end_first_tri'])
+            self.filter(self.postpartum).schedule_postpartum()
+            self.filter(self.is_female).schedule_birthdays()
+
+        # Men counted by age in months rather than created as agents; see update_men()
+        self.male_counts = None
+        if self.pars['aggregate_men']:
+            self.male_counts = np.zeros(int(self.pars['max_age']*fpd.mpy)+1, dtype=np.int64)
+            male_ages = kwargs.get('male_ages')
+            if male_ages is not None:
+                bins = np.minimum((np.asarray(male_ages)*fpd.mpy).astype(np.int64), len(self.male_counts)-1)
+                self.male_counts += np.bincount(bins, minlength=len(self.male_counts))
 
         return
 
 
+    def __add__(self, people2):
+        ''' Combine two people objects, including any men counted by age and scheduled events '''
+        first_uid = self._next_uid
+        newpeople = super().__add__(people2)
+        if newpeople.male_counts is not None and people2.male_counts is not None:
+            newpeople.male_counts += people2.male_counts
+        for event,buckets in people2.calendar.events.items():
+            for step,chunks in buckets.items():
+                for uids in chunks:
+                    newpeople.calendar.schedule(event, step, first_uid + people2.uid2ind(uids))
+        return newpeople
+
+
+    @property
+    def n(self):
+        ''' Number of people alive, including men counted by age '''
+        n = self.count(self.alive)
+        if self.male_counts is not None:
+            n += self.male_counts.sum()
+        return n
+
+
     def update_method(self):
         '''
         Uses a switching matrix from DHS data to decide based on a person's original method their probability of changing to a
         new method and assigns them the new method. Currently allows switching on whole calendar years to enter function.
         Matrix serves as an initiation, discontinuation, continuation, and switching matrix. Transition probabilities are for 1 year and
         only for women who have not given birth within the last 6 months.
+
+        The matrices for each age group are stacked, so that each person's row is
+        found by indexing with their age group and current method, and all new
+        methods are drawn at once.
         '''
-        methods = self.pars['methods']
-        method_map = methods['map']
-        annual = methods['adjusted']['annual']
-        orig_methods = self.method
-        m = len(method_map)
-        switching_events = np.zeros((m, m), dtype=int)
-        switching_events_ages = {}
-        for key in fpd.method_age_map.keys():
-            switching_events_ages[key] = np.zeros((m, m), dtype=int)
-
-        # Method switching depends both on agent age and also on their current method, so we need to loop over both
-        for key,(age_low, age_high) in fpd.method_age_map.items():
-            match_low  = (self.age >= age_low) # CK: TODO: refactor into single method
-            match_high = (self.age <  age_high)
-            match_low_high = match_low * match_high
-            for m in method_map.values():
-                match_m = (orig_methods == m)
-                match = match_m * match_low_high
-                this_method = self.filter(match)
-                old_method = this_method.method.copy()
-
-                matrix = annual[key]
-                choices = matrix[m]
-                choices = choices/choices.sum()
-                new_methods = fpu.n_multinomial(choices, match.sum())
-                this_method.method = new_methods
-
-                for i in range(len(old_method)):
-                    x = old_method[i]
-                    y = new_methods[i]
-                    switching_events[x, y] += 1
-                    switching_events_ages[key][x, y] += 1
+        cdfs   = self.pars['methods']['cdfs'].annual
+        keys   = list(fpd.method_age_map.keys())
+        groups = fpu.digitize_ages(self.age, fpd.method_age_map)
+        valid  = self.filter(groups >= 0)
+        groups = groups[groups >= 0]
+        old_methods = valid.method.astype(np.int64)
+        new_methods = fpu.n_multinomial_cdf(cdfs[groups, old_methods], valid.random('method'))
+        valid.set(method=new_methods)
 
         if self.pars['track_switching']:
-            self.step_results_switching['annual'] += switching_events # CK: TODO: remove this extra result and combine with step_results
-            for key in fpd.method_age_map.keys():
-                self.step_results['switching_annual'][key] += switching_events_ages[key]
+            m = cdfs.shape[-1]
+            events = np.bincount((groups*m + old_methods)*m + new_methods, minlength=len(keys)*m*m).reshape(len(keys), m, m)
+            self.step_results['switching_annual'] += events
 
         return
 
@@ -151,88 +170,45 @@ class People(fpb.BasePeople):
         Utilizes data from birth to allow agent to initiate a method postpartum coming from birth by
         3 months postpartum and then initiate, continue, or discontinue a method by 6 months postpartum.
         Next opportunity to switch methods will be on whole calendar years, whenever that falls.
+
+        The initiation probabilities (with non-use adjusted for high parity) and the
+        6-month matrices for each age group are stacked into a single table (see
+        ``Pars.method_matrices()``), so that each woman's row is found by indexing
+        and all new methods are drawn at once.
         '''
         # TODO- Probabilities need to be adjusted for postpartum women on the next annual draw in "get_method" since they may be less than one year
+        cdfs   = self.pars['methods']['cdfs'].pp
+        keys   = list(fpd.method_age_map.keys())
+        G      = len(keys)
+        m      = cdfs.shape[1]
+        groups = fpu.digitize_ages(self.age, fpd.method_age_map)
+        old_methods = self.method.astype(np.int64)
+        high_parity = self.parity >= self.pars['high_parity']
+        rows = np.full(len(groups), -1, dtype=np.int64)
 
         # Probability of initiating a postpartum method at 0-3 months postpartum
         # Transitional probabilities are for the first 3 month time period after delivery from DHS data
-
-        methods = self.pars['methods']
-        pp0to1 = methods['adjusted']['pp0to1']
-        pp1to6 = methods['adjusted']['pp1to6']
-        methods_map = methods['map']
-        orig_methods = self.method
-
-        m = len(methods_map)
-        switching_events = np.zeros((m, m), dtype=int)
-        switching_events_ages = {}
-        for key in fpd.method_age_map.keys():
-            switching_events_ages[key] = np.zeros((m, m), dtype=int)
-
-        postpartum1 = (self.postpartum_dur == 0)
-        postpartum6 = (self.postpartum_dur == 6)
-
-        # In first time step after delivery, choice is by age but not previous method (since just gave birth)
-        # All women are coming from birth and on no method to start, either will stay on no method or initiate a method
-        for key, (age_low, age_high) in fpd.method_age_map.items():
-            match_low = (self.age >= age_low)
-            match_high = (self.age < age_high)
-            low_parity = (self.parity < self.pars['high_parity'])
-            high_parity = (self.parity >= self.pars['high_parity'])
-            match = (self.postpartum * postpartum1 * match_low * match_high * low_parity)
-            match_high_parity = (self.postpartum * postpartum1 * match_low * match_high * high_parity)
-            this_method = self.filter(match)
-            this_method_high_parity = self.filter(match_high_parity)
-            old_method = this_method.method.copy()
-            old_method_high_parity = sc.dcp(this_method_high_parity.method)
-
-            choices = pp0to1[key]
-            choices_high_parity = sc.dcp(choices)
-            choices_high_parity[0] *= self.pars['high_parity_nonuse']
-            choices_high_parity = choices_high_parity / choices_high_parity.sum()
-            new_methods = fpu.n_multinomial(choices, len(this_method))
-            new_methods_high_parity = fpu.n_multinomial(choices_high_parity, len(this_method_high_parity))
-            this_method.method = np.array(new_methods, dtype=np.int64)
-            this_method_high_parity.method = np.array(new_methods_high_parity, dtype=np.int64)
-            for i in range(len(old_method)):
-                x = old_method[i]
-                y = new_methods[i]
-                switching_events[x, y] += 1
-                switching_events_ages[key][x, y] += 1
-
-            for i in range(len(old_method_high_parity)):
-                x = old_method_high_parity[i]
-                y = new_methods_high_parity[i]
-                switching_events[x, y] += 1
-                switching_events_ages[key][x, y] += 1
+        # In first time step after delivery, choice is by age and parity but not previous method (since just gave birth)
+        postpartum1 = self.postpartum * (self.postpartum_dur == 0) * (groups >= 0)
+        rows[postpartum1] = (groups + G*high_parity)[postpartum1]
 
         # At 6 months, choice is by previous method and by age
         # Allow initiation, switching, or discontinuing with matrix at 6 months postpartum
         # Transitional probabilities are for 5 months, 1-6 months after delivery from DHS data
-        for key,(age_low, age_high) in fpd.method_age_map.items():
-            match_low  = (self.age >= age_low)
-            match_high = (self.age <  age_high)
-            match_postpartum_age = self.postpartum * postpartum6 * match_low * match_high
-            for m in methods_map.values():
-                match_m    = (orig_methods == m)
-                match = match_m * match_postpartum_age
-                this_method = self.filter(match)
-                old_method = self.method[match].copy()
-
-                matrix = pp1to6[key]
-                choices = matrix[m]
-                new_methods = fpu.n_multinomial(choices, match.sum())
-                this_method.method = new_methods
-                for i in range(len(old_method)):
-                    x = old_method[i]
-                    y = new_methods[i]
-                    switching_events[x, y] += 1
-                    switching_events_ages[key][x, y] += 1
+        # With timesteps longer than a month, this is the first timestep at or after 6 months
+        pp_dur = self.postpartum_dur
+        postpartum6 = self.postpartum * (pp_dur >= 6) * (pp_dur < 6 + self.pars['timestep']) * (groups >= 0)
+        rows[postpartum6] = (2*G + groups*m + old_methods)[postpartum6]
+
+        switching   = rows >= 0
+        switchers   = self.filter(switching)
+        new_methods = fpu.n_multinomial_cdf(cdfs[rows[switching]], switchers.random('method_pp'))
+        switchers.set(method=new_methods)
 
         if self.pars['track_switching']:
-            self.step_results_switching['postpartum'] += switching_events
-            for key in fpd.method_age_map.keys():
-                self.step_results['switching_postpartum'][key] += switching_events_ages[key]
+            groups, old_methods = groups[switching], old_methods[switching]
+            events = np.bincount((groups*m + old_methods)*m + new_methods, minlength=G*m*m).reshape(G, m, m)
+            self.step_results['switching_postpartum'] += events
 
         return
 
@@ -241,50 +217,81 @@ class People(fpb.BasePeople):
         '''If eligible (age 15-49 and not pregnant), choose new method or stay with current one'''
 
         if not (self.i % self.pars['method_timestep']): # Allow skipping timesteps
-            postpartum = (self.postpartum) * (self.postpartum_dur <= 6)
-            pp = self.filter(postpartum)
+            pp_end = 6 + self.pars['timestep'] # Postpartum switching ends at the first timestep at or after 6 months
+            postpartum = (self.postpartum) * (self.postpartum_dur < pp_end)
+            due = self.due('pp_switch') # At birth and at 6 months postpartum
+            pp = due.filter(due.postpartum * (due.postpartum_dur < pp_end))
             non_pp = self.filter(~postpartum)
 
             pp.update_method_pp() # Update method for
 
-            age_diff = non_pp.ceil_age - non_pp.age
-            whole_years = ((age_diff < (1/fpd.mpy)) * (age_diff > 0))
-            birthdays = non_pp.filter(whole_years)
+            # Birthdays since the last method update (see birthdays())
+            inds = self.birthdays()
+            birthdays = non_pp.filter(inds=inds[non_pp.contains(inds)])
             birthdays.update_method()
 
         return
 
 
     def check_mortality(self):
-        '''Decide if person dies at a timestep'''
-
-        timestep  = self.pars['timestep']
-        trend_val = self.pars['mortality_probs']['gen_trend']
-        age_mort  = self.pars['age_mortality']
-        f_spline = age_mort['f_spline'] * trend_val
-        m_spline = age_mort['m_spline'] * trend_val
-        over_one = self.filter(self.age >= 1)
-        female   = over_one.filter(over_one.is_female)
-        male     = over_one.filter(over_one.is_male)
-        f_ages = female.int_age
-        m_ages = male.int_age
-
-        f_mort_prob = fpu.annprob2ts(f_spline[f_ages], timestep)
-        m_mort_prob = fpu.annprob2ts(m_spline[m_ages], timestep)
-
-        f_died = female.binomial(f_mort_prob, as_filter=True)
-        m_died = male.binomial(m_mort_prob, as_filter=True)
-        for died in [f_died, m_died]:
-            died.alive           = False,
-            died.pregnant        = False,
-            died.gestation       = False,
-            died.sexually_active = False,
-            died.lactating       = False,
-            died.postpartum      = False,
-            died.lam             = False,
-            died.breastfeed_dur  = 0,
-            self.step_results['deaths'] += len(died)
+        '''
+        Decide if person dies at a timestep: by a trial for everyone over one year
+        old, or with pars['mortality_sampling'] = 'times', for the people whose
+        time of death is due (see schedule_deaths())
+        '''
+        if self.pars['mortality_sampling'] == 'times':
+            deaths = [self.due('death')]
+        else:
+            mort     = self.pars['mortality_probs']
+            over_one = self.filter(self.age >= 1)
+            female   = over_one.filter(over_one.is_female)
+            male     = over_one.filter(over_one.is_male)
+            f_ages = female.int_age
+            m_ages = male.int_age
+
+            f_mort_prob = mort['f_probs'][f_ages]
+            m_mort_prob = mort['m_probs'][m_ages]
+
+            f_died = female.binomial(f_mort_prob, as_filter=True, stream='death')
+            m_died = male.binomial(m_mort_prob, as_filter=True, stream='death')
+            deaths = [f_died, m_died]
+
+        for died in deaths:
+            died.set(
+                alive           = False,
+                pregnant        = False,
+                gestation       = 0,
+                sexually_active = False,
+                lactating       = False,
+                postpartum      = False,
+                lam             = False,
+                breastfeed_dur  = 0,
+            )
+            self.step_results['deaths'] += died.count()
+
+        return
+
 
+    def update_men(self):
+        '''
+        Update men counted by age rather than as agents (pars['aggregate_men']):
+        apply the same age-specific mortality as check_mortality() to men over
+        one year old, then age everyone by one timestep.
+        '''
+        counts   = self.male_counts
+        timestep = self.pars['timestep']
+        int_ages = np.arange(len(counts)) // fpd.mpy
+        probs    = self.pars['mortality_probs']['m_probs'][int_ages]
+        probs[int_ages < 1] = 0
+        deaths = np.random.binomial(counts, probs)
+        counts -= deaths
+        self.step_results['deaths'] += deaths.sum()
+
+        # Age, keeping everyone at the maximum age in the last bin
+        aged = np.zeros_like(counts)
+        aged[timestep:] = counts[:-timestep]
+        aged[-1] += counts[-timestep:].sum()
+        counts[:] = aged
         return
 
 
@@ -303,9 +310,10 @@ class People(fpb.BasePeople):
 
         # Adjust for postpartum women's birth spacing preferences
         pref = self.pars['spacing_pref'] # Shorten since used a lot
-        spacing_bins = pp.postpartum_dur / pref['interval'] # Main calculation -- divide the duration by the interval
+        pp_durs = np.minimum(pp.postpartum_dur + self.pars['timestep']//2, self.pars['postpartum_dur']) # Duration in the middle of the timestep
+        spacing_bins = pp_durs / pref['interval'] # Main calculation -- divide the duration by the interval
         spacing_bins = np.array(np.minimum(spacing_bins, pref['n_bins']), dtype=int) # Convert to an integer and bound by longest bin
-        probs_pp = self.pars['sexual_activity_pp']['percent_active'][pp.postpartum_dur]
+        probs_pp = self.pars['sexual_activity_pp']['percent_active'][pp_durs]
         probs_pp *= pref['preference'][spacing_bins] # Actually adjust the probability -- check the overall probability with print(pref['preference'][spacing_bins].mean())
 
         # Set non-postpartum probabilities
@@ -313,16 +321,15 @@ class People(fpb.BasePeople):
 
         # Evaluate likelihood in this time step of being sexually active
         # Can revert to active or not active each timestep
-        pp.sexually_active = fpu.binomial_arr(probs_pp)
-        non_pp.sexually_active = fpu.binomial_arr(probs_non_pp)
+        pp.set(sexually_active=pp.binomial(probs_pp, stream='sexual_activity'))
+        non_pp.set(sexually_active=non_pp.binomial(probs_non_pp, stream='sexual_activity'))
 
         # Set debut to True if sexually active for the first time
         # Record agent age at sexual debut in their memory
         never_sex = non_pp.sexual_debut == 0
         now_active = non_pp.sexually_active == 1
         first_debut = non_pp.filter(now_active * never_sex)
-        first_debut.sexual_debut = True
-        first_debut.sexual_debut_age = first_debut.age
+        first_debut.set(sexual_debut=True, sexual_debut_age=first_debut.age)
 
         return
 
@@ -359,49 +366,164 @@ class People(fpb.BasePeople):
         preg_probs *= pars['exposure_parity'][np.minimum(all_ppl.parity, fpd.max_parity)]
 
         # Use a single binomial trial to check for conception successes this month
-        conceived = active.binomial(preg_probs[active.inds], as_filter=True)
-        self.step_results['pregnancies'] += len(conceived) # track all pregnancies
+        conceived = active.binomial(preg_probs[active.inds], as_filter=True, stream='conception')
+        self.step_results['pregnancies'] += conceived.count() # track all pregnancies
         unintended = conceived.filter(conceived.method != 0)
-        self.step_results['unintended_pregs'] += len(unintended) # track pregnancies due to method failure
+        self.step_results['unintended_pregs'] += unintended.count() # track pregnancies due to method failure
 
         # Check for abortion
-        is_abort = conceived.binomial(pars['abortion_prob'])
+        is_abort = conceived.binomial(pars['abortion_prob'], stream='abortion')
         abort = conceived.filter(is_abort)
         preg = conceived.filter(~is_abort)
 
 
         # Update states
         all_ppl = self.unfilter()
-        abort.postpartum = False
-        abort.abortion += 1 # Add 1 to number of abortions agent has had
-        abort.postpartum_dur = 0
-        for i in abort.inds: # Handle adding dates
-            all_ppl.abortion_dates[i].append(all_ppl.age[i])
-        self.step_results['abortions'] = len(abort)
-        # Make selected agents pregnant
+        abort.set(postpartum=False, postpartum_dur=0)
+        abort.increment(abortion=1) # Add 1 to number of abortions agent has had
+        all_ppl.abortion_dates.append(abort.inds, all_ppl.age[abort.inds])
+        self.step_results['abortions'] = abort.count()
+        # Make selected agents pregnant; with timesteps longer than the first trimester, it can end in this timestep
         preg.make_pregnant()
+        preg.due('first_tri').check_miscarriage()
         if self.pars['track_as']:
-            pregnant_boolean = np.full(len(self), False)
-            pregnant_boolean[np.searchsorted(self.uid, preg.uid)] = True
-            pregnant_age_split = self.log_age_split(binned_ages_t=[self.age_by_group], channel='pregnancies', numerators=[pregnant_boolean], denominators=None)
+            preg.count_age_groups('pregnancies')
+        return
+
+
+    def schedule(self, event, duration, target):
+        '''
+        Schedule an event for each person in the calendar (see fpb.Calendar), for
+        the timestep in which a duration that increases by one timestep each
+        timestep (e.g. gestation) reaches its target (e.g. the duration of the
+        pregnancy). Since events are checked against the states when they are due,
+        events that no longer apply (e.g. delivery after a miscarriage) are ignored.
+
+        Args:
+            event (str): the kind of event, e.g. 'delivery'
+            duration (array): the duration as it will be checked in this timestep
+            target (int/array): the duration at which the event happens
+        '''
+        steps = np.ceil((target - np.asarray(duration, dtype=np.float64)) / self.pars['timestep'])
+        self.unfilter().calendar.schedule(event, self.i + steps.astype(np.int64), self.uid)
+        return
+
+
+    def due(self, event):
+        '''
+        Select the people with an event due this timestep (see schedule()), out of
+        the people in the view. The events are removed from the calendar, so each
+        kind of event is checked by one view each timestep.
+
+        Args:
+            event (str): the kind of event
+        '''
+        people = self.unfilter()
+        inds = np.sort(people.uid2ind(people.calendar.pop(event, people.i))) # Sorted, like the view
+        inds = inds[np.diff(inds, prepend=-1) > 0] # Remove duplicates, e.g. from initial and later scheduling
+        return self.filter(inds=inds[self.contains(inds)])
+
+
+    def schedule_postpartum(self):
+        '''
+        Schedule the end of the postpartum period, and method switching at birth and
+        at 6 months postpartum (see update_method_pp()), for people who are postpartum
+        '''
+        dur = self.postpartum_dur
+        self.schedule('postpartum_end', dur, self.pars['postpartum_dur'])
+        for month in [0, 6]:
+            switch = self.filter(dur <= month)
+            switch.schedule('pp_switch', switch.postpartum_dur, month)
+        return
+
+
+    def schedule_birthdays(self):
+        '''
+        Add women to the calendar by the timestep of the year in which their birthday
+        falls, which is fixed since ages advance by one timestep each timestep, so each
+        woman is added once rather than rescheduled every year (see birthdays())
+        '''
+        pars = self.pars
+        step = pars['timestep'] / fpd.mpy # Years per timestep
+        spy  = fpd.mpy // pars['timestep'] # Timesteps per year
+        eps  = 1e-9 # Tolerance for rounding errors in ages, which are advanced by a fraction of a year each timestep
+        age  = self.age
+        steps = self.i + np.ceil((np.floor(age + eps) + 1 - age) / step - eps) - 1 # The timestep the next birthday falls in
+        fecund = np.floor(age + eps) + 1 < pars['age_limit_fecundity'] + step
+        self.unfilter().calendar.schedule('birthday', steps[fecund].astype(np.int64) % spy, self.uid[fecund])
+        return
 
-            for key in pregnant_age_split:
-                self.step_results[key] = pregnant_age_split[key]
+
+    def birthdays(self):
+        '''
+        Find the women alive with a birthday since the last method update (see
+        pars['method_timestep']) between pars['method_age'] and pars['age_limit_fecundity'],
+        on which they could switch methods (see update_methods()). Women who are too
+        old for any later birthday are dropped from the calendar.
+
+        Returns:
+            The sorted indices of the women
+        '''
+        people = self.unfilter()
+        pars = people.pars
+        step = pars['timestep'] / fpd.mpy
+        spy  = fpd.mpy // pars['timestep']
+        eps  = 1e-9
+        first = max(people.i - pars['method_timestep'] + 1, 0)
+        found = []
+        for phase in np.unique(np.arange(first, people.i + 1) % spy):
+            inds = people.uid2ind(people.calendar.get('birthday', phase)) # Removed people are dropped
+            birthday = np.floor(people.age[inds] + step + eps) # The age reached this year
+            keep = people.alive[inds] * (birthday < pars['age_limit_fecundity'] + step)
+            people.calendar.replace('birthday', phase, people.uid[inds[keep]])
+            found.append(inds[keep * (birthday > np.floor(pars['method_age']))])
+        return np.sort(np.concatenate(found)) if found else np.zeros(0, dtype=np.int64)
+
+
+    def schedule_deaths(self, timelines):
+        '''
+        For pars['mortality_sampling'] = 'times', sample each person's time of death
+        once, rather than running a trial each timestep (see check_mortality()), and
+        schedule it in the calendar. The time of death is when the person's cumulative
+        hazard of death, from the probabilities of death by age and timestep in the
+        timelines (see Sim.init_timelines()), reaches an exponentially distributed
+        random number, which gives the same distribution as the trials. People who
+        survive to the end of the sim have no death scheduled.
+
+        Args:
+            timelines (dict): the sim's timelines, with the cumulative hazards of death for women (f_cum_hazards) and men (m_cum_hazards)
+        '''
+        step    = self.pars['timestep'] / fpd.mpy # Years per timestep
+        targets = -np.log1p(-self.random('death_time'))
+        steps   = np.full(len(self), -1, dtype=np.int64)
+        for sex,key in enumerate(['f', 'm']): # Women are sex 0
+            match = self.sex == sex
+            steps[match] = fpu.death_steps(timelines[f'{key}_cum_hazards'], self.age[match].astype(np.float64), targets[match], self.i, step)
+        found = steps >= 0
+        self.unfilter().calendar.schedule('death', steps[found], self.uid[found])
         return
 
 
     def make_pregnant(self):
         '''
-        Update the selected agents to be pregnant
+        Update the selected agents to be pregnant, and schedule the delivery and
+        the check for miscarriage at the end of the first trimester
         '''
+        timestep = self.pars['timestep']
         pregdur = [self.pars['preg_dur_low'], self.pars['preg_dur_high']]
-        self.pregnant = True
-        self.gestation = 1  # Start the counter at 1
-        self.preg_dur = np.random.randint(pregdur[0], pregdur[1]+1, size=len(self))  # Duration of this pregnancy
-        self.postpartum = False
-        self.postpartum_dur = 0
+        self.set(
+            pregnant       = True,
+            gestation      = timestep,  # Start the counter at one timestep
+            preg_dur       = self.randint(pregdur[0], pregdur[1], stream='preg_dur'),  # Duration of this pregnancy
+            postpartum     = False,
+            postpartum_dur = 0,
+        )
         self.reset_breastfeeding() # Stop lactating if becoming pregnant
-        self.method = 0
+        self.set(method=0)
+
+        # Gestation is checked for delivery before it is advanced, and for miscarriage after
+        self.schedule('delivery',  self.gestation - timestep, self.preg_dur)
+        self.schedule('first_tri', self.gestation, self.pars['end_first_tri'])
         return
 
 
@@ -412,13 +534,13 @@ class People(fpb.BasePeople):
         max_lam_dur = self.pars['max_lam_dur']
         lam_candidates = self.filter((self.postpartum) * (self.postpartum_dur <= max_lam_dur))
         probs = self.pars['lactational_amenorrhea']['rate'][lam_candidates.postpartum_dur]
-        lam_candidates.lam = lam_candidates.binomial(probs)
+        lam_candidates.set(lam=lam_candidates.binomial(probs, stream='lam'))
 
         not_postpartum    = self.postpartum == 0
         over5mo           = self.postpartum_dur > max_lam_dur
         not_breastfeeding = self.breastfeed_dur == 0
         not_lam = self.filter(not_postpartum + over5mo + not_breastfeeding)
-        not_lam.lam = False
+        not_lam.set(lam=False)
 
         return
 
@@ -429,13 +551,15 @@ class People(fpb.BasePeople):
         Agents are randomly assigned a duration value based on a gumbel distribution drawn from the 2018 DHS variable for breastfeeding months. The mean (mu) and the std dev (beta) are both drawn from that distribution in the DHS data.
         '''
         mu, beta = self.pars['breastfeeding_dur_mu'], self.pars['breastfeeding_dur_beta']
-        breastfeed_durs = abs(np.random.gumbel(mu, beta, size=len(self)))
+        timestep = self.pars['timestep']
+        rands = 1 - self.random('breastfeeding', size=timestep) # One draw per month, as for a monthly timestep
+        breastfeed_durs = abs(mu - beta*np.log(-np.log(rands))).min(axis=0) # Gumbel distributed, as for np.random.gumbel()
         breastfeed_durs = np.ceil(breastfeed_durs)
         breastfeed_finished_inds = self.breastfeed_dur >= breastfeed_durs
         breastfeed_finished = self.filter(breastfeed_finished_inds)
         breastfeed_continue = self.filter(~breastfeed_finished_inds)
         breastfeed_finished.reset_breastfeeding()
-        breastfeed_continue.breastfeed_dur += self.pars['timestep']
+        breastfeed_continue.increment(breastfeed_dur=self.pars['timestep'])
         return
 
 
@@ -443,16 +567,16 @@ class People(fpb.BasePeople):
         '''Track duration of extended postpartum period (0-24 months after birth).  Only enter this function if agent is postpartum'''
 
         # Stop postpartum episode if reach max length (set to 24 months)
-        pp_done = self.filter(self.postpartum_dur >= self.pars['postpartum_dur'])
-        pp_done.postpartum = False
-        pp_done.postpartum_dur = 0
+        due = self.due('postpartum_end')
+        pp_done = due.filter(due.postpartum_dur >= self.pars['postpartum_dur'])
+        pp_done.set(postpartum=False, postpartum_dur=0)
 
         # Count the state of the agent for postpartum -- # TOOD: refactor, what is this loop doing?
         pp = self.filter(self.postpartum)
         for key,(pp_low, pp_high) in fpd.postpartum_map.items():
             this_pp_bin = pp.filter((pp.postpartum_dur >= pp_low) * (pp.postpartum_dur <  pp_high))
-            self.step_results[key] += len(this_pp_bin)
-        pp.postpartum_dur += self.pars['timestep']
+            self.step_results[key] += this_pp_bin.count()
+        pp.increment(postpartum_dur=self.pars['timestep'])
 
         return
 
@@ -461,41 +585,45 @@ class People(fpb.BasePeople):
         '''Advance pregnancy in time and check for miscarriage'''
 
         preg = self.filter(self.pregnant)
-        preg.gestation += self.pars['timestep']
+        preg.increment(gestation=self.pars['timestep'])
+        preg.due('first_tri').check_miscarriage()
+        return
+
 
-        # Check for miscarriage at the end of the first trimester
-        end_first_tri     = preg.filter(preg.gestation == self.pars['end_first_tri'])
+    def check_miscarriage(self):
+        '''
+        Check for miscarriage for pregnant women whose gestation reached the end of
+        the first trimester in this timestep
+        '''
+        eft = self.pars['end_first_tri']
+        end_first_tri     = self.filter((self.gestation >= eft) * (self.gestation - self.pars['timestep'] < eft))
         miscarriage_probs = self.pars['miscarriage_rates'][end_first_tri.int_age_clip]
-        miscarriage  = end_first_tri.binomial(miscarriage_probs, as_filter=True)
+        miscarriage  = end_first_tri.binomial(miscarriage_probs, as_filter=True, stream='miscarriage')
 
         # Reset states and track miscarriages
         all_ppl = self.unfilter()
-        miscarriage.pregnant   = False
-        miscarriage.miscarriage += 1 # Add 1 to number of miscarriages agent has had
-        miscarriage.postpartum = False
-        miscarriage.gestation  = 0  # Reset gestation counter
-        for i in miscarriage.inds: # Handle adding dates
-            all_ppl.miscarriage_dates[i].append(all_ppl.age[i])
-        self.step_results['miscarriages'] = len(miscarriage)
+        miscarriage.set(pregnant=False, postpartum=False, gestation=0) # Reset gestation counter
+        miscarriage.increment(miscarriage=1) # Add 1 to number of miscarriages agent has had
+        all_ppl.miscarriage_dates.append(miscarriage.inds, all_ppl.age[miscarriage.inds])
+        self.step_results['miscarriages'] += miscarriage.count()
         return
 
 
     def reset_breastfeeding(self):
         '''Stop breastfeeding, calculate total lifetime duration so far, and reset lactation episode to zero'''
-        self.lactating = False
-        self.breastfeed_dur_total += self.breastfeed_dur
-        self.breastfeed_dur = 0
+        self.increment(breastfeed_dur_total=self.breastfeed_dur)
+        self.set(lactating=False, breastfeed_dur=0)
         return
 
 
     def check_maternal_mortality(self):
         '''Check for probability of maternal mortality'''
         prob = self.pars['mortality_probs']['maternal'] * self.pars['maternal_mortality_factor']
-        is_death = self.binomial(prob)
+        is_death = self.binomial(prob, stream='maternal_death')
         death = self.filter(is_death)
-        death.alive = False
-        self.step_results['maternal_deaths'] += len(death)
-        self.step_results['deaths'] += len(death)
+        death.set(alive=False)
+        self.step_results['maternal_deaths'] += death.count()
+        self.step_results['deaths'] += death.count()
         return death
 
 
@@ -505,9 +633,9 @@ class People(fpb.BasePeople):
         if len(self) > 0:
             age_inds = sc.findnearest(self.pars['infant_mortality']['ages'], self.age)
             death_prob = death_prob * (self.pars['infant_mortality']['age_probs'][age_inds])
-        is_death = self.binomial(death_prob)
+        is_death = self.binomial(death_prob, stream='infant_death')
         death = self.filter(is_death)
-        self.step_results['infant_deaths'] += len(death)
+        self.step_results['infant_deaths'] += death.count()
         death.reset_breastfeeding()
         return death
 
@@ -516,14 +644,18 @@ class People(fpb.BasePeople):
         '''Decide if pregnant woman gives birth and explore maternal mortality and child mortality'''
 
         # Update states
-        deliv = self.filter(self.gestation == self.preg_dur)
+        due = self.due('delivery')
+        deliv = due.filter(due.gestation >= due.preg_dur)
         if len(deliv): # check for any deliveries
-            deliv.pregnant = False
-            deliv.gestation = 0  # Reset gestation counter
-            deliv.lactating = True
-            deliv.postpartum = True # Start postpartum state at time of birth
-            deliv.breastfeed_dur = 0  # Start at 0, will update before leaving timestep in separate function
-            deliv.postpartum_dur = 0
+            deliv.set(
+                pregnant       = False,
+                gestation      = 0,  # Reset gestation counter
+                lactating      = True,
+                postpartum     = True, # Start postpartum state at time of birth
+                breastfeed_dur = 0,  # Start at 0, will update before leaving timestep in separate function
+                postpartum_dur = 0,
+            )
+            deliv.schedule_postpartum()
 
             # Handle stillbirth
             still_prob = self.pars['mortality_probs']['stillbirth']
@@ -533,244 +665,141 @@ class People(fpb.BasePeople):
             age_ind[prev_idx_is_less] -= 1 # adjusting for quirks of np.searchsorted
             still_prob = still_prob * (self.pars['stillbirth_rate']['age_probs'][age_ind]) if len(self) > 0 else 0
 
-            is_stillborn = deliv.binomial(still_prob)
+            is_stillborn = deliv.binomial(still_prob, stream='stillbirth')
             stillborn = deliv.filter(is_stillborn)
-            stillborn.stillbirth += 1  # Track how many stillbirths an agent has had
-            stillborn.lactating = False   # Set agents of stillbith to not lactate
-            self.step_results['stillbirths'] = len(stillborn)
+            stillborn.increment(stillbirth=1)  # Track how many stillbirths an agent has had
+            stillborn.set(lactating=False)   # Set agents of stillbith to not lactate
+            self.step_results['stillbirths'] = stillborn.count()
 
             if self.pars['track_as']:
-                stillbirth_boolean = np.full(len(self), False)
-                stillbirth_boolean[np.searchsorted(self.uid, stillborn.uid)] = True
-
-                self.step_results['stillbirth_ages'] = self.age_by_group
-                self.step_results['as_stillbirths'] = stillbirth_boolean
+                stillborn.count_age_groups('stillbirths')
 
             # Add dates of live births and stillbirths separately for agent to remember
             all_ppl = self.unfilter()
             live = deliv.filter(~is_stillborn)
-            for i in live.inds: # Handle DOBs
-                all_ppl.dobs[i].append(all_ppl.age[i])  # Used for birth spacing only, only add one baby to dob -- CK: can't easily turn this into a Numpy operation
-                if len(all_ppl.dobs[i]) == 1:
-                    all_ppl.first_birth_age[i] = all_ppl.age[i]
-            for i in stillborn.inds: # Handle adding dates
-                all_ppl.still_dates[i].append(all_ppl.age[i])
+            first = live.inds[all_ppl.dobs.counts[live.inds] == 0]
+            all_ppl.first_birth_age[first] = all_ppl.age[first]
+            all_ppl.dobs.append(live.inds, all_ppl.age[live.inds])  # Used for birth spacing only, only add one baby to dob
+            all_ppl.still_dates.append(stillborn.inds, all_ppl.age[stillborn.inds])
 
             # Handle twins
-            is_twin = live.binomial(self.pars['twins_prob'])
+            is_twin = live.binomial(self.pars['twins_prob'], stream='twins')
             twin = live.filter(is_twin)
-            self.step_results['births'] += 2*len(twin) # only add births to population if born alive
-            twin.parity += 2 # Add 2 because matching DHS "total children ever born (alive) v201"
+            self.step_results['births'] += 2*twin.count() # only add births to population if born alive
+            twin.increment(parity=2) # Add 2 because matching DHS "total children ever born (alive) v201"
 
             # Handle singles
             single = live.filter(~is_twin)
-            self.step_results['births'] += len(single)
-            single.parity += 1
+            self.step_results['births'] += single.count()
+            single.increment(parity=1)
 
             #Calculate total births
-            self.step_results['total_births'] = len(stillborn) + self.step_results['births']
+            self.step_results['total_births'] = stillborn.count() + self.step_results['births']
 
-            live_age = live.age
-            for key, (age_low, age_high) in fpd.age_bin_map.items():
-                birth_bins = np.sum((live_age >= age_low) * (live_age < age_high))
-                self.step_results['birth_bins'][key] += birth_bins
-
-            if self.pars['track_as']:
-                total_women_delivering = np.full(len(self), False)
-                total_women_delivering[np.searchsorted(self.uid, live.uid)] = True
-                self.step_results['mmr_age_by_group'] = self.age_by_group
+            birth_bins = live.count_by(fpu.digitize_ages(live.age, fpd.age_bin_map), len(fpd.age_bin_map))
+            for key,count in zip(fpd.age_bin_map.keys(), birth_bins):
+                self.step_results['birth_bins'][key] += count
 
             # Check mortality
             maternal_deaths = live.check_maternal_mortality() # Mothers of only live babies eligible to match definition of maternal mortality ratio
-            if self.pars['track_as']:
-                maternal_deaths_bool = np.full(len(self), False)
-                maternal_deaths_bool[np.searchsorted(self.uid, maternal_deaths.uid)] = True
-
-                total_infants_bool = np.full(len(self), False)
-                total_infants_bool[np.searchsorted(self.uid, live.uid)] = True
-
             i_death = live.check_infant_mortality()
 
             # Save infant deaths and totals into age buckets
             if self.pars['track_as']:
-                infant_deaths_bool = np.full(len(self), False)
-                infant_deaths_bool[np.searchsorted(self.uid, i_death.uid)] = True
-                self.step_results['imr_age_by_group'] = self.age_by_group # age groups have to be in same context as imr
-
-                self.step_results['imr_numerator'] = infant_deaths_bool # we need to track these over time to be summed by year
-                self.step_results['imr_denominator'] = total_infants_bool
-                self.step_results['mmr_numerator'] = maternal_deaths_bool
-                self.step_results['mmr_denominator'] = total_women_delivering
-
-                live_births_age_split = self.log_age_split(binned_ages_t=[self.age_by_group], channel='births', numerators=[total_women_delivering], denominators=None)
-                for key in live_births_age_split:
-                    self.step_results[key] = live_births_age_split[key]
-
-            # TEMP -- update children, need to refactor
-            r = sc.dictobj(**self.step_results)
-            new_people = r.births - r.infant_deaths # Do not add agents who died before age 1 to population
-            children_map = sc.ddict(int)
-            for i in live.inds:
-                children_map[i] += 1
-            for i in twin.inds:
-                children_map[i] += 1
-            for i in i_death.inds:
-                children_map[i] -= 1
-
-            assert sum(list(children_map.values())) == new_people
-            start_ind = len(all_ppl)
-            for mother,n_children in children_map.items():
-                end_ind = start_ind+n_children
-                children = list(range(start_ind, end_ind))
-                all_ppl.children[mother] += children
-                start_ind = end_ind
+                live.count_age_groups('births')
+                i_death.count_age_groups('infant_deaths')
+                maternal_deaths.count_age_groups('maternal_deaths')
+
+            # Add a child for each live birth, plus one for twins, except for infant deaths
+            if self.pars['sampling_rates'] is None: # Weighted births are sampled by sex rather than by mother; see Sim.make_births()
+                n_children = 1 + is_twin - live.mask(i_death)
+                start_uid = all_ppl._next_uid # Children are added in Sim.run() with UIDs assigned in this order
+                mothers = np.repeat(live.inds, n_children)
+                all_ppl.children.append(mothers, start_uid + np.arange(len(mothers)))
 
         return
 
 
     def update_age(self):
         '''Advance age in the simulation'''
-        self.age += self.pars['timestep'] / fpd.mpy  # Age the person for the next timestep
-        self.age = np.minimum(self.age, self.pars['max_age'])
+        age = self.age + self.pars['timestep'] / fpd.mpy  # Age the person for the next timestep
+        self.set(age=np.minimum(age, self.pars['max_age']))
 
         return
 
 
-    def update_age_bin_totals(self):
+    def count_age_groups(self, key, mask=None):
         '''
-        Count how many total live women in each 5-year age bin 10-50, for tabulating ASFR
-        '''
-        for key, (age_low, age_high) in fpd.age_bin_map.items():
-            this_age_bin = self.filter((self.age >= age_low) * (self.age < age_high))
-            self.step_results['age_bin_totals'][key] += len(this_age_bin)
-        return
+        Add the number of people in each age group (see fpd.age_specific_channel_bins),
+        weighted by their sampling weights, to the age-specific counts for this
+        timestep, for track_as
 
-    def log_age_split(self, binned_ages_t, channel, numerators, denominators=None):
-        counts_dict = {}
-        results_dict = {}
-        if denominators is not None: # true when we are calculating rates (like cpr)
-            for timestep_index in range(len(binned_ages_t)):
-                if len(denominators[timestep_index]) == 0:
-                    counts_dict[f"age_true_counts_{timestep_index}"] = {}
-                    counts_dict[f"age_false_counts_{timestep_index}"] = {}
-                else:
-                    binned_ages = binned_ages_t[timestep_index]
-                    binned_ages_true = binned_ages[np.logical_and(numerators[timestep_index], denominators[timestep_index])]
-                    if len(numerators[timestep_index]) == 0:
-                        binned_ages_false = [] # ~[] doesnt make sense
-                    else:
-                        binned_ages_false = binned_ages[np.logical_and(~numerators[timestep_index], denominators[timestep_index])]
-
-                    counts_dict[f"age_true_counts_{timestep_index}"] = dict(zip(*np.unique(binned_ages_true, return_counts=True)))
-                    counts_dict[f"age_false_counts_{timestep_index}"] = dict(zip(*np.unique(binned_ages_false, return_counts=True)))
-
-            age_true_counts = {}
-            age_false_counts = {}
-            for age_counts_dict_key in counts_dict:
-                for index in counts_dict[age_counts_dict_key]:
-                    age_true_counts[index] = 0 if index not in age_true_counts else age_true_counts[index]
-                    age_false_counts[index] = 0 if index not in age_false_counts else age_false_counts[index]
-                    if 'false' in age_counts_dict_key:
-                        age_false_counts[index] += counts_dict[age_counts_dict_key][index]
-                    else:
-                        age_true_counts[index] += counts_dict[age_counts_dict_key][index]
-
-            for index, age_str in enumerate(fpd.age_specific_channel_bins):
-                scale = 1
-                if channel == "imr":
-                    scale = 1000
-                elif channel == "mmr":
-                    scale = 100000
-                if index not in age_true_counts:
-                    results_dict[f"{channel}_{age_str}"] = 0
-                elif index in age_true_counts and index not in age_false_counts:
-                    results_dict[f"{channel}_{age_str}"] = 1.0 * scale
-                else:
-                    results_dict[f"{channel}_{age_str}"] = (age_true_counts[index] / (age_true_counts[index] + age_false_counts[index])) * scale
-        else: # true when we are calculating counts (like pregnancies)
-            for timestep_index in range(len(binned_ages_t)):
-                if len(numerators[timestep_index]) == 0:
-                    counts_dict[f"age_counts_{timestep_index}"] = {}
-                else:
-                    binned_ages = binned_ages_t[timestep_index]
-                    binned_ages_true = binned_ages[numerators[timestep_index]]
-                    counts_dict[f"age_counts_{timestep_index}"] = dict(zip(*np.unique(binned_ages_true, return_counts=True)))
-            age_true_counts = {}
-            for age_counts_dict_key in counts_dict:
-                for index in counts_dict[age_counts_dict_key]:
-                    age_true_counts[index] = 0 if index not in age_true_counts else age_true_counts[index]
-                    age_true_counts[index] += counts_dict[age_counts_dict_key][index]
-
-            for index, age_str in enumerate(fpd.age_specific_channel_bins):
-                if index not in age_true_counts:
-                    results_dict[f"{channel}_{age_str}"] = 0
-                else:
-                    results_dict[f"{channel}_{age_str}"] = age_true_counts[index]
-        return results_dict
-
-    def track_mcpr(self):
-        '''
-        Track for purposes of calculating mCPR at the end of the timestep after all people are updated
-        Not including LAM users in mCPR as this model counts all women passively using LAM but
-        DHS data records only women who self-report LAM which is much lower.
-        Follows the DHS definition of mCPR
-        '''
-        modern_methods = sc.findinds(list(self.pars['methods']['modern'].values()))
-        method_age = (self.pars['method_age'] <= self.age)
-        fecund_age = self.age < self.pars['age_limit_fecundity']
-        denominator = method_age * fecund_age * self.is_female * (self.alive)
-        numerator = np.isin(self.method, modern_methods)
-        no_method_mcpr = np.sum((self.method == 0) * denominator)
-        on_method_mcpr = np.sum(numerator * denominator)
-        self.step_results['no_methods_mcpr'] += no_method_mcpr
-        self.step_results['on_methods_mcpr'] += on_method_mcpr
-        
-        if self.pars['track_as']:
-            as_result_dict = self.log_age_split(binned_ages_t=[self.age_by_group], channel='mcpr', numerators=[numerator], denominators=[denominator])
-            for key in as_result_dict:
-                self.step_results[key] = as_result_dict[key]
-        return
-
-    def track_cpr(self):
-        '''
-        Track for purposes of calculating newer ways to conceptualize contraceptive prevalence
-        at the end of the timestep after all people are updated
-        Includes women using any method of contraception, including LAM
-        Denominator of possible users includes all women aged 15-49
+        Args:
+            key (str): the row of the counts to add to, from fpd.age_specific_counts
+            mask (array): if supplied, only count the agents for which it is True
         '''
-        denominator = ((self.pars['method_age'] <= self.age) * (self.age < self.pars['age_limit_fecundity']) * (
-                    self.sex == 0) * (self.alive))
-        numerator = self.method != 0
-        no_method_cpr = np.sum((self.method == 0) * denominator)
-        on_method_cpr = np.sum(numerator * denominator)
-        self.step_results['no_methods_cpr'] += no_method_cpr
-        self.step_results['on_methods_cpr'] += on_method_cpr
-
-        if self.pars['track_as']:
-            as_result_dict = self.log_age_split(binned_ages_t=[self.age_by_group], channel='cpr', numerators=[numerator], denominators=[denominator])
-            for key in as_result_dict:
-                self.step_results[key] = as_result_dict[key]
+        n = len(fpd.age_specific_channel_bins)
+        weights = self.weight if mask is None else mask*self.weight
+        counts = np.bincount(self.age_by_group, weights=weights, minlength=n)[:n] # Agents older than the last bin are in group n
+        self.step_results['as_counts'][fpd.age_specific_counts.index(key)] += counts
         return
 
-    def track_acpr(self):
+    def track_prevalence(self):
         '''
-        Track for purposes of calculating newer ways to conceptualize contraceptive prevalence
-        at the end of the timestep after all people are updated
-        Denominator of possible users excludes pregnant women and those not sexually active in the last 4 weeks
-        Used to compare new metrics of contraceptive prevalence and eventually unmet need to traditional mCPR definitions
+        Tabulate contraceptive prevalence at the end of the timestep after all
+        people are updated, together with the fecund women in total and by 5-year
+        age bin 10-50 (for ASFR), and by age group if tracking by age (track_as).
+        All are counted together in a single pass (see fpu.count_prevalence()).
+
+        The denominator of mCPR and CPR is living women from method_age up to
+        age_limit_fecundity. The denominator of aCPR excludes pregnant women and
+        those not sexually active in the last 4 weeks; aCPR is used to compare
+        new metrics of contraceptive prevalence and eventually unmet need to
+        traditional mCPR definitions. CPR and aCPR include women using any method,
+        including LAM. mCPR follows the DHS definition: it does not include LAM,
+        since this model counts all women passively using LAM but DHS data records
+        only women who self-report LAM, which is much lower.
         '''
-        denominator = ((self.pars['method_age'] <= self.age) * (self.age < self.pars['age_limit_fecundity']) * (
-                self.sex == 0) * (self.pregnant == 0) * (self.sexually_active == 1) * (self.alive))
-        numerator = self.method != 0
-        no_method_cpr = np.sum((self.method == 0) * denominator)
-        on_method_cpr = np.sum(numerator * denominator)
-        self.step_results['no_methods_acpr'] += no_method_cpr
-        self.step_results['on_methods_acpr'] += on_method_cpr
-        
-        if self.pars['track_as']:
-            as_result_dict = self.log_age_split(binned_ages_t=[self.age_by_group], channel='acpr', numerators=[numerator], denominators=[denominator])
-            for key in as_result_dict:
-                self.step_results[key] = as_result_dict[key]
+        pars = self.pars
+        n_groups = len(fpd.age_specific_channel_bins) + 1 if pars['track_as'] else 1 # Including agents older than the last age group
+
+        # Class of each method: none (0), traditional (1) or modern (2)
+        method_class = 1 + np.array(list(pars['methods']['modern'].values()), dtype=np.int8)
+        method_class[0] = 0
+
+        # Women by whether potential users, their method class and whether in the aCPR denominator; age bin; age 15+; and age group
+        age_bins = np.array(list(fpd.age_bin_map.values()), dtype=np.float64)
+        counts = fpu.count_prevalence(self.age, self.sex, self.alive, self.method, self.pregnant, self.sexually_active,
+                                      self.age_by_group, self.weight, method_class, float(pars['method_age']),
+                                      float(pars['age_limit_fecundity']), age_bins, n_groups)
+
+        # Potential users by method class and age group, for all women and those in the aCPR denominator
+        by_status = counts.sum(axis=(1, 2))
+        active_users = by_status[4:]
+        users = by_status[1:4] + active_users
+
+        r = self.step_results
+        r['no_methods_mcpr'] += users[0].sum()
+        r['on_methods_mcpr'] += users[2].sum()
+        r['no_methods_cpr']  += users[0].sum()
+        r['on_methods_cpr']  += users[1:].sum()
+        r['no_methods_acpr'] += active_users[0].sum()
+        r['on_methods_acpr'] += active_users[1:].sum()
+        r['total_women_fecund'] = counts[:, :, 1].sum()
+        for key, total in zip(fpd.age_bin_map.keys(), counts.sum(axis=(0, 2, 3))):
+            r['age_bin_totals'][key] += total
+
+        if pars['track_as']:
+            as_counts = dict(
+                mcpr       = users[2],
+                cpr        = users[1:].sum(axis=0),
+                acpr       = active_users[1:].sum(axis=0),
+                mcpr_women = users.sum(axis=0),
+                cpr_women  = users.sum(axis=0),
+                acpr_women = active_users.sum(axis=0),
+            )
+            for key, values in as_counts.items():
+                r['as_counts'][fpd.age_specific_counts.index(key)] += values[:-1]
         return
 
     def init_step_results(self):
@@ -778,6 +807,7 @@ class People(fpb.BasePeople):
             deaths          = 0,
             births          = 0,
             stillbirths     = 0,
+            miscarriages    = 0,
             total_births    = 0,
             maternal_deaths = 0,
             infant_deaths   = 0,
@@ -787,11 +817,6 @@ class People(fpb.BasePeople):
             no_methods_cpr  = 0,
             on_methods_acpr = 0,
             no_methods_acpr = 0,
-            as_stillbirths  = [],
-            imr_numerator   = [],
-            imr_denominator = [],
-            mmr_numerator   = [],
-            mmr_denominator = [],
             pp0to5          = 0,
             pp6to11         = 0,
             pp12to23        = 0,
@@ -801,51 +826,162 @@ class People(fpb.BasePeople):
             birthday_fraction = None,
             birth_bins        = {},
             age_bin_totals    = {},
-            switching_annual     = {},
-            switching_postpartum = {},
-            imr_age_by_group = [],
-            mmr_age_by_group = [],
-            stillbirth_ages = []
+            switching_annual     = None,
+            switching_postpartum = None,
         )
 
         if self.pars['track_as']:
-            as_keys = dict(
-                as_stillbirths=[],
-                imr_numerator=[],
-                imr_denominator=[],
-                mmr_numerator=[],
-                mmr_denominator=[],
-                imr_age_by_group=[],
-                mmr_age_by_group = [],
-                stillbirth_ages = []
-            )
-            self.step_results.update(as_keys)
-
-            as_channels = ['acpr', 'cpr', 'mcpr', 'stillbirths', "births", "pregnancies"]
-            for age_specific_channel in as_channels:
-                for age_range in fpd.age_specific_channel_bins:
-                    self.step_results[f"{age_specific_channel}_{age_range}"] = 0
+            self.step_results['as_counts'] = np.zeros((len(fpd.age_specific_counts), len(fpd.age_specific_channel_bins)))
 
         for key in fpd.age_bin_map.keys():
             self.step_results['birth_bins'][key] = 0
             self.step_results['age_bin_totals'][key] = 0
 
-        m = len(self.pars['methods']['map'])
-
-        def mm_zeros():
-            ''' Return an array of m x m zeros '''
-            return np.zeros((m, m), dtype=int)
-
         if self.pars['track_switching']:
-            for key in fpd.method_age_map.keys():
-                self.step_results['switching_annual'][key]    = mm_zeros()
-                self.step_results['switching_postpartum'][key] = mm_zeros()
+            m = len(self.pars['methods']['map'])
+            shape = (len(fpd.method_age_map), m, m) # Age group × old method × new method
+            self.step_results['switching_annual']     = np.zeros(shape, dtype=int)
+            self.step_results['switching_postpartum'] = np.zeros(shape, dtype=int)
+
+        return
 
-            self.step_results['switching'] = dict(
-                annual     = mm_zeros(),
-                postpartum = mm_zeros(),
-            )
 
+    def update_compiled(self):
+        '''
+        Update everyone from mortality to conception in a single compiled pass
+        over the state arrays (see fpu.update_people()), then record the events
+        in the step results and event histories as the NumPy methods do. Used
+        instead of check_mortality(), check_delivery(), update_pregnancy(),
+        check_sexually_active(), update_methods(), update_postpartum(),
+        update_breastfeeding(), check_lam() and check_conception() when
+        pars['engine'] is 'numba'. With pars['rng'] = 'streams', each random
+        number comes from the same stream as in the NumPy methods, so results
+        are the same; otherwise random numbers are drawn in a different order,
+        so results are statistically equivalent but not identical.
+        '''
+        pars    = self.pars
+        methods = pars['methods']
+        mort    = pars['mortality_probs']
+        timestep = pars['timestep']
+        n = len(self)
+
+        # Convert parameters to arrays
+        keys = list(fpd.method_age_map.keys())
+        edges = np.array([fpd.method_age_map[key][0] for key in keys] + [fpd.method_age_map[keys[-1]][1]], dtype=np.float64)
+        G, m = len(keys), len(methods['map'])
+        cdfs = methods['cdfs']
+        rng_key = fpu.stream_key(pars['seed'])
+        pp_bins = np.array(list(fpd.postpartum_map.values()), dtype=np.int64)
+        pp_counts = np.zeros(len(pp_bins))
+        flags = np.zeros(n, dtype=np.int64)
+        due_deaths = np.zeros(n, dtype=bool)
+        switching = np.zeros((2, G, m, m), dtype=np.int64) # Annual and postpartum
+        death_times = pars['mortality_sampling'] == 'times'
+        if death_times:
+            due_deaths[self.due('death').inds] = True
+
+        states = fpu.PeopleArrays(*[getattr(self, state) for state in fpu.PeopleArrays._fields])
+        update_pars = fpu.UpdatePars(
+            timestep             = timestep,
+            step                 = self.i,
+            do_methods           = not (self.i % pars['method_timestep']),
+            method_timestep      = pars['method_timestep'],
+            streams              = pars['rng'] == 'streams',
+            key0                 = np.uint64(rng_key[0]),
+            key1                 = np.uint64(rng_key[1]),
+            death_times          = death_times,
+            track_switching      = bool(pars['track_switching']),
+            f_mort               = mort['f_probs'],
+            m_mort               = mort['m_probs'],
+            still_prob           = float(mort['stillbirth']),
+            still_ages           = np.asarray(pars['stillbirth_rate']['ages'], dtype=np.float64),
+            still_age_probs      = np.asarray(pars['stillbirth_rate']['age_probs'], dtype=np.float64),
+            twins_prob           = float(pars['twins_prob']),
+            maternal_prob        = float(mort['maternal'] * pars['maternal_mortality_factor']),
+            infant_prob          = float(mort['infant']),
+            infant_ages          = np.asarray(pars['infant_mortality']['ages'], dtype=np.float64),
+            infant_age_probs     = np.asarray(pars['infant_mortality']['age_probs'], dtype=np.float64),
+            end_first_tri        = pars['end_first_tri'],
+            miscarriage_rates    = pars['miscarriage_rates'],
+            age_limit_fecundity  = float(pars['age_limit_fecundity']),
+            sexual_activity      = pars['sexual_activity'],
+            sexual_activity_pp   = pars['sexual_activity_pp']['percent_active'],
+            pp_dur_max           = pars['postpartum_dur'],
+            spacing_interval     = float(pars['spacing_pref']['interval']),
+            spacing_n_bins       = pars['spacing_pref']['n_bins'],
+            spacing_preference   = pars['spacing_pref']['preference'],
+            method_age           = float(pars['method_age']),
+            method_age_edges     = edges,
+            annual_cdf           = cdfs.annual,
+            pp0to1_cdf           = cdfs.pp[:G],
+            pp0to1_high_cdf      = cdfs.pp[G:2*G],
+            pp1to6_cdf           = cdfs.pp[2*G:].reshape(G, m, m),
+            high_parity          = pars['high_parity'],
+            pp_bins              = pp_bins,
+            bf_mu                = float(pars['breastfeeding_dur_mu']),
+            bf_beta              = float(pars['breastfeeding_dur_beta']),
+            max_lam_dur          = pars['max_lam_dur'],
+            lam_rate             = pars['lactational_amenorrhea']['rate'],
+            age_fecundity        = pars['age_fecundity'],
+            fecundity_ratio_nullip = pars['fecundity_ratio_nullip'],
+            exposure_factor      = float(pars['exposure_factor']),
+            exposure_age         = pars['exposure_age'],
+            exposure_parity      = pars['exposure_parity'],
+            method_eff           = np.array(list(methods['eff'].values()), dtype=np.float64),
+            lam_eff              = float(pars['LAM_efficacy']),
+            abortion_prob        = float(pars['abortion_prob']),
+            preg_dur_low         = pars['preg_dur_low'],
+            preg_dur_high        = pars['preg_dur_high'],
+        )
+        fpu.update_people(states, update_pars, due_deaths, flags, pp_counts, switching)
+
+        # Tabulate events
+        def find(flag):
+            return sc.findinds(flags & flag)
+
+        def total(flag):
+            return self.count(flags & flag)
+
+        live, twin, stillborn = find(fpu.DELIVERED), find(fpu.TWINS), find(fpu.STILLBORN)
+        miscarriages, abortions = find(fpu.MISCARRIAGE), find(fpu.ABORTION)
+        r = self.step_results
+        r['deaths']          += total(fpu.DIED) + total(fpu.MATERNAL_DEATH)
+        r['maternal_deaths'] += total(fpu.MATERNAL_DEATH)
+        r['infant_deaths']   += total(fpu.INFANT_DEATH)
+        r['stillbirths']      = total(fpu.STILLBORN)
+        r['births']          += total(fpu.DELIVERED) + total(fpu.TWINS)
+        r['total_births']     = r['stillbirths'] + r['births']
+        r['miscarriages']     = total(fpu.MISCARRIAGE)
+        r['pregnancies']     += total(fpu.CONCEIVED)
+        r['unintended_pregs'] += total(fpu.UNINTENDED)
+        r['abortions']        = total(fpu.ABORTION)
+        for key,count in zip(fpd.postpartum_map.keys(), pp_counts):
+            r[key] += count
+        if pars['track_switching']:
+            r['switching_annual']     += switching[0]
+            r['switching_postpartum'] += switching[1]
+        if pars['track_as']:
+            self.count_age_groups('stillbirths', (flags & fpu.STILLBORN) > 0)
+            self.count_age_groups('births', (flags & fpu.DELIVERED) > 0)
+            self.count_age_groups('infant_deaths', (flags & fpu.INFANT_DEATH) > 0)
+            self.count_age_groups('maternal_deaths', (flags & fpu.MATERNAL_DEATH) > 0)
+            self.count_age_groups('pregnancies', ((flags & fpu.CONCEIVED) > 0) * ((flags & fpu.ABORTION) == 0))
+        delivered = self.filter(inds=live)
+        live_age = delivered.age
+        for key, (age_low, age_high) in fpd.age_bin_map.items():
+            r['birth_bins'][key] += delivered.count((live_age >= age_low) * (live_age < age_high))
+
+        # Record event histories
+        first = live[self.dobs.counts[live] == 0]
+        self.first_birth_age[first] = self.age[first]
+        self.dobs.append(live, self.age[live])
+        self.still_dates.append(stillborn, self.age[stillborn])
+        self.miscarriage_dates.append(miscarriages, self.age[miscarriages])
+        self.abortion_dates.append(abortions, self.age[abortions])
+        if pars['sampling_rates'] is None: # Weighted births are sampled by sex rather than by mother; see Sim.make_births()
+            n_children = 1 + ((flags[live] & fpu.TWINS) > 0) - ((flags[live] & fpu.INFANT_DEATH) > 0)
+            mothers = np.repeat(live, n_children) # Children are added in Sim.run() with UIDs assigned in this order
+            self.children.append(mothers, self._next_uid + np.arange(len(mothers)))
         return
 
 
@@ -855,45 +991,45 @@ class People(fpb.BasePeople):
         t is the time in the simulation in years (ie, 0-60), y is years of simulation (ie, 1960-2010)'''
 
         self.init_step_results()   # Initialize outputs
-        alive_start = self.filter(self.alive)
-        alive_start.check_mortality()  # Decide if person dies at this t in the simulation
-        alive_check = self.filter(self.alive)  # Reselect live agents after exposure to general mortality
-
-        # Update pregnancy with maternal mortality outcome
-        preg = alive_check.filter(alive_check.pregnant)
-        preg.check_delivery()  # Deliver with birth outcomes if reached pregnancy duration
-
-        # Reselect for live agents after exposure to maternal mortality
-        alive_now = self.filter(self.alive)
-        fecund = alive_now.filter((alive_now.sex == 0) * (alive_now.age < alive_now.pars['age_limit_fecundity']))
-        nonpreg = fecund.filter(~fecund.pregnant)
-        lact    = fecund.filter(fecund.lactating)
-        methods = nonpreg.filter(nonpreg.age >= self.pars['method_age'])
-
-        # Update everything else
-        preg.update_pregnancy()  # Advance gestation in timestep, handle miscarriage
-        nonpreg.check_sexually_active()
-        methods.update_methods()
-        nonpreg.update_postpartum() # Updates postpartum counter if postpartum
-        lact.update_breastfeeding()
-        nonpreg.check_lam()
-        nonpreg.check_conception()  # Decide if conceives and initialize gestation counter at 0
+        if self.pars['engine'] == 'numba':
+            self.update_compiled() # Everything from mortality to conception in a single pass
+            alive_now = self.filter(self.alive)
+        else:
+            alive_start = self.filter(self.alive)
+            alive_start.check_mortality()  # Decide if person dies at this t in the simulation
+            alive_check = self.filter(self.alive)  # Reselect live agents after exposure to general mortality
+
+            # Update pregnancy with maternal mortality outcome
+            preg = alive_check.filter(alive_check.pregnant)
+            preg.check_delivery()  # Deliver with birth outcomes if reached pregnancy duration
+
+            # Reselect for live agents after exposure to maternal mortality
+            alive_now = self.filter(self.alive)
+            fecund = alive_now.filter((alive_now.sex == 0) * (alive_now.age < alive_now.pars['age_limit_fecundity']))
+            nonpreg = fecund.filter(~fecund.pregnant)
+            lact    = fecund.filter(fecund.lactating)
+            methods = nonpreg.filter(nonpreg.age >= self.pars['method_age'])
+
+            # Update everything else
+            preg.update_pregnancy()  # Advance gestation in timestep, handle miscarriage
+            nonpreg.check_sexually_active()
+            methods.update_methods()
+            nonpreg.update_postpartum() # Updates postpartum counter if postpartum
+            lact.update_breastfeeding()
+            nonpreg.check_lam()
+            nonpreg.check_conception()  # Decide if conceives and initialize gestation counter at 0
 
         # Update results
-        fecund.update_age_bin_totals()
-        self.track_mcpr()
-        self.track_cpr()
-        self.track_acpr()
-        age_min = self.age >= 15  # CK: TODO: remove hardcoding
-        age_max = self.age < self.pars['age_limit_fecundity']
-        self.step_results['total_women_fecund'] = np.sum(self.is_female * age_min * age_max)
+        self.track_prevalence()
 
         # Age person at end of timestep after tabulating results
         alive_now.update_age()  # Important to keep this here so birth spacing gets recorded accurately
+        if self.male_counts is not None:
+            self.update_men()
 
         # Storing ages by method age group
         age_bins = [0] + [max(fpd.age_specific_channel_bins[key]) for key in fpd.age_specific_channel_bins]
-        self.age_by_group = np.digitize(self.age, age_bins) - 1
+        self.set(age_by_group=np.digitize(self.age, age_bins) - 1) # In place, so it stays a view of its buffer
 
         return self.step_results
 
@@ -980,85 +1116,158 @@ class Sim(fpb.BaseSim):
         self.test_mode   = False
         self.label       = label
         self.track_children  = track_children
+        self.sampling        = None # Strata for sampling agents; see init_sampling()
+        self.timelines       = None # Parameters for each timestep; see init_timelines()
+        self.people          = None # Created by init_people()
         fpu.set_metadata(self) # Set version, date, and git info
         return
 
 
     def initialize(self, force=False):
         if force or not self.initialized:
+            if self['engine'] not in ['numpy', 'numba', 'cohort']:
+                errormsg = f'Engine "{self["engine"]}" not recognized; choices are "numpy", "numba", or "cohort"'
+                raise ValueError(errormsg)
+            if fpd.mpy % self['timestep']:
+                errormsg = f'The timestep must be a number of months that divides a year (1, 2, 3, 4, 6, or 12), not {self["timestep"]}'
+                raise ValueError(errormsg)
+            if self['mortality_sampling'] not in ['trials', 'times']:
+                errormsg = f'Mortality sampling "{self["mortality_sampling"]}" not recognized; choices are "trials" or "times"'
+                raise ValueError(errormsg)
+            if self['mortality_sampling'] == 'times' and self['engine'] == 'cohort':
+                errormsg = f'Sampling times of death (mortality_sampling="times") is not supported with engine="{self["engine"]}"'
+                raise NotImplementedError(errormsg)
+            if self['rng'] not in ['global', 'streams']:
+                errormsg = f'Random numbers "{self["rng"]}" not recognized; choices are "global" or "streams"'
+                raise ValueError(errormsg)
+            if self['rng'] == 'streams' and self['engine'] == 'cohort':
+                errormsg = f'Counter-based random streams (rng="streams") are not supported with engine="{self["engine"]}"'
+                raise NotImplementedError(errormsg)
+            if self['engine'] == 'cohort' and (self['track_as'] or self['track_switching']):
+                errormsg = 'Age-specific tracking (track_as) and method switching tracking (track_switching) are not supported with engine="cohort"'
+                raise NotImplementedError(errormsg)
+            if self['sampling_rates'] is not None and (self['aggregate_men'] or self['track_switching'] or self.track_children):
+                errormsg = 'Sampling weights (sampling_rates) are not supported with aggregate_men, track_switching, or track_children'
+                raise NotImplementedError(errormsg)
             fpu.set_seed(self['seed'])
+            self.pars.reset_method_cache() # In case the raw matrices were modified directly
             self.init_results()
+            self.init_timelines()
+            self.init_sampling()
             self.init_people()
         return self
 
 
     def init_results(self):
+        '''
+        Allocate the results (see fpb.Results): the channels by timestep, e.g. births,
+        and by year, e.g. pop_size, filled in during the run.
+        '''
         resultscols = ['t', 'pop_size_months','pregnancies', 'births', 'deaths', 'stillbirths', 'miscarriages','abortions', 'total_births', 'maternal_deaths', 'infant_deaths',
                        'cum_maternal_deaths', 'cum_infant_deaths', 'on_methods_mcpr', 'no_methods_mcpr', 'on_methods_cpr', 'no_methods_cpr', 'on_methods_acpr',
-                       'no_methods_acpr', 'mcpr', 'cpr', 'acpr', 'pp0to5', 'pp6to11', 'pp12to23', 'nonpostpartum', 'total_women_fecund', 'unintended_pregs', 'birthday_fraction',
+                       'no_methods_acpr', 'mcpr', 'cpr', 'acpr', 'pp0to5', 'pp6to11', 'pp12to23', 'nonpostpartum', 'total_women_fecund', 'unintended_pregs',
                        'total_births_10-14', 'total_births_15-19', 'total_births_20-24', 'total_births_25-29', 'total_births_30-34', 'total_births_35-39', 'total_births_40-44',
                        'total_births_45-49', 'total_women_10-14', 'total_women_15-19', 'total_women_20-24', 'total_women_25-29', 'total_women_30-34', 'total_women_35-39',
                        'total_women_40-44', 'total_women_45-49']
-        self.results = {}
-        for key in resultscols:
-            self.results[key] = np.zeros(int(self.npts))
-        self.results['tfr_years'] = [] # CK: TODO: refactor into loop with keys
-        self.results['tfr_rates'] = []
-        self.results['pop_size'] = []
-        self.results['mcpr_by_year'] = []
-        self.results['cpr_by_year']  = []
-        self.results['method_failures_over_year'] = []
-        self.results['infant_deaths_over_year'] = []
-        self.results['total_births_over_year'] = []
-        self.results['live_births_over_year'] = []
-        self.results['stillbirths_over_year'] = []
-        self.results['miscarriages_over_year'] = []
-        self.results['abortions_over_year'] = []
-        self.results['pregnancies_over_year'] = []
-        self.results['risky_pregs_over_year'] = []
-        self.results['maternal_deaths_over_year'] = []
-        self.results['mmr'] = []
-        self.results['imr'] = []
-        self.results['birthday_fraction'] = []
-        self.results['asfr'] = {}
-        self.results['method_usage'] = []
+        yearcols = ['tfr_years', 'tfr_rates', 'pop_size', 'mcpr_by_year', 'cpr_by_year', 'method_failures_over_year', 'infant_deaths_over_year',
+                    'total_births_over_year', 'live_births_over_year', 'stillbirths_over_year', 'miscarriages_over_year', 'abortions_over_year',
+                    'pregnancies_over_year', 'maternal_deaths_over_year', 'mmr', 'imr']
+        yearcols += [f'tfr_{key}' for key in fpd.age_bin_map.keys()]
+        if self.pars['track_as']:
+            resultscols += [f'{channel}_{age_group}' for channel in ['acpr', 'cpr', 'mcpr', 'pregnancies', 'births'] for age_group in fpd.age_specific_channel_bins]
+            yearcols    += [f'{channel}_{age_group}' for channel in ['imr', 'mmr', 'stillbirths'] for age_group in fpd.age_specific_channel_bins]
+        yearcols += [f'cum_{key}_by_year' for key in ['maternal_deaths', 'infant_deaths', 'live_births', 'stillbirths', 'miscarriages', 'abortions', 'pregnancies']]
 
-        for key in fpd.age_bin_map.keys():
-            self.results['asfr'][key] = []
-            self.results[f"tfr_{key}"] = []
+        nyears = len(range(0, self.npts, fpd.mpy // self['timestep'])) # Yearly results are for the first timestep of each year
+        self.results = fpb.Results(npts=self.npts, nyears=nyears, keys=resultscols, year_keys=yearcols)
+        self.results['birthday_fraction'] = np.zeros(0) # Not currently computed
+        self.results['risky_pregs_over_year'] = np.zeros(0) # Not currently computed
+        self.results['asfr'] = {key:np.zeros(nyears) for key in fpd.age_bin_map.keys()}
+        self.results['method_usage'] = np.zeros((nyears, len(self['methods']['eff'])))
 
         if self['track_switching']:
             m = len(self['methods']['map'])
-            keys = [
-                'switching_events_annual',
-                'switching_events_postpartum',
-                'switching_events_<18',
-                'switching_events_18-20',
-                'switching_events_21-25',
-                'switching_events_26-35',
-                'switching_events_>35',
-                'switching_events_pp_<18',
-                'switching_events_pp_18-20',
-                'switching_events_pp_21-25',
-                'switching_events_pp_26-35',
-                'switching_events_pp_>35',
-            ]
-            for key in keys:
-                self.results[key] = {} # CK: TODO: refactor
-                for p in range(self.npts):
-                    self.results[key][p] = np.zeros((m, m), dtype=int)
+            shape = (self.npts, len(fpd.method_age_map), m, m) # Timestep × age group × old method × new method; see Sim.get_switching()
+            self.results['switching_annual']     = np.zeros(shape)
+            self.results['switching_postpartum'] = np.zeros(shape)
+
+        return
+
+
+    def init_timelines(self):
+        '''
+        Compile the parameters that vary by year into arrays with one entry per
+        timestep, so that each timestep only indexes into them: the trends in
+        general, infant, maternal and stillbirth mortality and in mCPR, and the
+        probability of death per timestep by age for women (f_probs) and men (m_probs).
+        Called on initialization, and by ``fp.change_par()`` since they depend on
+        the parameters.
+        '''
+        years = self.ind2calendar(np.arange(self.npts))
+        timelines = sc.objdict(year=years)
+
+        # Mortality trends, using the year of data closest to each timestep
+        mapping = {
+            'age_mortality':      'gen_trend',
+            'infant_mortality':   'infant',
+            'maternal_mortality': 'maternal',
+            'stillbirth_rate':    'stillbirth',
+        }
+        for key1,key2 in mapping.items():
+            inds = sc.findnearest(self[key1]['year'], years)
+            timelines[key2] = np.asarray(self[key1]['probs'])[inds]
+
+        # Probability of death per timestep by age
+        for sex in ['f', 'm']:
+            spline = self['age_mortality'][f'{sex}_spline']
+            timelines[f'{sex}_probs'] = fpu.annprob2ts(timelines.gen_trend[:,None] * spline, self['timestep'])
+
+        # Cumulative hazard of death before each timestep by age, for sampling times of death instead; see People.schedule_deaths()
+        for sex in ['f', 'm']:
+            probs = timelines[f'{sex}_probs'].copy()
+            probs[:,0] = 0 # General mortality is for people over one year old; see People.check_mortality()
+            hazards = -np.log1p(-np.minimum(probs, 1-1e-15))
+            timelines[f'{sex}_cum_hazards'] = np.vstack([np.zeros((1, hazards.shape[1])), hazards.cumsum(axis=0)])
+
+        # Trend in mCPR, using the year of data closest to each timestep, and extrapolating after the last
+        methods = self['methods']
+        trend_years = methods['mcpr_years']
+        trend_vals  = methods['mcpr_rates']
+        inds        = sc.findnearest(trend_years, years)
+        norm_val    = trend_vals[sc.findnearest(trend_years, self['mcpr_norm_year'])] # Normalization value
+        nearest_val = trend_vals[inds]
+        eps = 1e-3 # Epsilon for lowest allowed MCPR value (to avoid divide by zero errors)
+        correction = self['mcpr_growth_rate']*(years - trend_years[inds]) # Project the change in MCPR
+        extrapolated_val = np.clip(nearest_val*(1 + correction), eps, self['mcpr_max']) # Ensure it stays within bounds
+        trend_val = np.where(years > max(trend_years), extrapolated_val, nearest_val)
+        timelines['mcpr_trend'] = trend_val/norm_val # Normalize so the correction factor is 1 at the normalization year
+
+        self.timelines = timelines
+
+        # Resample times of death if the timelines change during the run, e.g. with fp.change_par()
+        if self.people is not None and self['mortality_sampling'] == 'times':
+            self.people.calendar.cancel('death')
+            self.people.filter(self.people.alive).schedule_deaths(timelines)
+        return
 
-        if self.pars['track_as']:
-            self.results['imr_age_by_group'] = []
-            self.results['mmr_age_by_group'] = []
-            self.results['stillbirth_ages'] = []
-            for age_specific_channel in ['acpr', 'cpr', 'mcpr', 'pregnancies', 'births', 'imr_numerator', 'imr_denominator', 'mmr_numerator', 'mmr_denominator', 'imr', 'mmr', 'as_stillbirths', 'stillbirths']:
-                for age_group in fpd.age_specific_channel_bins:
-                    if 'numerator' in age_specific_channel or 'denominator' in age_specific_channel or 'as_' in age_specific_channel:
-                        self.results[f"{age_specific_channel}"] = []
-                    else:
-                        self.results[f"{age_specific_channel}_{age_group}"] = []
 
+    def init_sampling(self):
+        '''
+        For pars['sampling_rates'], find the probability of sampling an agent from
+        each stratum (age bin of the age pyramid and sex), and the number of people
+        each agent in the stratum represents, such that the weights sum to n_agents
+        on average.
+        '''
+        self.sampling = None
+        if self['sampling_rates'] is not None:
+            pyramid = self['age_pyramid']
+            props = pyramid[:,1:3] / pyramid[:,1:3].sum() # Proportion of people in each stratum; columns are male, female
+            rates = np.broadcast_to(np.asarray(self['sampling_rates'], dtype=np.float64), props.shape)
+            if (rates <= 0).any():
+                errormsg = f'Sampling rates must be positive, not {self["sampling_rates"]}'
+                raise ValueError(errormsg)
+            probs = props*rates/(props*rates).sum()
+            self.sampling = sc.objdict(probs=probs, weights=sc.safedivide(props, probs, default=1))
         return
 
 
@@ -1067,14 +1276,23 @@ class Sim(fpb.BaseSim):
         pyramid = self['age_pyramid']
         self.m_frac = pyramid[:,1].sum() / pyramid[:,1:3].sum()
 
+        age_data_min   = pyramid[:,0]
+        age_data_max   = np.append(pyramid[1:,0], self['max_age'])
+        age_data_range = age_data_max - age_data_min
+
+        # Choose the stratum (age bin and sex) of weighted agents
+        if self.sampling is not None:
+            strata = np.random.choice(self.sampling.probs.size, size=n, p=self.sampling.probs.ravel()) # Not fpu.n_multinomial(), whose stream after set_seed() repeats NumPy's
+            age_bins, cols = np.divmod(strata, 2)
+            ages = age_data_min[age_bins] + age_data_range[age_bins]*np.random.random(n)
+            sexes = cols == 0 # The first column is men
+            return ages, sexes
+
         ages = np.zeros(n)
         sexes = np.random.random(n) < self.m_frac  # Pick the sex based on the fraction of men vs. women
         f_inds = sc.findinds(sexes == 0)
         m_inds = sc.findinds(sexes == 1)
 
-        age_data_min   = pyramid[:,0]
-        age_data_max   = np.append(pyramid[1:,0], self['max_age'])
-        age_data_range = age_data_max - age_data_min
         for i,inds in enumerate([m_inds, f_inds]):
             if len(inds):
                 age_data_prob  = pyramid[:,i+1]
@@ -1096,88 +1314,101 @@ class Sim(fpb.BaseSim):
         debut_age = self['debut_age']['ages'][fpu.n_multinomial(self['debut_age']['probs'], n)]
         fertile = fpu.n_binomial(1 - self['primary_infertility'], n)
         data = dict(age=age, sex=sex, method=method, barrier=barrier, debut_age=debut_age, fertile=fertile)
+        if self.sampling is not None:
+            age_bins = np.searchsorted(self['age_pyramid'][:,0], age, side='right') - 1
+            data['weight'] = self.sampling.weights[age_bins, 1-np.asarray(sex, dtype=np.int64)]
         return data
 
 
+    def make_births(self, n):
+        '''
+        Set up the babies born this timestep who survive infancy. Without sampling
+        weights, there is one agent per baby. With pars['sampling_rates'], n is the
+        weighted number of babies, and the number of agents of each sex is the
+        expected number of babies of that sex divided by the weight of newborns of
+        that sex, rounded up or down at random.
+
+        Args:
+            n (int/float): the number of babies
+        '''
+        if self.sampling is None:
+            return self.make_people(n=n, age=np.zeros(n))
+        weights  = self.sampling.weights[0] # Newborns are in the first age bin; columns are male, female
+        expected = n * np.array([self.m_frac, 1-self.m_frac]) / weights
+        counts   = np.floor(expected + np.random.random(2)).astype(np.int64)
+        sex = np.repeat([1, 0], counts)
+        return self.make_people(n=len(sex), age=np.zeros(len(sex)), sex=sex)
+
+
+    def remove_men(self, data, births=False):
+        '''
+        Remove men from the data returned by make_people(), for pars['aggregate_men'],
+        returning their ages as data['male_ages'] so People counts them by age instead.
+
+        Args:
+            data (dict): the data for the new people
+            births (bool): whether the new people are this timestep's births, in which case sons are recorded in people.children with a UID of -1
+        '''
+        female = np.asarray(data['sex']) == 0
+        new = {k:np.asarray(v)[female] for k,v in data.items()}
+        new['male_ages'] = np.asarray(data['age'])[~female]
+        if births: # Children were recorded in order with UIDs from people._next_uid; only daughters will be created
+            start_uid = self.people._next_uid
+            children  = self.people.children
+            events    = sc.findinds(children.values >= start_uid)
+            uids      = np.where(female, start_uid + np.cumsum(female) - 1, -1)
+            children.set_values(events, uids[children.values[events] - start_uid])
+        return new
+
+
     def init_people(self, output=False, **kwargs):
-        ''' Create the people '''
+        ''' Create the people, or the expected numbers of people if pars['engine'] is 'cohort' '''
+        if self['engine'] == 'cohort':
+            self.people = fpc.Cohort(pars=self.pars)
+            return
         p = sc.objdict(self.make_people(n=int(self['n_agents'])))
-        self.people = People(pars=self.pars, age=p.age, sex=p.sex, method=p.method, barrier=p.barrier, debut_age=p.debut_age, fertile=p.fertile)
+        if self['aggregate_men']:
+            p = sc.objdict(self.remove_men(p))
+        self.people = People(pars=self.pars, n=len(p.age), **p)
+        if self['mortality_sampling'] == 'times':
+            self.people.schedule_deaths(self.timelines)
         return
 
 
     def update_methods(self):
         '''
         Update all contraceptive method matrices to have probabilities that follow a trend closest to the
-        year the sim is on based on mCPR in that year
+        year the sim is on based on mCPR in that year (see ``init_timelines()``). The adjusted matrices
+        are cached by ``Pars.method_matrices()``, so they are only recomputed when the trend changes.
         '''
 
         methods = self['methods'] # Shorten methods
-        methods['adjusted'] = sc.dcp(methods['raw']) # Avoids needing to copy this within loops later
 
-        # Compute the trend in MCPR
-        trend_years = methods['mcpr_years']
-        trend_vals  = methods['mcpr_rates']
-        ind      = sc.findnearest(trend_years, self.y) # The year of data closest to the sim year
-        norm_ind = sc.findnearest(trend_years, self['mcpr_norm_year']) # The year we're using to normalize
-
-        nearest_val = trend_vals[ind] # Nearest MCPR value from the data
-        norm_val    = trend_vals[norm_ind] # Normalization value
-        if self.y > max(trend_years): # We're after the last year of data: extrapolate
-            eps = 1e-3 # Epsilon for lowest allowed MCPR value (to avoid divide by zero errors)
-            nearest_year = trend_years[ind]
-            year_diff  = self.y - nearest_year
-            correction = self['mcpr_growth_rate']*year_diff # Project the change in MCPR
-            extrapolated_val = nearest_val*(1 + correction) # Multiply the current value by the projection
-            trend_val  = np.clip(extrapolated_val, eps, self['mcpr_max']) # Ensure it stays within bounds
-        else: # Otherwise, just use the nearest data point
-            trend_val = nearest_val
-        norm_trend_val  = trend_val/norm_val # Normalize so the correction factor is 1 at the normalization year
-
-        # Update annual (non-postpartum) population and postpartum switching matrices for current year mCPR - stratified by age
-        for switchkey in ['annual', 'pp1to6']:
-            for matrix in methods['adjusted'][switchkey].values():
-                matrix[0, 0] /= norm_trend_val  # Takes into account mCPR during year of sim
-                for i in range(len(matrix)):
-                    denom = matrix[i,:].sum()
-                    if denom > 0:
-                        matrix[i,:] = matrix[i, :] / denom  # Normalize so probabilities add to 1
-
-        # Update postpartum initiation matrices for current year mCPR - stratified by age
-        for matrix in methods['adjusted']['pp0to1'].values():
-            matrix[0] /= norm_trend_val  # Takes into account mCPR during year of sim
-            matrix /= matrix.sum()
+        # Look up the switching matrices for current year mCPR, and the tables to sample from them
+        matrices = self.pars.method_matrices(self.timelines.mcpr_trend[self.i])
+        methods['adjusted'] = matrices.adjusted
+        methods['cdfs']     = matrices
 
         return
 
 
     def update_mortality(self):
-        ''' Update infant and maternal mortality for the sim's current year.  Update general mortality trend
-        as this uses a spline interpolation instead of an array'''
-
-        mapping = {
-            'age_mortality':      'gen_trend',
-            'infant_mortality':   'infant',
-            'maternal_mortality': 'maternal',
-            'stillbirth_rate':    'stillbirth',
-        }
-
-        self['mortality_probs'] = {}
-        for key1,key2 in mapping.items():
-            ind = sc.findnearest(self[key1]['year'], self.y)
-            val = self[key1]['probs'][ind]
-            self['mortality_probs'][key2] = val
-
+        ''' Update infant and maternal mortality, and the general mortality trend and probabilities
+        of death by age, for the sim's current year, from the timelines (see ``init_timelines()``) '''
+        keys = ['gen_trend', 'infant', 'maternal', 'stillbirth', 'f_probs', 'm_probs']
+        self['mortality_probs'] = {key:self.timelines[key][self.i] for key in keys}
         return
 
 
     def update_mothers(self):
         '''Add link between newly added individuals and their mothers'''
         all_ppl = self.people.unfilter()
-        for mother_index, postpartum in enumerate(all_ppl.postpartum):
-            if postpartum and all_ppl.postpartum_dur[mother_index] < 2:
-                for child in all_ppl.children[mother_index]:
-                    all_ppl.mothers[child] = mother_index
+        new_mothers = sc.findinds(all_ppl.postpartum * (all_ppl.postpartum_dur < 2))
+        children = all_ppl.children
+        is_new   = np.isin(children.owners, new_mothers)
+        uids     = children.values[is_new] # Children are stored as UIDs
+        found    = np.isin(uids, all_ppl.uid) # Children who have died may have been removed by compact()
+        all_ppl.mothers[all_ppl.uid2ind(uids[found])] = all_ppl.uid[children.owners[is_new][found]]
         return
 
 
@@ -1242,7 +1473,9 @@ class Sim(fpb.BaseSim):
             raise RuntimeError(errormsg)
 
         # Main simulation loop
-
+        spy = fpd.mpy // self['timestep'] # Timesteps per year
+        if self.pars['track_as']:
+            as_ring = np.zeros((spy, len(fpd.age_specific_counts), len(fpd.age_specific_channel_bins))) # Ring buffer of the age-specific counts of the last year of timesteps
         for i in range(self.npts):  # Range over number of timesteps in simulation (ie, 0 to 261 steps)
             self.i = i # Timestep
             self.t = self.ind2year(i)  # t is time elapsed in years given how many timesteps have passed (ie, 25.75 years)
@@ -1259,6 +1492,10 @@ class Sim(fpb.BaseSim):
                     if not (self.t % int(1.0/verbose)):
                         sc.progressbar(self.i+1, self.npts, label=string, length=20, newline=True)
 
+            # Set the people's timestep first, since interventions may schedule events (e.g. fp.change_par() with pars['mortality_sampling'])
+            self.people.i = self.i
+            self.people.t = self.t
+
             # Update method matrices for year of sim to trend over years
             self.update_methods()
 
@@ -1270,23 +1507,28 @@ class Sim(fpb.BaseSim):
             self.apply_analyzers()
 
             # Update the people
-            self.people.i = self.i
-            self.people.t = self.t
             step_results = self.people.update()
             r = sc.dictobj(**step_results)
 
-            # Start calculating results
-            new_people = r.births - r.infant_deaths # Do not add agents who died before age 1 to population
+            # Births; the cohort engine adds the expected number of births itself
+            if self['engine'] != 'cohort':
+                new_people = r.births - r.infant_deaths # Do not add agents who died before age 1 to population
+                data = self.make_births(new_people)
+                if self['aggregate_men']:
+                    data = self.remove_men(data, births=True)
 
-            # Births
-            data = self.make_people(n=new_people, age=np.zeros(new_people))
+                people = People(pars=self.pars, n=len(data['age']), i=i+1, **data)
+                if self['mortality_sampling'] == 'times':
+                    people.schedule_deaths(self.timelines)
+                self.people += people
 
-            people = People(pars=self.pars, n=new_people, **data)
-            self.people += people
+                # Update mothers
+                if self.track_children:
+                    self.update_mothers()
 
-            # Update mothers
-            if self.track_children:
-                self.update_mothers()
+                # Remove dead people from the arrays
+                if self['compact_dead'] and not (i % self['compact_dead']):
+                    self.people.compact()
 
             # Results
             percent0to5   = (r.pp0to5 / r.total_women_fecund) * 100
@@ -1327,14 +1569,14 @@ class Sim(fpb.BaseSim):
             self.results['unintended_pregs'][i]   = r.unintended_pregs*scale
 
             if self.pars['track_as']:
-                for age_specific_channel in ['imr_numerator', 'imr_denominator', 'mmr_numerator', 'mmr_denominator', 'as_stillbirths', 'imr_age_by_group', 'mmr_age_by_group', 'stillbirth_ages']:
-                    self.results[f"{age_specific_channel}"].append(getattr(r, f"{age_specific_channel}"))
-                    if len(self.results[f"{age_specific_channel}"]) > 12:
-                        self.results[f"{age_specific_channel}"] = self.results[f"{age_specific_channel}"][1:]
-
+                as_ring[i % spy] = r.as_counts # Overwrite the counts from a year ago
+                as_counts = dict(zip(fpd.age_specific_counts, r.as_counts))
                 for age_specific_channel in ['acpr', 'cpr', 'mcpr', 'pregnancies', 'births']:
-                    for method_agekey in fpd.age_specific_channel_bins:
-                        self.results[f"{age_specific_channel}_{method_agekey}"].append(getattr(r, f"{age_specific_channel}_{method_agekey}"))
+                    values = as_counts[age_specific_channel]
+                    if age_specific_channel in ['acpr', 'cpr', 'mcpr']:
+                        values = sc.safedivide(values, as_counts[f'{age_specific_channel}_women'])
+                    for method_agekey, value in zip(fpd.age_specific_channel_bins, values):
+                        self.results[f"{age_specific_channel}_{method_agekey}"][i] = value
 
 
             for agekey in fpd.age_bin_map.keys():
@@ -1346,85 +1588,54 @@ class Sim(fpb.BaseSim):
 
             # Store results of number of switching events in each age group
             if self['track_switching']:
-                switch_events = step_results.pop('switching')
-                self.results['switching_events_<18'][i]        = scale**scale*r.switching_annual['<18']
-                self.results['switching_events_18-20'][i]      = scale*r.switching_annual['18-20']
-                self.results['switching_events_21-25'][i]      = scale*r.switching_annual['21-25']
-                self.results['switching_events_26-35'][i]        = scale*r.switching_annual['26-35']
-                self.results['switching_events_>35'][i]        = scale*r.switching_annual['>35']
-                self.results['switching_events_pp_<18'][i]     = scale*r.switching_postpartum['<18']
-                self.results['switching_events_pp_18-20'][i]   = scale*r.switching_postpartum['18-20']
-                self.results['switching_events_pp_21-25'][i]   = scale*r.switching_postpartum['21-25']
-                self.results['switching_events_pp_26-35'][i]   = scale*r.switching_postpartum['26-35']
-                self.results['switching_events_pp_>35'][i]     = scale*r.switching_postpartum['>35']
-                self.results['switching_events_annual'][i]     = scale*switch_events['annual']
-                self.results['switching_events_postpartum'][i] = scale*switch_events['postpartum']
+                self.results['switching_annual'][i]     = scale*r.switching_annual
+                self.results['switching_postpartum'][i] = scale*r.switching_postpartum
 
             # Calculate metrics over the last year in the model and save whole years and stats to an array
-            if i % fpd.mpy == 0:
-                self.results['tfr_years'].append(self.y)
-                start_index = (int(self.t)-1)*fpd.mpy
-                stop_index = int(self.t)*fpd.mpy
-                unintended_pregs_over_year = scale*np.sum(self.results['unintended_pregs'][start_index:stop_index]) # Grabs sum of unintended pregnancies due to method failures over the last 12 months of calendar year
-                infant_deaths_over_year    = scale*np.sum(self.results['infant_deaths'][start_index:stop_index])
-                total_births_over_year     = scale*np.sum(self.results['total_births'][start_index:stop_index])
-                live_births_over_year      = scale*np.sum(self.results['births'][start_index:stop_index])
-                stillbirths_over_year      = scale*np.sum(self.results['stillbirths'][start_index:stop_index])
-                miscarriages_over_year     = scale*np.sum(self.results['miscarriages'][start_index:stop_index])
-                abortions_over_year        = scale*np.sum(self.results['abortions'][start_index:stop_index])
-                maternal_deaths_over_year  = scale*np.sum(self.results['maternal_deaths'][start_index:stop_index])
-                pregnancies_over_year  = scale*np.sum(self.results['pregnancies'][start_index:stop_index])
-                self.results['method_usage'].append(self.compute_method_usage()) # only want this per year
-                self.results['pop_size'].append(scale*self.n) # CK: TODO: replace with arrays
-                self.results['mcpr_by_year'].append(self.results['mcpr'][i])
-                self.results['cpr_by_year'].append(self.results['cpr'][i])
-                self.results['method_failures_over_year'].append(unintended_pregs_over_year)
-                self.results['infant_deaths_over_year'].append(infant_deaths_over_year)
-                self.results['total_births_over_year'].append(total_births_over_year)
-                self.results['live_births_over_year'].append(live_births_over_year)
-                self.results['stillbirths_over_year'].append(stillbirths_over_year)
-                self.results['miscarriages_over_year'].append(miscarriages_over_year)
-                self.results['abortions_over_year'].append(abortions_over_year)
-                self.results['maternal_deaths_over_year'].append(maternal_deaths_over_year)
-                self.results['pregnancies_over_year'].append(pregnancies_over_year)
+            if i % spy == 0:
+                y = i // spy # Index of the year
+                res = self.results
+                res['tfr_years'][y] = self.y
+                start_index = i - spy
+                stop_index = i
+                over_year = lambda key: scale*np.sum(res[key][max(start_index, 0):stop_index]) # Sum over the last 12 months of calendar year
+                res['method_failures_over_year'][y] = over_year('unintended_pregs') # Unintended pregnancies due to method failures
+                res['infant_deaths_over_year'][y]   = over_year('infant_deaths')
+                res['total_births_over_year'][y]    = over_year('total_births')
+                res['live_births_over_year'][y]     = over_year('births')
+                res['stillbirths_over_year'][y]     = over_year('stillbirths')
+                res['miscarriages_over_year'][y]    = over_year('miscarriages')
+                res['abortions_over_year'][y]       = over_year('abortions')
+                res['maternal_deaths_over_year'][y] = over_year('maternal_deaths')
+                res['pregnancies_over_year'][y]     = over_year('pregnancies')
+                res['method_usage'][y] = self.compute_method_usage() # only want this per year
+                res['pop_size'][y]     = scale*self.n
+                res['mcpr_by_year'][y] = res['mcpr'][i]
+                res['cpr_by_year'][y]  = res['cpr'][i]
 
                 if self.pars['track_as']:
-                    imr_results_dict = self.people.log_age_split(binned_ages_t=self.results['imr_age_by_group'], channel='imr',
-                                                        numerators=self.results['imr_numerator'], denominators=self.results['imr_denominator'])
-                    mmr_results_dict = self.people.log_age_split(binned_ages_t=self.results['mmr_age_by_group'], channel='mmr',
-                                                        numerators=self.results['mmr_numerator'], denominators=self.results['mmr_denominator'])
-                    stillbirths_results_dict = self.people.log_age_split(binned_ages_t=self.results['stillbirth_ages'], channel='stillbirths',
-                                                        numerators=self.results['as_stillbirths'], denominators=None)
-                    
-
-                    for age_key in fpd.age_specific_channel_bins:
-                        self.results[f"imr_{age_key}"].append(imr_results_dict[f"imr_{age_key}"])
-                        self.results[f"mmr_{age_key}"].append(mmr_results_dict[f"mmr_{age_key}"])
-                        self.results[f"stillbirths_{age_key}"].append(stillbirths_results_dict[f"stillbirths_{age_key}"])
-
-
-                if maternal_deaths_over_year == 0:
-                    self.results['mmr'].append(0)
-                else:
-                    maternal_mortality_ratio = maternal_deaths_over_year / live_births_over_year * 100000
-                    self.results['mmr'].append(maternal_mortality_ratio)
-                if infant_deaths_over_year == 0:
-                    self.results['imr'].append(infant_deaths_over_year)
-
-                else:
-                    infant_mortality_rate = infant_deaths_over_year / live_births_over_year * 1000
-                    self.results['imr'].append(infant_mortality_rate)
+                    year_counts = dict(zip(fpd.age_specific_counts, as_ring.sum(axis=0))) # Counts over the last year of timesteps, including this one
+                    imr = sc.safedivide(year_counts['infant_deaths'], year_counts['births']) * 1000
+                    mmr = sc.safedivide(year_counts['maternal_deaths'], year_counts['births']) * 100000
+                    for a, age_key in enumerate(fpd.age_specific_channel_bins):
+                        res[f"imr_{age_key}"][y] = imr[a]
+                        res[f"mmr_{age_key}"][y] = mmr[a]
+                        res[f"stillbirths_{age_key}"][y] = year_counts['stillbirths'][a]
+
+                live_births_over_year = res['live_births_over_year'][y]
+                res['mmr'][y] = sc.safedivide(res['maternal_deaths_over_year'][y], live_births_over_year) * 100000 # Maternal mortality ratio
+                res['imr'][y] = sc.safedivide(res['infant_deaths_over_year'][y], live_births_over_year) * 1000 # Infant mortality rate
 
                 tfr = 0
                 for key in fpd.age_bin_map.keys():
-                    age_bin_births_year = np.sum(self.results['total_births_'+key][start_index:stop_index])
-                    age_bin_total_women_year = self.results['total_women_'+key][stop_index]
+                    age_bin_births_year = np.sum(res['total_births_'+key][max(start_index, 0):stop_index])
+                    age_bin_total_women_year = res['total_women_'+key][stop_index]
                     age_bin_births_per_woman = sc.safedivide(age_bin_births_year, age_bin_total_women_year)
-                    self.results['asfr'][key].append(age_bin_births_per_woman*1000)
-                    self.results[f'tfr_{key}'].append(age_bin_births_per_woman * 1000)
+                    res['asfr'][key][y] = age_bin_births_per_woman*1000
+                    res[f'tfr_{key}'][y] = age_bin_births_per_woman * 1000
                     tfr += age_bin_births_per_woman # CK: TODO: check if this is right
 
-                self.results['tfr_rates'].append(tfr*5) # CK: TODO: why *5? # SB: I think this corresponds to size of age bins?
+                res['tfr_rates'][y] = tfr*5 # CK: TODO: why *5? # SB: I think this corresponds to size of age bins?
 
             if self.test_mode:
                 self.log_daily_totals()
@@ -1432,25 +1643,14 @@ class Sim(fpb.BaseSim):
         if self.test_mode:
             self.save_daily_totals()
 
-        if not self.track_children:
+        if not self.track_children and self['engine'] != 'cohort':
             delattr(self.people, "mothers")
-
-        # Convert all results to Numpy arrays
-        for key,arr in self.results.items():
-            if isinstance(arr, list):
-                self.results[key] = np.array(arr) # Convert any lists to arrays
+            self.people._keys.remove("mothers")
+            self.people._archive.pop("mothers", None)
 
         # Calculate cumulative totals
-        self.results['cum_maternal_deaths_by_year'] = np.cumsum(self.results['maternal_deaths_over_year'])
-        self.results['cum_infant_deaths_by_year']   = np.cumsum(self.results['infant_deaths_over_year'])
-        self.results['cum_live_births_by_year']     = np.cumsum(self.results['live_births_over_year'])
-        self.results['cum_stillbirths_by_year']     = np.cumsum(self.results['stillbirths_over_year'])
-        self.results['cum_miscarriages_by_year']     = np.cumsum(self.results['miscarriages_over_year'])
-        self.results['cum_abortions_by_year']     = np.cumsum(self.results['abortions_over_year'])
-        self.results['cum_pregnancies_by_year']     = np.cumsum(self.results['pregnancies_over_year'])
-
-        # Convert to an objdict for easier access
-        self.results = sc.objdict(self.results)
+        for key in ['maternal_deaths', 'infant_deaths', 'live_births', 'stillbirths', 'miscarriages', 'abortions', 'pregnancies']:
+            np.cumsum(self.results[f'{key}_over_year'], out=self.results[f'cum_{key}_by_year'])
 
         # Finalize interventions and analyzers
         self.finalize_interventions()
@@ -1473,8 +1673,8 @@ class Sim(fpb.BaseSim):
 
     def store_postpartum(self):
 
-        '''Stores snapshot of who is currently pregnant, their parity, and various
-        postpartum states in final step of model for use in calibration'''
+        '''Stores snapshot of who is currently pregnant, their parity, various
+        postpartum states, and their sampling weight in final step of model for use in calibration'''
 
         min_age = 12.5
         max_age = self['age_limit_fecundity']
@@ -1483,7 +1683,7 @@ class Sim(fpb.BaseSim):
         rows = []
         for i in range(len(ppl)):
             if ppl.alive[i] and ppl.sex[i] == 0 and min_age <= ppl.age[i] < max_age:
-                row = {'Age': None, 'PP0to5': None, 'PP6to11': None, 'PP12to23': None, 'NonPP': None, 'Pregnant': None, 'Parity': None}
+                row = {'Age': None, 'PP0to5': None, 'PP6to11': None, 'PP12to23': None, 'NonPP': None, 'Pregnant': None, 'Parity': None, 'Weight': None}
                 row['Age'] = int(round(ppl.age[i]))
                 row['NonPP'] = 1 if not ppl.postpartum[i] else 0
                 if ppl.postpartum[i]:
@@ -1493,9 +1693,10 @@ class Sim(fpb.BaseSim):
                     row['PP12to23'] = 1 if 12 <= pp_dur <= 24 else 0
                 row['Pregnant'] = 1 if ppl.pregnant[i] else 0
                 row['Parity'] = ppl.parity[i]
+                row['Weight'] = ppl.weight[i]
                 rows.append(row)
 
-        pp = pd.DataFrame(rows, index = None, columns = ['Age', 'PP0to5', 'PP6to11', 'PP12to23', 'NonPP', 'Pregnant', 'Parity'])
+        pp = pd.DataFrame(rows, index = None, columns = ['Age', 'PP0to5', 'PP6to11', 'PP12to23', 'NonPP', 'Pregnant', 'Parity', 'Weight'])
         pp.fillna(0, inplace=True)
         return pp
 
@@ -1507,7 +1708,7 @@ class Sim(fpb.BaseSim):
         Args:
             include_range (bool): if True, and if the sim results have best, high, and low, then export all of them; else just best
         '''
-        raw_res = sc.odict(defaultdict=list)
+        raw_res = sc.odict()
         for reskey in self.results.keys():
             res = self.results[reskey]
             if isinstance(res, dict):
@@ -1519,9 +1720,9 @@ class Sim(fpb.BaseSim):
                             blhkey = f'{reskey}_{blh}'
                         else:
                             blhkey = reskey
-                        raw_res[blhkey] += blhres.tolist()
-            elif sc.isarray(res) and len(res) == self.npts:
-                raw_res[reskey] += res.tolist()
+                        raw_res[blhkey] = blhres
+            elif sc.isarray(res) and res.ndim == 1 and len(res) == self.npts:
+                raw_res[reskey] = res
         df = pd.DataFrame(raw_res)
         self.df = df
         return df
@@ -1770,6 +1971,40 @@ class Sim(fpb.BaseSim):
         pl.xlabel('Age (years')
         return tidy_up(fig=fig, do_show=do_show, do_save=do_save, filename=filename)
 
+    def get_switching(self, kind='annual', yearly=False, sparse=False):
+        '''
+        Get the method switching events tracked with pars['track_switching'], by
+        timestep, age group (see fpd.method_age_map), old method and new method.
+
+        Args:
+            kind   (str):  'annual' for switching on whole calendar years, or 'postpartum' for switching after birth
+            yearly (bool): if True, sum the events over the last year before each year, as for e.g. results['live_births_over_year']
+            sparse (bool): if True, return a SciPy sparse array with a row per timestep (or year) and a column per age group, old method and new method, since most entries are zero
+
+        **Examples**::
+
+            sim = fp.Sim(track_switching=True).run()
+            events = sim.get_switching(yearly=True)
+            initiation = events[:, :, 0, 1:].sum(axis=(1, 2)) # Number of women starting any method each year
+        '''
+        if not self['track_switching']:
+            errormsg = 'Switching events are only available if pars["track_switching"] is True'
+            raise ValueError(errormsg)
+        if kind not in ['annual', 'postpartum']:
+            errormsg = f'Kind of switching "{kind}" not recognized; choices are "annual" and "postpartum"'
+            raise ValueError(errormsg)
+
+        events = self.results[f'switching_{kind}']
+        if yearly: # The events of each year are those of the timesteps since the start of the previous year
+            spy = fpd.mpy // self['timestep']
+            n = len(self.results['tfr_years']) - 1
+            by_year = np.zeros((n+1,) + events.shape[1:])
+            by_year[1:] = events[:n*spy].reshape((n, spy) + events.shape[1:]).sum(axis=1)
+            events = by_year
+        if sparse:
+            events = sps.csr_array(events.reshape(len(events), -1))
+        return events
+
     def compute_method_usage(self):
         '''
         Computes method mix proportions from a sim object
@@ -1779,20 +2014,17 @@ class Sim(fpb.BaseSim):
             fecundity aged women using that method on that year
         '''
 
+        if self['engine'] == 'cohort':
+            return self.people.method_usage()
+
         ppl = self.people
         min_age = 15
         max_age = self['age_limit_fecundity']
 
         # filtering for women with appropriate characteristics
-        bool_list = ppl.alive * [sex == 0 for sex in ppl.sex] * [min_age <= age for age in ppl.age] * [age < max_age for age in ppl.age]
-        filtered_methods = [method for index, method in enumerate(ppl.method) if bool_list[index]]
-
-        unique, counts = np.unique(filtered_methods, return_counts=True)
-        count_dict = dict(zip(unique, counts))
-
-        result = [0] * (len(self.pars['methods']['eff']))
-        for method in count_dict:
-            result[method] = count_dict[method] / len(filtered_methods)
+        women = ppl.filter(ppl.alive * (ppl.sex == 0) * (min_age <= ppl.age) * (ppl.age < max_age))
+        counts = np.bincount(women.method, weights=women.weight, minlength=len(self.pars['methods']['eff']))
+        result = list(counts / counts.sum())
 
         return result
 
@@ -1911,32 +2143,41 @@ class MultiSim(sc.prettyobj):
         base_sim = sc.dcp(self.sims[0])
         raw = sc.objdict()
         results = sc.objdict()
-        axis = 1
         start_end = np.array([sim.tvec[[0, -1]] for sim in self.sims])
         if len(np.unique(start_end)) != 2:
             errormsg = f'Cannot compute stats for sims: start and end values do not match:\n{start_end}'
             raise ValueError(errormsg)
 
         reskeys = list(base_sim.results.keys())
-        if self.sims[0].pars['track_as']:
-            for bad_key in ['imr_numerator', 'imr_denominator', 'mmr_numerator', 'mmr_denominator', 'imr_age_by_group', 'mmr_age_by_group', 'as_stillbirths', 'stillbirth_ages']:
-                reskeys.remove(bad_key) # these keys are intermediate results so we don't really want to save them
-
         bad_keys = ['t', 'tfr_years', 'method_usage']
         for key in bad_keys: # Don't compute high/low for these
             results[key] = base_sim.results[key]
             reskeys.remove(key)
+
+        # Stack the channels by timestep and by year of all the sims (see fpb.Results), to compute their statistics at once
+        stats = {}
+        for kind in ['timestep', 'year']:
+            stack = np.stack([sim.results.block(kind) for sim in self.sims], axis=-1) # Channel × time × sim
+            if use_mean:
+                r_mean = np.mean(stack, axis=-1)
+                r_std = np.std(stack, axis=-1)
+                best, low, high = r_mean, r_mean - bounds * r_std, r_mean + bounds * r_std
+            else:
+                best, low, high = [np.quantile(stack, q=q, axis=-1) for q in [0.5, quantiles['low'], quantiles['high']]]
+            for c,key in enumerate(base_sim.results.channels(kind)):
+                stats[key] = stack[c], sc.objdict(best=best[c], low=low[c], high=high[c])
+
         for reskey in reskeys:
-            if isinstance(base_sim.results[reskey], dict):
+            if reskey in stats:
+                raw[reskey], results[reskey] = stats[reskey]
+            elif isinstance(base_sim.results[reskey], dict):
                 if return_raw:
                     for s, sim in enumerate(self.sims):
                         raw[reskey][s] = base_sim.results[reskey]
             else:
                 results[reskey] = sc.objdict()
-                npts = len(base_sim.results[reskey])
-                raw[reskey] = np.zeros((npts, len(self.sims)))
-                for s,sim in enumerate(self.sims):
-                    raw[reskey][:, s] = sim.results[reskey] # Stack into an array for processing
+                raw[reskey] = np.stack([sim.results[reskey] for sim in self.sims], axis=-1) # Stack into an array for processing, e.g. timestep × sim
+                axis = -1
 
                 if use_mean:
                     r_mean = np.mean(raw[reskey], axis=axis)
@@ -2087,7 +2328,7 @@ class MultiSim(sc.prettyobj):
             for s,sim in enumerate(self.sims):
                 for reskey in sim.results.keys():
                     res = sim.results[reskey]
-                    if sc.isarray(res):
+                    if sc.isarray(res) and res.ndim <= 2: # Not the switching events by age group and method
                         if len(res) == sim.npts and not yearly:
                             raw_res[reskey] += res.tolist()
                         elif len(res) == len(sim.results['tfr_years']) and yearly:
@@ -2,6 +2,8 @@
 File for storing utilities and probability calculators needed to run FP model
 '''
 
+import zlib
+from collections import namedtuple
 import numpy as np
 import sciris as sc
 import numba as nb
@@ -10,7 +12,7 @@ from . import version as fpv
 
 
 # Specify all externally visible things this file defines
-__all__ = ['set_seed', 'bt', 'bc', 'rbt', 'mt', 'sample']
+__all__ = ['set_seed', 'bt', 'bc', 'rbt', 'mt', 'sample', 'stream_random']
 
 
 def set_seed(seed=None):
@@ -74,6 +76,46 @@ def n_multinomial(probs, n):
     return np.searchsorted(np.cumsum(probs), np.random.random(n))
 
 
+def n_multinomial_cdf(cdfs, rands=None):
+    '''
+    An array of multinomial trials, each with its own probabilities, given as
+    cumulative probabilities so that each outcome is a single inverse-CDF lookup.
+
+    Args:
+        cdfs (array): 2D array of the cumulative probability of each outcome (columns) for each trial (rows)
+        rands (array): uniform random numbers for the trials, e.g. from ``people.random()``; drawn from the global random state if None
+
+    Returns:
+        Array of integer outcomes
+
+    **Example**::
+
+        cdfs = np.cumsum([[0.5, 0.5], [0.1, 0.9]], axis=1)
+        outcomes = fp.n_multinomial_cdf(cdfs) # The second trial is usually 1
+    '''
+    if rands is None:
+        rands = np.random.random(len(cdfs))
+    outcomes = (cdfs < rands[:,None]).sum(axis=1)
+    return np.minimum(outcomes, cdfs.shape[1]-1) # In case of rounding error in the last cumulative probability
+
+
+def digitize_ages(ages, age_map):
+    '''
+    Find the age bin of each age, e.g. for the method switching matrices.
+
+    Args:
+        ages (array): the ages
+        age_map (dict): the age bins, as [low, high) pairs in increasing order, e.g. ``fpd.method_age_map``
+
+    Returns:
+        Array of the index of the bin of each age, or -1 if it is not in any bin
+    '''
+    bins  = np.array(list(age_map.values()), dtype=np.float64)
+    inds  = np.searchsorted(bins[:,0], ages, side='right') - 1
+    valid = (inds >= 0) & (ages < bins[np.maximum(inds, 0), 1])
+    return np.where(valid, inds, -1)
+
+
 def n_binomial(prob, n):
     '''
     Perform multiple binomial (Bernolli) trials
@@ -109,12 +151,197 @@ def binomial_arr(prob_arr): # No speed gain from Numba
     return np.random.random(len(prob_arr)) < prob_arr
 
 
+@nb.njit(cache=True)
+def _philox(c0, c1, c2, c3, k0, k1):
+    ''' Ten Philox rounds on one block of four 32-bit counters (as 64-bit integers) with a 64-bit key '''
+    mask = np.uint64(0xFFFFFFFF)
+    for rnd in range(10):
+        p0 = np.uint64(0xD2511F53) * c0
+        p1 = np.uint64(0xCD9E8D57) * c2
+        c0, c1, c2, c3 = (p1 >> np.uint64(32)) ^ c1 ^ k0, p1 & mask, (p0 >> np.uint64(32)) ^ c3 ^ k1, p0 & mask
+        k0 = (k0 + np.uint64(0x9E3779B9)) & mask
+        k1 = (k1 + np.uint64(0xBB67AE85)) & mask
+    return c0, c1, c2, c3
+
+
+@nb.njit((nb.uint32[:,:], nb.uint32[:]), cache=True)
+def philox(counters, key):
+    '''
+    The Philox4x32-10 counter-based random number generator (Salmon et al., 2011),
+    as used by NumPy's ``Philox`` bit generator: each row of four 32-bit counters
+    is encrypted with the 64-bit key, giving four random 32-bit integers. Unlike
+    NumPy's, any counters can be evaluated directly, e.g. one per person.
+
+    Args:
+        counters (array): 2D array of the counters, with four columns
+        key (array): the key, as two 32-bit integers
+
+    Returns:
+        Array of random 32-bit integers the same shape as counters
+    '''
+    out = np.empty_like(counters)
+    k0, k1 = np.uint64(key[0]), np.uint64(key[1])
+    for r in range(counters.shape[0]):
+        c = _philox(np.uint64(counters[r,0]), np.uint64(counters[r,1]), np.uint64(counters[r,2]), np.uint64(counters[r,3]), k0, k1)
+        for j in range(4):
+            out[r,j] = c[j]
+    return out
+
+
+@nb.njit(cache=True)
+def _stream_uniform(uid, draw, step, stream, k0, k1):
+    ''' One uniform random number from Philox with counters (uid, draw, step, stream) and key (k0, k1); see stream_random() '''
+    c = _philox(np.uint64(uid), np.uint64(draw), np.uint64(step), np.uint64(stream), k0, k1)
+    return ((c[0] >> np.uint64(5))*67108864 + (c[1] >> np.uint64(6))) / 9007199254740992.0 # 53 random bits, as for NumPy's random()
+
+
+@nb.njit((nb.int64[:], nb.int64, nb.int64, nb.uint32, nb.uint32[:]), cache=True)
+def _stream_random(uids, draws, step, stream, key):
+    ''' Uniform random numbers from Philox with counters (uid, draw, step, stream); see stream_random() '''
+    n = len(uids)
+    out = np.empty((draws, n))
+    k0, k1 = np.uint64(key[0]), np.uint64(key[1])
+    for d in range(draws):
+        for p in range(n):
+            out[d,p] = _stream_uniform(uids[p], d, step, stream, k0, k1)
+    return out
+
+
+def stream_key(seed):
+    ''' The Philox key for a random seed, from NumPy's ``SeedSequence`` '''
+    return np.random.SeedSequence(seed).generate_state(2, dtype=np.uint32)
+
+
+def stream_random(seed, stream, step, uids, size=None):
+    '''
+    Uniform random numbers in [0, 1) from counter-based streams, one per person
+    (uid), kind of draw (stream), and timestep (step). Each number depends only
+    on these and the seed, so a person's draws don't depend on who else is being
+    simulated, in what order, or whether sims run serially or in parallel; sims
+    with the same seed therefore share common random numbers.
+
+    Args:
+        seed (int): the random seed
+        stream (str): the name of the kind of draw, e.g. 'death'
+        step (int): the timestep
+        uids (array): the UIDs of the people
+        size (int): if supplied, the number of draws per person, returned as an array of shape (size, len(uids))
+
+    **Example**::
+
+        u = fp.stream_random(1, 'death', 12, [0, 4, 7]) # The same as for these people in any other sim with seed 1
+    '''
+    uids = np.asarray(uids, dtype=np.int64)
+    out  = _stream_random(uids, 1 if size is None else size, step, zlib.crc32(stream.encode()), stream_key(seed))
+    return out[0] if size is None else out
+
+
 def annprob2ts(prob_annual, timestep=1):
     ''' Convert an annual probability into a timestep probability '''
     prob_timestep = 1 - ((1-np.minimum(1,prob_annual))**(timestep/fpd.mpy))
     return prob_timestep
 
 
+def weighted_percentile(values, q, weights=None):
+    ''' Percentiles of values with sampling weights, interpolating between weighted midpoints; the same as np.percentile() if the weights are equal '''
+    values = np.asarray(values, dtype=np.float64)
+    if weights is None or not len(values) or np.all(weights == weights[0]):
+        return np.percentile(values, q)
+    order   = np.argsort(values)
+    values  = values[order]
+    weights = np.asarray(weights, dtype=np.float64)[order]
+    cum = np.cumsum(weights) - weights/2
+    cum = (cum - cum[0])/(cum[-1] - cum[0])
+    return np.interp(np.asarray(q)/100, cum, values)
+
+
+@nb.njit((nb.float64[:,:], nb.float64[:], nb.float64[:], nb.int64, nb.float64), cache=True)
+def death_steps(cum_hazards, ages, targets, start, step):
+    '''
+    Find the timestep of each person's death, as the first in which their cumulative
+    hazard of death from the start reaches their target, an exponentially distributed
+    random number. Equivalent to a Bernoulli trial each timestep with probability
+    1-exp(-hazard), so these are the times of death for those probabilities.
+
+    Args:
+        cum_hazards (array): cumulative hazard of death before each timestep (rows, one more than the timesteps) by age in years (columns)
+        ages (array): each person's age at the start
+        targets (array): each person's target, e.g. -log(1-u) for uniform random u
+        start (int): the timestep the ages are for
+        step (float): the years per timestep
+
+    Returns:
+        Array of each person's timestep of death, or -1 if they survive to the end
+    '''
+    eps = 1e-9 # Tolerance for rounding errors in ages, as for People.schedule_birthdays()
+    npts = cum_hazards.shape[0] - 1
+    amax = cum_hazards.shape[1] - 1
+    out = np.full(len(ages), -1, dtype=np.int64)
+    for p in range(len(ages)):
+        t = start
+        a = int(np.floor(ages[p] + eps))
+        target = targets[p]
+        while t < npts:
+            t_next = min(npts, start + int(np.ceil((a + 1 - ages[p])/step - eps))) # The timestep of the next birthday
+            col = min(a, amax)
+            if cum_hazards[t_next, col] - cum_hazards[t, col] >= target: # Dies at this age: find the timestep by bisection
+                threshold = cum_hazards[t, col] + target
+                lo, hi = t, t_next - 1
+                while lo < hi:
+                    mid = (lo + hi) // 2
+                    if cum_hazards[mid+1, col] >= threshold:
+                        hi = mid
+                    else:
+                        lo = mid + 1
+                out[p] = lo
+                break
+            target -= cum_hazards[t_next, col] - cum_hazards[t, col]
+            t = t_next
+            a += 1
+    return out
+
+
+@nb.njit(cache=True)
+def count_prevalence(age, sex, alive, method, pregnant, sexually_active, groups, weight,
+                     method_class, method_age, age_limit_fecundity, age_bins, n_groups):
+    '''
+    Count the women under age_limit_fecundity in a single pass, for People.track_prevalence().
+
+    Args:
+        age, sex, alive, method, pregnant, sexually_active, weight (arrays): the states of the agents
+        groups (array): each agent's age group (see fpd.age_specific_channel_bins), if n_groups > 1
+        method_class (array): the class of each method: none (0), traditional (1) or modern (2)
+        method_age (float): the age from which women are potential users of methods
+        age_limit_fecundity (float): the age from which women are not counted
+        age_bins (array): the age bins, as [low, high) rows in increasing order, e.g. of ``fpd.age_bin_map``
+        n_groups (int): the number of age groups, or 1 not to split by age group
+
+    Returns:
+        Array of the weighted number of women by status (0 if not a potential user, otherwise
+        1 + the class of their method, plus 3 if neither pregnant nor sexually inactive), age
+        bin (the last if living in none of them or dead), age 15+ (0 or 1), and age group
+    '''
+    n_bins = age_bins.shape[0] + 1
+    counts = np.zeros((7, n_bins, 2, n_groups))
+    for i in range(len(age)):
+        a = age[i]
+        if sex[i] != 0 or a >= age_limit_fecundity:
+            continue
+        status = 0
+        b = n_bins - 1
+        if alive[i]:
+            if method_age <= a:
+                status = 1 + method_class[method[i]]
+                if not pregnant[i] and sexually_active[i]:
+                    status += 3
+            for j in range(n_bins - 1):
+                if age_bins[j,0] <= a < age_bins[j,1]:
+                    b = j
+                    break
+        g = groups[i] if n_groups > 1 else 0
+        counts[status, b, int(a >= 15), g] += weight[i]
+    return counts
+
 
 @nb.njit((nb.float64[:], nb.float64, nb.float64), cache=True)
 def numba_miscarriage_prob(miscarriage_rates, age, resolution):
@@ -207,4 +434,363 @@ def sample(dist='uniform', par1=0, par2=1, size=1, **kwargs):
         errormsg = f'The selected distribution "{dist}" is not implemented; choices are: {sc.newlinejoin(choices)}'
         raise NotImplementedError(errormsg)
 
-    return samples
\ No newline at end of file
+    return samples
+
+#%% Compiled update of people, used when pars['engine'] == 'numba'; see People.update_compiled()
+
+# Flags for the events that happen to each person during a timestep
+DIED           = 1 << 0
+DELIVERED      = 1 << 1 # Live birth
+STILLBORN      = 1 << 2
+TWINS          = 1 << 3
+MATERNAL_DEATH = 1 << 4
+INFANT_DEATH   = 1 << 5
+MISCARRIAGE    = 1 << 6
+CONCEIVED      = 1 << 7
+UNINTENDED     = 1 << 8
+ABORTION       = 1 << 9
+
+# The kinds of draw, as the stream numbers used by People.random() with pars['rng'] = 'streams'
+DEATH_STREAM           = zlib.crc32(b'death')
+STILLBIRTH_STREAM      = zlib.crc32(b'stillbirth')
+TWINS_STREAM           = zlib.crc32(b'twins')
+MATERNAL_DEATH_STREAM  = zlib.crc32(b'maternal_death')
+INFANT_DEATH_STREAM    = zlib.crc32(b'infant_death')
+MISCARRIAGE_STREAM     = zlib.crc32(b'miscarriage')
+SEXUAL_ACTIVITY_STREAM = zlib.crc32(b'sexual_activity')
+METHOD_STREAM          = zlib.crc32(b'method')
+METHOD_PP_STREAM       = zlib.crc32(b'method_pp')
+BREASTFEEDING_STREAM   = zlib.crc32(b'breastfeeding')
+LAM_STREAM             = zlib.crc32(b'lam')
+CONCEPTION_STREAM      = zlib.crc32(b'conception')
+ABORTION_STREAM        = zlib.crc32(b'abortion')
+PREG_DUR_STREAM        = zlib.crc32(b'preg_dur')
+
+# The arguments of update_people(), grouped so that each is passed by name
+PeopleArrays = namedtuple('PeopleArrays', [
+    'uid', 'age', 'sex', 'alive', 'pregnant', 'gestation', 'preg_dur', 'lactating', 'postpartum', 'postpartum_dur',
+    'breastfeed_dur', 'breastfeed_dur_total', 'lam', 'sexually_active', 'sexual_debut', 'sexual_debut_age',
+    'fated_debut', 'fertile', 'personal_fecundity', 'parity', 'method', 'stillbirth', 'miscarriage', 'abortion',
+    'weight',
+])
+
+UpdatePars = namedtuple('UpdatePars', [
+    # Timing and random numbers
+    'timestep', 'step', 'do_methods', 'method_timestep', 'streams', 'key0', 'key1', 'death_times', 'track_switching',
+    # Mortality and delivery
+    'f_mort', 'm_mort', 'still_prob', 'still_ages', 'still_age_probs', 'twins_prob', 'maternal_prob', 'infant_prob',
+    'infant_ages', 'infant_age_probs',
+    # Pregnancy and sexual activity
+    'end_first_tri', 'miscarriage_rates', 'age_limit_fecundity', 'sexual_activity', 'sexual_activity_pp', 'pp_dur_max',
+    'spacing_interval', 'spacing_n_bins', 'spacing_preference',
+    # Methods
+    'method_age', 'method_age_edges', 'annual_cdf', 'pp0to1_cdf', 'pp0to1_high_cdf', 'pp1to6_cdf', 'high_parity',
+    # Postpartum, breastfeeding and LAM
+    'pp_bins', 'bf_mu', 'bf_beta', 'max_lam_dur', 'lam_rate',
+    # Conception
+    'age_fecundity', 'fecundity_ratio_nullip', 'exposure_factor', 'exposure_age', 'exposure_parity', 'method_eff',
+    'lam_eff', 'abortion_prob', 'preg_dur_low', 'preg_dur_high',
+])
+
+
+@nb.njit(cache=True)
+def _nearest(series, value):
+    ''' Index of the element of series nearest to value, like sc.findnearest() '''
+    best = 0
+    for j in range(1, len(series)):
+        if abs(series[j] - value) < abs(series[best] - value):
+            best = j
+    return best
+
+
+@nb.njit(cache=True)
+def _random(p, uid, stream, draw=0):
+    ''' A uniform random number for update_people(), from the person's stream if p.streams (see People.random()) '''
+    if p.streams:
+        return _stream_uniform(uid, draw, p.step, stream, p.key0, p.key1)
+    return np.random.random()
+
+
+@nb.njit(cache=True)
+def update_people(s, p, due_deaths, flags, pp_counts, switching):
+    '''
+    Update everyone alive for one timestep in a single pass: the equivalent of
+    People.update() from check_mortality() to check_conception(), with the same
+    parameters. Each random number is drawn when it is needed, from the global
+    random state or, if p.streams, from the same stream as the NumPy engine, so
+    results are then the same as with the NumPy methods.
+
+    Args:
+        s (PeopleArrays): the states, updated in place
+        p (UpdatePars): the parameters for this timestep
+        due_deaths (array): if p.death_times, whether each person's time of death is due (see People.schedule_deaths())
+        flags (array): the events that happen to each person (e.g. DIED), set here for bookkeeping afterwards
+        pp_counts (array): the number postpartum in each bin of p.pp_bins, weighted by the sampling weights, added to here
+        switching (array): if p.track_switching, the number switching from each method to each other by age group, added to here, annually and postpartum
+    '''
+    max_preg_age = len(p.age_fecundity) - 1
+    max_parity   = len(p.exposure_parity) - 1
+    n_groups     = len(p.method_age_edges) - 1
+    step_years   = p.timestep/fpd.mpy
+    eps          = 1e-9 # As in People.schedule_birthdays()
+    for i in range(len(s.age)):
+        if not s.alive[i]:
+            continue
+        a   = s.age[i]
+        uid = s.uid[i]
+
+        # General mortality, for people over one year old, or for people whose time of death is due
+        if p.death_times:
+            died = due_deaths[i]
+        else:
+            died = a >= 1 and _random(p, uid, DEATH_STREAM) < (p.f_mort[int(a)] if s.sex[i] == 0 else p.m_mort[int(a)])
+        if died:
+            s.alive[i]           = False
+            s.pregnant[i]        = False
+            s.gestation[i]       = 0
+            s.sexually_active[i] = False
+            s.lactating[i]       = False
+            s.postpartum[i]      = False
+            s.lam[i]             = False
+            s.breastfeed_dur[i]  = 0
+            flags[i] |= DIED
+            continue
+
+        # Delivery, with stillbirth, twins, and maternal and infant mortality
+        was_pregnant = s.pregnant[i]
+        if was_pregnant and s.gestation[i] >= s.preg_dur[i]:
+            s.pregnant[i]       = False
+            s.gestation[i]      = 0
+            s.lactating[i]      = True
+            s.postpartum[i]     = True
+            s.breastfeed_dur[i] = 0
+            s.postpartum_dur[i] = 0
+            k = np.searchsorted(p.still_ages, a)
+            nk = len(p.still_ages)
+            if k == nk or abs(a - p.still_ages[max(k-1, 0)]) < abs(a - p.still_ages[min(k, nk-1)]):
+                k -= 1
+            if _random(p, uid, STILLBIRTH_STREAM) < p.still_prob*p.still_age_probs[k]:
+                s.stillbirth[i] += 1
+                s.lactating[i] = False
+                flags[i] |= STILLBORN
+            else:
+                flags[i] |= DELIVERED
+                if _random(p, uid, TWINS_STREAM) < p.twins_prob:
+                    s.parity[i] += 2
+                    flags[i] |= TWINS
+                else:
+                    s.parity[i] += 1
+                if _random(p, uid, MATERNAL_DEATH_STREAM) < p.maternal_prob:
+                    s.alive[i] = False
+                    flags[i] |= MATERNAL_DEATH
+                if _random(p, uid, INFANT_DEATH_STREAM) < p.infant_prob*p.infant_age_probs[_nearest(p.infant_ages, a)]:
+                    s.lactating[i] = False
+                    s.breastfeed_dur_total[i] += s.breastfeed_dur[i]
+                    s.breastfeed_dur[i] = 0
+                    flags[i] |= INFANT_DEATH
+            if not s.alive[i]:
+                continue
+
+        # Select who the remaining updates apply to, as in People.update()
+        fecund  = s.sex[i] == 0 and a < p.age_limit_fecundity
+        nonpreg = fecund and not s.pregnant[i]
+        lact    = fecund and s.lactating[i]
+        age_ind = min(int(a), max_preg_age)
+
+        # Advance pregnancy and check for miscarriage
+        if was_pregnant and s.pregnant[i]:
+            s.gestation[i] += p.timestep
+            if s.gestation[i] >= p.end_first_tri and s.gestation[i] - p.timestep < p.end_first_tri and _random(p, uid, MISCARRIAGE_STREAM) < p.miscarriage_rates[age_ind]:
+                s.pregnant[i]   = False
+                s.postpartum[i] = False
+                s.gestation[i]  = 0
+                s.miscarriage[i] += 1
+                flags[i] |= MISCARRIAGE
+
+        # Sexual activity
+        if nonpreg:
+            dur = s.postpartum_dur[i]
+            if s.postpartum[i] and dur >= 0 and dur <= p.pp_dur_max:
+                dur = min(dur + p.timestep//2, p.pp_dur_max) # Duration in the middle of the timestep
+                spacing_bin = int(min(dur/p.spacing_interval, p.spacing_n_bins))
+                s.sexually_active[i] = _random(p, uid, SEXUAL_ACTIVITY_STREAM) < p.sexual_activity_pp[dur]*p.spacing_preference[spacing_bin]
+            elif a >= s.fated_debut[i]:
+                s.sexually_active[i] = _random(p, uid, SEXUAL_ACTIVITY_STREAM) < p.sexual_activity[int(a)]
+                if s.sexually_active[i] and not s.sexual_debut[i]:
+                    s.sexual_debut[i] = True
+                    s.sexual_debut_age[i] = a
+
+        # Contraceptive methods, postpartum or on birthdays
+        if p.do_methods and nonpreg and a >= p.method_age:
+            g = np.searchsorted(p.method_age_edges, a, side='right') - 1
+            if g >= 0 and g < n_groups:
+                old = s.method[i]
+                new = -1
+                dur = s.postpartum_dur[i]
+                if s.postpartum[i] and dur < 6 + p.timestep:
+                    if dur == 0:
+                        cdf = p.pp0to1_cdf[g] if s.parity[i] < p.high_parity else p.pp0to1_high_cdf[g]
+                        new = np.searchsorted(cdf, _random(p, uid, METHOD_PP_STREAM))
+                    elif dur >= 6:
+                        new = np.searchsorted(p.pp1to6_cdf[g, old], _random(p, uid, METHOD_PP_STREAM))
+                    kind = 1
+                else:
+                    # Birthdays since the last method update, as in People.birthdays()
+                    birthday = np.floor(a + step_years + eps)
+                    if birthday > max(np.floor(a - (p.method_timestep-1)*step_years + eps), np.floor(p.method_age)):
+                        new = np.searchsorted(p.annual_cdf[g, old], _random(p, uid, METHOD_STREAM))
+                    kind = 0
+                if new >= 0:
+                    new = min(new, len(p.method_eff)-1) # In case of rounding error in the last cumulative probability, as in n_multinomial_cdf()
+                    s.method[i] = new
+                    if p.track_switching:
+                        switching[kind, g, old, new] += 1
+
+        # Postpartum
+        if nonpreg:
+            if s.postpartum_dur[i] >= p.pp_dur_max:
+                s.postpartum[i] = False
+                s.postpartum_dur[i] = 0
+            if s.postpartum[i]:
+                for b in range(len(p.pp_bins)):
+                    if s.postpartum_dur[i] >= p.pp_bins[b, 0] and s.postpartum_dur[i] < p.pp_bins[b, 1]:
+                        pp_counts[b] += s.weight[i]
+                s.postpartum_dur[i] += p.timestep
+
+        # Breastfeeding, with a Gumbel-distributed duration, drawn once per month as in People.update_breastfeeding()
+        if lact:
+            bf_dur = np.inf
+            for month in range(p.timestep):
+                u = _random(p, uid, BREASTFEEDING_STREAM, month)
+                bf_dur = min(bf_dur, abs(p.bf_mu - p.bf_beta*np.log(-np.log(1 - u))))
+            if s.breastfeed_dur[i] >= np.ceil(bf_dur):
+                s.lactating[i] = False
+                s.breastfeed_dur_total[i] += s.breastfeed_dur[i]
+                s.breastfeed_dur[i] = 0
+            else:
+                s.breastfeed_dur[i] += p.timestep
+
+        # Lactational amenorrhea
+        if nonpreg:
+            if s.postpartum[i] and s.postpartum_dur[i] <= p.max_lam_dur:
+                s.lam[i] = _random(p, uid, LAM_STREAM) < p.lam_rate[s.postpartum_dur[i]]
+            if not s.postpartum[i] or s.postpartum_dur[i] > p.max_lam_dur or s.breastfeed_dur[i] == 0:
+                s.lam[i] = False
+
+        # Conception, followed by abortion or pregnancy
+        if nonpreg and s.sexually_active[i] and s.fertile[i]:
+            eff = p.lam_eff if s.lam[i] else p.method_eff[s.method[i]]
+            prob = 1 - (1 - min(1.0, (1-eff)*p.age_fecundity[age_ind]*s.personal_fecundity[i]))**(p.timestep/fpd.mpy) # As in annprob2ts()
+            if s.parity[i] == 0:
+                prob *= p.fecundity_ratio_nullip[age_ind]
+            prob *= p.exposure_factor
+            prob *= p.exposure_age[age_ind]
+            prob *= p.exposure_parity[min(s.parity[i], max_parity)]
+            if _random(p, uid, CONCEPTION_STREAM) < prob:
+                flags[i] |= CONCEIVED
+                if s.method[i] != 0:
+                    flags[i] |= UNINTENDED
+                s.postpartum[i] = False
+                s.postpartum_dur[i] = 0
+                if _random(p, uid, ABORTION_STREAM) < p.abortion_prob:
+                    s.abortion[i] += 1
+                    flags[i] |= ABORTION
+                else:
+                    s.pregnant[i]  = True
+                    s.gestation[i] = p.timestep
+                    s.preg_dur[i]  = p.preg_dur_low + int(_random(p, uid, PREG_DUR_STREAM)*(p.preg_dur_high - p.preg_dur_low + 1))
+                    s.lactating[i] = False
+                    s.breastfeed_dur_total[i] += s.breastfeed_dur[i]
+                    s.breastfeed_dur[i] = 0
+                    s.method[i] = 0
+                    if p.timestep >= p.end_first_tri and _random(p, uid, MISCARRIAGE_STREAM) < p.miscarriage_rates[age_ind]: # First trimester ends in this timestep
+                        s.pregnant[i]  = False
+                        s.gestation[i] = 0
+                        s.miscarriage[i] += 1
+                        flags[i] |= MISCARRIAGE
+    return
+
+
+#%% Compiled updates of expected numbers of people, used when pars['engine'] == 'cohort'; see fpsim.cohort.Cohort
+
+@nb.njit(cache=True)
+def age_cohorts(counts, frac):
+    '''
+    Move the fraction frac of each age (the first axis of counts) to the next,
+    in place, and return the numbers moved out of the last age
+    '''
+    n_ages, n = counts.shape
+    aged_out = counts[n_ages-1] * frac
+    for a in range(n_ages-1, -1, -1): # Oldest first, so each age has been updated before receiving the next youngest
+        for j in range(n):
+            moved = counts[a,j] * frac
+            if moved:
+                counts[a,j] -= moved
+                if a+1 < n_ages:
+                    counts[a+1,j] += moved
+    return aged_out
+
+
+@nb.njit(cache=True)
+def switch_cohorts(counts, changes, switch):
+    '''
+    For each age a and second and third index i and j with switch[j], add
+    counts[a,i,j,:] @ changes[a] to the numbers on each method, in place
+    '''
+    n_ages, n_i, n_j, n_methods = counts.shape
+    row = np.zeros(n_methods)
+    for a in range(n_ages):
+        if not changes[a].any():
+            continue
+        for i in range(n_i):
+            for j in range(n_j):
+                if not switch[j]:
+                    continue
+                total = 0.0
+                for m in range(n_methods):
+                    row[m] = counts[a,i,j,m]
+                    total += row[m]
+                if total == 0: # Most states are empty
+                    continue
+                for m2 in range(n_methods):
+                    change = 0.0
+                    for m1 in range(n_methods):
+                        change += row[m1] * changes[a,m1,m2]
+                    counts[a,i,j,m2] += change
+    return
+
+
+@nb.njit(cache=True)
+def conceive_cohorts(nonpreg, factor, probs, active, timestep):
+    '''
+    Remove the expected number of non-pregnant women who conceive, with a
+    probability of factor[age,parity]*probs[age,postpartum,method], and advance
+    postpartum months by the timestep, in place.
+
+    Returns:
+        conceived (array): the number conceiving by age, parity, and method
+        active_counts (array): the number sexually active by age and method, before conception
+        remaining (array): the number not conceiving by age and method
+        by_pp (array): the number in each postpartum state, before conception
+    '''
+    n_ages, n_parities, n_pp, n_methods = nonpreg.shape
+    conceived     = np.zeros((n_ages, n_parities, n_methods))
+    active_counts = np.zeros((n_ages, n_methods))
+    remaining     = np.zeros((n_ages, n_methods))
+    by_pp         = np.zeros(n_pp)
+    for a in range(n_ages):
+        for p in range(n_parities):
+            for k in range(n_pp-1, -1, -1): # Longest postpartum first, so moving up does not overwrite
+                dest = k if k == 0 else min(k + timestep, n_pp - 1)
+                for m in range(n_methods):
+                    count = nonpreg[a,p,k,m]
+                    if not count:
+                        continue
+                    by_pp[k] += count
+                    active_counts[a,m] += count * active[a,k]
+                    conc = count * factor[a,p] * probs[a,k,m]
+                    conceived[a,p,m] += conc
+                    remaining[a,m] += count - conc
+                    nonpreg[a,p,k,m] = 0
+                    nonpreg[a,p,dest,m] += count - conc
+    return conceived, active_counts, remaining, by_pp
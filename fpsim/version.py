@@ -1,3 +1,3 @@
-__version__ = '0.19.2'
-__versiondate__ = '2022-10-28'
+__version__ = '0.22.0'
+__versiondate__ = '2026-10-17'
 __license__ = f'FPsim {__version__} ({__versiondate__}) — © 2019-2022 by IDM'
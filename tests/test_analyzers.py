@@ -82,6 +82,16 @@ def test_age_pyramids():
 
     ap = make_analyzer(fp.age_pyramids())
 
+    # Men counted by age are included
+    sim = fp.Sim(location='test', aggregate_men=True)
+    sim.initialize()
+    men = fp.age_pyramids()
+    men.initialize(sim)
+    sim.i = 0
+    men.apply(sim)
+    raw = men._raw[0]
+    assert raw.sum() == sim.people.n, f'Expected the age pyramid to include all {sim.people.n} people, not {raw.sum()}'
+
     if do_plot:
         ap.plot()
 
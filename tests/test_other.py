@@ -17,6 +17,46 @@ def ok(string, newline=True):
     return sc.printgreen(f'✓ {string}' + '\n'*newline)
 
 
+def summarize(sim, key):
+    ''' A result as a single number for comparing sims: the final pop_size or mcpr, the mean TFR over the last 10 years, or else the total '''
+    if key in ['pop_size', 'mcpr']:
+        return sim.results[key][-1]
+    elif key == 'tfr':
+        return sim.results['tfr_rates'][-10:].mean()
+    return sim.results[key].sum()
+
+
+def compare_variants(pars, key, variants, keys, n_seeds, rtol=0, z=4):
+    '''
+    Run the sims for each value of a parameter over n_seeds seeds, and check that
+    the mean of each result is within z standard errors of the seed-to-seed variation
+    of that of the first value, plus rtol for known approximations
+
+    Returns:
+        The mean of each result and the sims, by value
+    '''
+    results = sc.objdict()
+    sims = sc.objdict()
+    for variant in variants:
+        label = str(variant)
+        msim = fp.MultiSim([fp.Sim(pars=sc.mergedicts(pars, {key:variant}, seed=seed)) for seed in range(n_seeds)])
+        msim.run()
+        sims[label] = msim.sims
+        results[label] = np.array([[summarize(sim, k) for k in keys] for sim in msim.sims])
+
+    ref = results[0]
+    for label,values in list(results.items())[1:]:
+        diff = values.mean(axis=0) - ref.mean(axis=0)
+        se = np.sqrt(ref.var(axis=0, ddof=1)/len(ref) + values.var(axis=0, ddof=1)/len(values))
+        for k,d,e,expected in zip(keys, diff, se, ref.mean(axis=0)):
+            assert abs(d) <= z*e + rtol*abs(expected), f'With {key}={label}, "{k}" is {expected+d:0.3f} but with {key}={results.keys()[0]} it is {expected:0.3f}, more than {z} standard errors ({e:0.3f}) apart'
+        ok(f'With {key}={label}, results are similar: {sc.strjoin([f"{k}={v:0.3f}" for k,v in zip(keys, values.mean(axis=0))])}')
+
+    for label,values in results.items():
+        results[label] = dict(zip(keys, values.mean(axis=0)))
+    return results, sims
+
+
 def test_options():
     sc.heading('Testing options...')
 
@@ -158,6 +198,326 @@ def test_method_usage():
     
     return sim
 
+
+def test_method_switching(n=20_000):
+    '''Test that annual and postpartum switching reproduce the switching probabilities, and that switching is tracked'''
+    sc.heading('Testing method switching...')
+    sim = fp.Sim(location='test')
+    sim.run()
+    sim.pars['track_switching'] = True
+    people = fp.People(sim.pars, n=n, age=22, method=0, fertile=True, debut_age=15)
+    people.init_step_results()
+    people.update_method()
+
+    row = sim.pars['methods']['adjusted']['annual']['21-25'][0]
+    expected = row/row.sum()
+    actual = np.bincount(people.method, minlength=len(expected))/n
+    assert np.allclose(actual, expected, atol=0.01), f'Switching frequencies {actual} do not match the matrix {expected}'
+    switching = people.step_results['switching_annual']
+    assert switching[2,0].sum() == n, f'Expected {n} switching events to be tracked at ages 21-25, not {switching[2,0].sum()}'
+    assert switching.sum() == n
+    ok('Annual method switching matches the switching matrix')
+
+    people = fp.People(sim.pars, n=n, age=22, method=0, parity=10, fertile=True, debut_age=15)
+    people.init_step_results()
+    people.set(postpartum=True, postpartum_dur=0)
+    people.update_method_pp()
+    choices = sim.pars['methods']['adjusted']['pp0to1']['21-25'].copy()
+    choices[0] *= sim.pars['high_parity_nonuse']
+    expected = choices/choices.sum()
+    actual = np.bincount(people.method, minlength=len(expected))/n
+    assert np.allclose(actual, expected, atol=0.01), f'Postpartum initiation frequencies {actual} do not match {expected}'
+    assert people.step_results['switching_postpartum'].sum() == n
+    ok('Postpartum method initiation matches the initiation probabilities')
+
+    # Switching events are stored by timestep, age group, and old and new method, and can be summed by year
+    sim = fp.Sim(pars=dict(n_agents=1000, start_year=2000, end_year=2010, track_switching=True, scaled_pop=1500, verbose=0))
+    sim.run()
+    events = sim.get_switching()
+    yearly = sim.get_switching(yearly=True)
+    m = len(sim.pars['methods']['map'])
+    assert events.shape == (sim.npts, len(fp.defaults.method_age_map), m, m)
+    assert np.allclose(events/1.5, np.round(events/1.5)), 'Switching events are not all scaled by the population scale of 1.5'
+    assert np.isclose(yearly[1:].sum(), events[:-1].sum()), 'Switching events by year do not add up to those by timestep'
+    assert np.array_equal(sim.get_switching('postpartum', sparse=True).toarray(), sim.results['switching_postpartum'].reshape(sim.npts, -1))
+    ok(f'Switching events are tracked by timestep: {events.sum():n} annual and {sim.get_switching("postpartum").sum():n} postpartum')
+
+    return people
+
+
+def test_timelines():
+    '''Test that the parameters compiled by timestep match those for each year, and are updated by interventions'''
+    sc.heading('Testing timelines...')
+    pars = dict(start_year=2010, end_year=2030)
+    sim = fp.Sim(location='test', **pars)
+    sim.initialize()
+    tl = sim.timelines
+    for i in [0, 100, sim.npts-1]:
+        year = sim.ind2calendar(i)
+        ind = sc.findnearest(sim['infant_mortality']['year'], year)
+        assert tl.infant[i] == sim['infant_mortality']['probs'][ind]
+        trend = tl.gen_trend[i]
+        assert np.allclose(tl.f_probs[i], fp.utils.annprob2ts(sim['age_mortality']['f_spline']*trend, sim['timestep']))
+    assert tl.mcpr_trend[-1] > tl.mcpr_trend[0], 'Expected mCPR to increase after the last year of data'
+    ok('Timelines match the parameters for each year')
+
+    cp = fp.change_par('mcpr_growth_rate', years=2025, vals=0.0)
+    sim = fp.Sim(location='test', interventions=cp, **pars)
+    sim.run()
+    trend = sim.timelines.mcpr_trend
+    assert trend[-1] == trend[sim.year2ind(2026)], 'Expected the mCPR trend to stop growing after the intervention'
+    ok('Timelines are updated by change_par()')
+
+    return sim
+
+
+def test_timesteps(n_seeds=6):
+    '''Test that timesteps longer than a month give similar results and yearly results to monthly timesteps'''
+    sc.heading('Testing timesteps...')
+
+    # Deliveries are due in the timestep in which gestation reaches the duration of the pregnancy
+    timestep = 3
+    people = fp.People(fp.pars('test', timestep=timestep), n=4, fertile=True, debut_age=15, sex=0, age=np.full(4, 25.0), pregnant=True, gestation=np.array([3, 3, 6, 9]), preg_dur=np.array([7, 9, 7, 9]))
+    due_steps = np.full(4, -1)
+    for i in range(4):
+        people.i = i
+        due_steps[people.due('delivery').inds] = i
+        people.gestation += timestep
+    assert due_steps.tolist() == [2, 2, 1, 0], f'Expected deliveries when gestation reaches 9 months, not in timesteps {due_steps}'
+    ok('Deliveries are due when gestation crosses the duration of the pregnancy')
+
+    keys = ['births', 'deaths', 'pregnancies', 'miscarriages', 'pop_size', 'mcpr', 'tfr']
+    pars = dict(n_agents=2000, start_year=1990, end_year=2020, verbose=0)
+    results, sims = compare_variants(pars, 'timestep', [1, 3, 12], keys, n_seeds, rtol=0.05) # Longer timesteps are a slightly coarser approximation
+    for label,runs in sims.items():
+        assert len(runs[0].results['tfr_years']) == len(runs[0].results['pop_size']) == 31, f'Expected one result per year with a timestep of {label}'
+
+    with pytest.raises(ValueError):
+        fp.Sim(pars=sc.mergedicts(pars, timestep=5)).run()
+
+    return results
+
+
+def test_numba_engine(n_seeds=6):
+    '''Test that the compiled engine gives statistically equivalent results to the default engine'''
+    sc.heading('Testing the Numba engine...')
+    keys = ['births', 'deaths', 'pregnancies', 'abortions', 'miscarriages', 'pop_size', 'mcpr']
+    pars = dict(n_agents=2000, start_year=1990, end_year=2020, verbose=0)
+    results, _ = compare_variants(pars, 'engine', ['numpy', 'numba'], keys, n_seeds)
+
+    # With random streams, each random number is the same in both engines, including with birthdays between method updates, times of death, and age-specific and switching tracking
+    stream_pars = sc.mergedicts(pars, n_agents=500, end_year=2000, rng='streams')
+    for extra in [{}, dict(timestep=3, method_timestep=2), dict(mortality_sampling='times'), dict(track_as=True, track_switching=True)]:
+        numpy, numba = [fp.Sim(pars=sc.mergedicts(stream_pars, extra, engine=engine)).run() for engine in ['numpy', 'numba']]
+        for key,expected in numpy.results.items():
+            if not sc.isarray(expected): # E.g. asfr, a dict by age bin
+                continue
+            assert np.array_equal(numba.results[key], expected, equal_nan=expected.dtype.kind == 'f'), f'With random streams, the Numba engine gives different results for "{key}"'
+        for key in numpy.people.keys():
+            if not fp.defaults.person_states[key].ragged:
+                assert np.array_equal(numba.people[key], numpy.people[key]), f'With random streams, the Numba engine gives different states for "{key}"'
+    ok('Numba and NumPy engines give identical results and people with random streams')
+    assert set(numba.people.calendar.events) <= {'death'}, f'Expected the Numba engine to schedule only deaths, not {list(numba.people.calendar.events)}'
+
+    with pytest.raises(ValueError):
+        fp.Sim(pars=sc.mergedicts(pars, engine='fortran')).run()
+
+    return results
+
+
+def test_cohort_engine(n_seeds=6):
+    '''Test that the cohort engine is deterministic and gives similar results to the default engine'''
+    sc.heading('Testing the cohort engine...')
+    keys = ['births', 'deaths', 'pregnancies', 'pop_size', 'mcpr']
+    pars = dict(n_agents=2000, start_year=1990, end_year=2020, verbose=0)
+    results, sims = compare_variants(pars, 'engine', ['numpy', 'cohort'], keys, n_seeds, rtol=0.1) # The cohort engine approximates the expected values
+
+    cohorts = sims.cohort
+    for key in keys + ['tfr_rates']:
+        assert np.array_equal(cohorts[0].results[key], cohorts[1].results[key]), f'Cohort engine results for "{key}" differ with the seed'
+    ok('Cohort engine is deterministic')
+
+    # Longer timesteps give similar results, as for the agent-based engines
+    monthly = cohorts[0]
+    for timestep in [3, 12]:
+        sim = fp.Sim(pars=sc.mergedicts(pars, engine='cohort', timestep=timestep)).run()
+        for key in keys:
+            expected, actual = summarize(monthly, key), summarize(sim, key)
+            assert np.isclose(actual, expected, rtol=0.05), f'With a timestep of {timestep}, cohort engine "{key}" is {actual:0.3f} but monthly it is {expected:0.3f}'
+    ok('Cohort engine gives similar results with longer timesteps')
+
+    # Without births or deaths, the population is conserved exactly
+    null = fp.pars('test', engine='cohort', exposure_factor=0)
+    for key in ['age_mortality', 'maternal_mortality', 'infant_mortality']:
+        null[key]['probs'] *= 0
+    for key in ['f', 'm']:
+        null['age_mortality'][key] *= 0
+    sim = fp.Sim(null).run()
+    assert np.allclose(sim.results['pop_size_months'], null['n_agents']), 'Expected the cohort engine to conserve the population without births or deaths'
+    ok('Cohort engine conserves the population')
+
+    with pytest.raises(NotImplementedError):
+        fp.Sim(pars=sc.mergedicts(pars, engine='cohort', track_as=True)).run()
+
+    return results
+
+def test_random_streams(n_seeds=6):
+    '''Test that counter-based random streams match Philox, are per person, and give similar results to the global random state'''
+    sc.heading('Testing random streams...')
+    counters = np.array([[0, 0, 0, 0], [0x243f6a88, 0x85a308d3, 0x13198a2e, 0x03707344]], dtype=np.uint32)
+    keys = np.array([[0, 0], [0xa4093822, 0x299f31d0]], dtype=np.uint32)
+    expected = [[0x6627e8d5, 0xe169c58d, 0xbc57ac4c, 0x9b00dbd8], [0xd16cfe09, 0x94fdcceb, 0x5001e420, 0x24126ea1]]
+    for counter,key,known in zip(counters, keys, expected):
+        assert list(fp.utils.philox(counter[None,:], key)[0]) == known, 'Philox does not match the known answers'
+    ok('Philox matches the known answers')
+
+    u = fp.stream_random(1, 'death', 12, np.arange(10), size=2)
+    assert np.array_equal(fp.stream_random(1, 'death', 12, [7, 3], size=2), u[:,[7,3]]), 'Draws depend on who else is drawing'
+    for args in [(2, 'death', 12), (1, 'twins', 12), (1, 'death', 13)]:
+        assert not np.isclose(fp.stream_random(*args, np.arange(10)), u[0]).any(), f'Draws for {args} are not independent'
+    ok('Each person has their own streams')
+
+    # People draw the same numbers whoever else is drawing, and whenever others are added
+    people = fp.People(fp.pars('test', rng='streams'), n=10, fertile=True, debut_age=15)
+    people.i = 12
+    u = people.random('death')
+    view = people.filter(inds=[3, 7])
+    assert np.array_equal(view.random('death'), u[[3, 7]]), 'Draws for a view differ from those for the same people in the population'
+    people += fp.People(people.pars, n=5, fertile=True, debut_age=15)
+    assert np.array_equal(people.random('death')[:10], u), 'Draws changed when people were added'
+    ok('People draw reproducibly from their own streams')
+
+    keys = ['births', 'deaths', 'pregnancies', 'miscarriages', 'pop_size', 'mcpr']
+    pars = dict(n_agents=2000, start_year=1990, end_year=2020, verbose=0)
+    results, _ = compare_variants(pars, 'rng', ['global', 'streams'], keys, n_seeds)
+
+    with pytest.raises(ValueError):
+        fp.Sim(pars=sc.mergedicts(pars, rng='mersenne')).run()
+    with pytest.raises(NotImplementedError):
+        fp.Sim(pars=sc.mergedicts(pars, rng='streams', engine='cohort')).run()
+
+    return results
+
+def test_mortality_sampling(n_seeds=6):
+    '''Test that sampling times of death gives the same deaths as a trial each timestep'''
+    sc.heading('Testing mortality sampling...')
+    hazards = np.zeros((13, 3)) # 12 monthly timesteps, ages 0-2
+    hazards[7:,2] = np.inf # Certain death from age 2 from timestep 6
+    steps = fp.utils.death_steps(hazards, np.array([1.5, 1.0, 1.99, 0.5]), np.ones(4), 0, 1/12)
+    assert list(steps) == [6, -1, 6, -1], f'Expected deaths at age 2 from timestep 6, not {steps}'
+    ok('Times of death are found from the cumulative hazards')
+
+    # Scheduled deaths happen in their timestep, and not before
+    sim = fp.Sim(location='test', mortality_sampling='times')
+    sim.initialize()
+    people = sim.people
+    step = min(step for step in people.calendar.events['death'] if step > 0)
+    inds = people.uid2ind(np.unique(people.calendar.get('death', step)))
+    for i in [step-1, step]:
+        people.i = i
+        people.init_step_results()
+        people.check_mortality()
+        assert people.alive[inds].all() == (i < step), f'Expected the people scheduled to die in timestep {step} to {"survive" if i < step else "die"} in timestep {i}'
+    assert people.step_results['deaths'] == len(inds), f'Expected {len(inds)} deaths in timestep {step}, not {people.step_results["deaths"]}'
+    ok('Scheduled deaths happen in their timestep')
+
+    keys = ['deaths', 'births', 'pregnancies', 'pop_size']
+    pars = dict(n_agents=2000, start_year=1990, end_year=2020, verbose=0)
+    results, _ = compare_variants(pars, 'mortality_sampling', ['trials', 'times'], keys, n_seeds)
+
+    with pytest.raises(ValueError):
+        fp.Sim(pars=sc.mergedicts(pars, mortality_sampling='hazards')).run()
+    with pytest.raises(NotImplementedError):
+        fp.Sim(pars=sc.mergedicts(pars, mortality_sampling='times', engine='cohort')).run()
+
+    return results
+
+def test_age_split():
+    '''Test that the age-specific counts match counting each age group separately, and add up to the totals'''
+    sc.heading('Testing age-specific tracking...')
+    sim = fp.Sim(pars=dict(n_agents=1000, track_as=True, verbose=0))
+    sim.initialize()
+    ppl = sim.people
+    ppl.init_step_results()
+    groups = ppl.age_by_group
+    n = len(fp.defaults.age_specific_channel_bins)
+    numerator = np.random.rand(len(ppl)) < 0.3
+    denominator = np.random.rand(len(ppl)) < 0.7
+    expected_counts = np.array([(numerator * (groups == g)).sum() for g in range(n)])
+    expected_rates = np.array([sc.safedivide((numerator * denominator * (groups == g)).sum(), (denominator * (groups == g)).sum()) for g in range(n)])
+
+    ppl.count_age_groups('births', numerator)
+    ppl.filter(numerator).count_age_groups('births')
+    counts = ppl.step_results['as_counts'][fp.defaults.age_specific_counts.index('births')]
+    assert np.array_equal(counts, 2*expected_counts), f'Expected age-specific counts {2*expected_counts}, not {counts}'
+    ok('Age-specific counts are accumulated by age group')
+
+    # The yearly age-specific stillbirths are the stillbirths over the last year of timesteps
+    sim = fp.Sim(pars=dict(n_agents=2000, start_year=2000, end_year=2010, track_as=True, verbose=0))
+    sim.run()
+    res = sim.results
+    for y in range(1, len(res['tfr_years'])):
+        expected = res['stillbirths'][(y-1)*12+1:y*12+1].sum()
+        actual = sum(res[f'stillbirths_{age_key}'][y] for age_key in fp.defaults.age_specific_channel_bins)
+        assert actual == expected, f'Expected {expected} stillbirths over year {y}, not {actual}'
+        assert all(res[f'imr_{age_key}'][y] >= 0 for age_key in fp.defaults.age_specific_channel_bins)
+    ok('Age-specific stillbirths over each year match the total')
+    return sim
+
+def test_prevalence():
+    '''Test that tracking prevalence in a single pass matches the definitions of the denominators'''
+    sc.heading('Testing prevalence tracking...')
+    sim = fp.Sim(pars=dict(n_agents=2000, start_year=2000, end_year=2010, track_as=True, verbose=0))
+    sim.run()
+    ppl = sim.people
+    ppl.init_step_results()
+    ppl.track_prevalence()
+    r = ppl.step_results
+
+    modern = np.array(list(ppl.pars['methods']['modern'].values()))[ppl.method]
+    women  = ppl.alive * ppl.is_female * (ppl.age >= ppl.pars['method_age']) * (ppl.age < ppl.pars['age_limit_fecundity'])
+    active = women * ~ppl.pregnant * ppl.sexually_active
+    expected = dict(
+        on_methods_mcpr = (women * modern).sum(),
+        no_methods_mcpr = (women * (ppl.method == 0)).sum(),
+        on_methods_cpr  = (women * (ppl.method != 0)).sum(),
+        on_methods_acpr = (active * (ppl.method != 0)).sum(),
+        no_methods_acpr = (active * (ppl.method == 0)).sum(),
+        total_women_fecund = (ppl.is_female * (ppl.age >= 15) * (ppl.age < ppl.pars['age_limit_fecundity'])).sum(),
+    )
+    for key,value in expected.items():
+        assert r[key] == value, f'Expected {value} for "{key}", not {r[key]}'
+    women_20 = (ppl.alive * ppl.is_female * (ppl.age >= 20) * (ppl.age < 25)).sum()
+    assert r['age_bin_totals']['20-24'] == women_20, f'Expected {women_20} women aged 20-24, not {r["age_bin_totals"]["20-24"]}'
+    for g,age_key in enumerate(fp.defaults.age_specific_channel_bins):
+        in_group = ppl.age_by_group == g
+        mcpr = r['as_counts'][fp.defaults.age_specific_counts.index('mcpr')][g]
+        assert mcpr == (women * modern * in_group).sum(), f'Age-specific modern method users do not match for {age_key}'
+    ok(f'Prevalence counts match: {sc.strjoin([f"{k}={v}" for k,v in expected.items()])}')
+    return r
+
+def test_results():
+    '''Test that the results are views of preallocated blocks, also when copied, and are used for the statistics of a MultiSim'''
+    sc.heading('Testing results...')
+    sims = [fp.Sim(pars=dict(n_agents=500, start_year=2000, end_year=2010, verbose=0, seed=seed)) for seed in range(3)]
+    msim = fp.MultiSim(sims)
+    msim.run()
+    for sim in [msim.sims[0], sc.dcp(msim.sims[0])]:
+        res = sim.results
+        assert res.block().shape == (len(res.channels()), sim.npts), 'Block by timestep has the wrong shape'
+        assert res.block('year').shape[1] == len(res['pop_size']) == 11, 'Expected one result per year'
+        for kind in ['timestep', 'year']:
+            for c,key in enumerate(res.channels(kind)):
+                assert np.shares_memory(res[key], res.block(kind)), f'"{key}" is not a view of the block'
+                assert np.array_equal(res[key], res.block(kind)[c])
+    ok('Results are views of their blocks, including when copied')
+
+    births = np.array([sim.results['births'] for sim in msim.sims])
+    assert np.allclose(msim.results['births'].best, np.median(births, axis=0)), 'MultiSim statistics do not match the sims'
+    ok('MultiSim statistics are computed from the blocks')
+
+    return msim
+
 # Run all tests
 if __name__ == '__main__':
 
@@ -168,4 +528,14 @@ if __name__ == '__main__':
         df   = test_to_df()
         ppl  = test_plot_people()
         res  = test_samples()
-        method = test_method_usage()
\ No newline at end of file
+        method = test_method_usage()
+        switch = test_method_switching()
+        tl     = test_timelines()
+        ts     = test_timesteps()
+        numba  = test_numba_engine()
+        cohort = test_cohort_engine()
+        streams = test_random_streams()
+        mort    = test_mortality_sampling()
+        age_split = test_age_split()
+        prev    = test_prevalence()
+        results = test_results()
\ No newline at end of file
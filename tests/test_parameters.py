@@ -50,21 +50,27 @@ def test_null(do_plot=do_plot):
 def test_method_timestep():
     sc.heading('Test sim speed')
 
-    pars1 = fp.pars(location='test', method_timestep=1)
-    pars2 = fp.pars(location='test', method_timestep=6)
-    sim1 = fp.Sim(pars1)
-    sim2 = fp.Sim(pars2)
-
-    T = sc.timer()
-
-    sim1.run()
-    t1 = T.tt(output=True)
-
-    sim2.run()
-    t2 = T.tt(output=True)
-
-    assert t2 < t1, f'Expecting runtime to be less with a larger method timestep, but {t2:0.3f} > {t1:0.3f}'
-    ok(f'Larger method timestep reduced runtime from {t1:0.3f} s to {t2:0.3f} s')
+    # Method switching is only a small part of each timestep, so time it rather than the whole run
+    update_methods = fp.People.update_methods
+    spent = []
+    def timed(people):
+        start = sc.tic()
+        update_methods(people)
+        spent.append(sc.toc(start, output=True))
+
+    times = []
+    fp.People.update_methods = timed
+    try:
+        for method_timestep in [1, 6]:
+            spent.clear()
+            fp.Sim(fp.pars(location='test', method_timestep=method_timestep)).run()
+            times.append(sum(spent))
+    finally:
+        fp.People.update_methods = update_methods
+    t1, t2 = times
+
+    assert t2 < t1/2, f'Expecting method updates to take less than half the time with a larger method timestep, but {t2:0.3f} > {t1:0.3f}/2'
+    ok(f'Larger method timestep reduced the time updating methods from {t1:0.3f} s to {t2:0.3f} s')
 
     return [t1, t2]
 
@@ -170,6 +176,15 @@ def test_matrix_methods():
     assert new_rate == pars_arr[0, orig_ind], 'Copied method has different initiation rate'
     ok(f'New method initiation rate is {new_rate:0.4f} as expected')
 
+    # Test that the adjusted matrices are cached, and recomputed after modification
+    p5 = pars.copy()
+    m1 = p5.method_matrices(1.0)
+    assert p5.method_matrices(1.0) is m1, 'Adjusted matrices were not cached'
+    p5.update_method_prob(source='None', dest='Injectables', factor=2.0, matrix='annual')
+    m2 = p5.method_matrices(1.0)
+    assert not np.array_equal(m1.annual, m2.annual), 'Cached matrices were not updated after modification'
+    ok('Adjusted matrices are cached and updated as expected')
+
     if do_plot:
         pl.figure()
         pl.subplot(2,1,1)
@@ -179,7 +194,7 @@ def test_matrix_methods():
         pl.pcolor(p4['methods']['raw']['annual']['>35'])
         pl.title('With new method')
 
-    return [s1, s2, s3, p4]
+    return [s1, s2, s3, p4, p5]
 
 
 def test_validation():
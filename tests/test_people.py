@@ -0,0 +1,335 @@
+"""
+Test the People object: storage, removing dead people, and links between people.
+"""
+
+import numpy as np
+import pytest
+import sciris as sc
+import fpsim as fp
+
+
+def ok(string):
+    ''' Print out a successful test nicely '''
+    return sc.printgreen(f'✓ {string}\n')
+
+
+def test_compact_dead():
+    ''' Check that removing dead people does not change the results, and that links remain valid '''
+    sc.heading('Testing removal of dead people...')
+
+    pars = fp.pars('test')
+    s1 = fp.Sim(pars=pars, track_children=True, label='Keep dead')
+    s2 = fp.Sim(pars=sc.mergedicts(pars, compact_dead=12), track_children=True, label='Compact dead')
+    s1.run()
+    s2.run()
+
+    for key in ['births', 'deaths', 'pop_size', 'mcpr', 'infant_deaths']:
+        assert np.array_equal(s1.results[key], s2.results[key]), f'Results for "{key}" differ when removing dead people'
+    ok('Results are unchanged by removing dead people')
+
+    p1, p2 = s1.people, s2.people
+    archive = p2.get_archive()
+    assert p2.alive.all(), 'Expected everyone in the people arrays to be alive after compacting'
+    assert len(p2) + len(archive.uid) == len(p1), 'Expected everyone to be either in the people arrays or the archive'
+    assert np.array_equal(p1.uid[p1.alive], p2.uid), 'Expected the UIDs of people alive to be unchanged'
+    ok(f'Moved {len(archive.uid)} dead people to the archive')
+
+    for i,uid in enumerate(p2.uid):
+        assert np.array_equal(p2.children[i], p1.children[uid]), f'Children of person {uid} differ'
+    assert np.array_equal(p1.mothers[p2.uid], p2.mothers), 'Mothers differ'
+    inds = p2.uid2ind(p2.mothers[p2.mothers >= 0])
+    assert (p2.sex[inds] == 0).all(), 'Expected all mothers found to be female'
+    ok('Links between mothers and children are unchanged')
+
+    return s2
+
+
+def test_add_people():
+    ''' Check that adding people reuses spare capacity and assigns unique UIDs '''
+    sc.heading('Testing adding people...')
+
+    pars = fp.pars('test')
+    kw = dict(fertile=True, debut_age=15)
+    people = fp.People(pars, n=10, **kw)
+    capacities = []
+    for i in range(20):
+        people += fp.People(pars, n=3, **kw)
+        capacities.append(len(people._buffers['age']))
+    assert len(people) == 70, 'Wrong number of people after adding'
+    assert np.array_equal(people.uid, np.arange(70)), 'Expected UIDs to be reassigned to be unique'
+    assert len(np.unique(capacities)) < 6, f'Expected capacity to double rather than grow each time: {capacities}'
+    assert people.age.base is people._buffers['age'], 'Expected states to be views of their buffers'
+    ok(f'Added people with capacity growing as {np.unique(capacities)}')
+
+    people.set(age=5)
+    assert (people._buffers['age'][:len(people)] == 5).all(), 'Expected setting a state to write into its buffer'
+    age = np.arange(70.0)
+    people.age = age
+    assert people.age is age, 'Expected assigning a state to rebind it'
+    people += fp.People(pars, n=2, **kw)
+    assert np.array_equal(people.age[:70], np.arange(70.0)) and people.age.base is people._buffers['age'], 'Expected the buffer to be recreated from a rebound state'
+    assert age.base is None and len(age) == 70, 'Expected the assigned array to be unchanged'
+    copied = sc.dcp(people)
+    copied += fp.People(pars, n=5, **kw)
+    assert np.array_equal(copied.uid, np.arange(77)), 'Expected adding people to a copy to work'
+    assert len(people) == 72, 'Expected the original people to be unchanged'
+    ok('Adding people after copying works')
+
+    return people
+
+
+def test_ragged():
+    ''' Check that event histories match the equivalent list of lists '''
+    sc.heading('Testing event histories...')
+
+    np.random.seed(1)
+    n = 50
+    lists = [[] for i in range(n)]
+    dobs = fp.base.Ragged(n)
+    for t in range(20):
+        inds = np.sort(np.random.choice(n, size=10, replace=False))
+        for i in inds:
+            lists[i].append(float(t))
+        dobs.append(inds, float(t))
+    assert dobs.to_list() == lists, 'Events differ from the list of lists'
+    assert np.array_equal(dobs.counts, [len(l) for l in lists]), 'Counts differ'
+    assert np.array_equal(dobs.first(-1), [l[0] if l else -1 for l in lists]), 'First events differ'
+    assert np.array_equal(dobs.last(-1), [l[-1] if l else -1 for l in lists]), 'Last events differ'
+    assert np.array_equal(dobs.diff(), np.concatenate([np.diff(l) for l in lists])), 'Differences between events differ'
+    ok('Events, counts, first, last and differences match')
+
+    inds = np.arange(0, n, 3)
+    subset = dobs[inds]
+    assert subset.to_list() == [lists[i] for i in inds], 'Subset differs'
+    combined = sc.dcp(subset).extend(dobs)
+    assert combined.to_list() == [lists[i] for i in inds] + lists, 'Combined events differ'
+    ok('Subsetting and combining event histories works')
+
+    return dobs
+
+
+def test_states():
+    ''' Check that people are created, copied, and exported from the registry of states '''
+    sc.heading('Testing the registry of states...')
+
+    pars = fp.pars('test')
+    people = fp.People(pars, n=20, fertile=True, debut_age=15)
+    assert people.keys() == list(fp.defaults.person_states.keys()), 'Expected the states to match the registry'
+    assert people.fated_debut.dtype == np.float64 and isinstance(people.dobs, fp.base.Ragged), 'Wrong types of states'
+    with pytest.raises(ValueError):
+        fp.People(pars, n=5, debut_age=15) # Fertility has no default
+    ok('States are allocated from the registry')
+
+    copied = people.copy()
+    copied.age = 30
+    copied.dobs.append([0, 1], 20.0)
+    assert (people.age == 0).all() and len(people.dobs.values) == 0, 'Expected changing the copy to leave the original unchanged'
+    assert copied.pars is people.pars, 'Expected the copy to share the parameters'
+    loaded = sc.loadstr(sc.dumpstr(copied))
+    assert loaded.keys() == copied.keys() and np.array_equal(loaded.age, copied.age), 'Expected pickling to keep the states'
+    ok('Copying and pickling people keeps the states')
+
+    exported = people.export()
+    assert 'dobs' in exported and 'personal_fecundity' not in exported, 'Wrong states exported'
+    assert exported.age is people.age, 'Expected exported states not to be copied'
+    ok(f'Exported {len(exported)} of {len(people.keys())} states')
+
+    return people
+
+
+def test_views():
+    ''' Check that views read and write the selected people '''
+    sc.heading('Testing views of people...')
+
+    pars = fp.pars('test')
+    people = fp.People(pars, n=100, fertile=True, debut_age=15)
+    people.age = np.arange(100.0)
+    old = people.filter(people.age >= 50) # Dense: stored as a mask
+    young = people.filter(people.age < 10) # Sparse: stored as indices
+    assert old._mask is not None and young._mask is None, 'Expected dense views to use a mask and sparse views indices'
+    assert len(old) == 50 and np.array_equal(young.inds, np.arange(10)), 'Wrong people selected'
+    assert np.array_equal(old.age, np.arange(50.0, 100.0)), 'Wrong states read from the view'
+
+    old.set(pregnant=True)
+    old.increment(parity=2)
+    oldest = old.filter(old.age >= 90)
+    oldest.increment(parity=1)
+    assert people.pregnant.sum() == 50 and people.parity.sum() == 2*50 + 10, 'Wrong states written through the view'
+    assert np.array_equal(oldest.inds, np.arange(90, 100)) and oldest.unfilter() is people, 'Nested view selects the wrong people'
+    assert np.array_equal(oldest.int_age, np.arange(90, 100)), 'Expected properties to operate on the view'
+    with pytest.raises(AttributeError):
+        old.age = 5
+    ok('Views read, write, and nest correctly')
+
+    assert np.array_equal(old.mask(oldest), old.age >= 90), 'Wrong mask of a nested view'
+    assert old.count_by(old.int_age // 10 - 5, 5).tolist() == [10]*5, 'Wrong counts by group'
+    assert people.count_by(np.full(100, -1), 2).tolist() == [0, 0], 'Expected people in no group not to be counted'
+    ok('Views are masked and counted by group correctly')
+
+    return people
+
+
+def test_calendar():
+    ''' Check that events are scheduled and become due in the right timestep '''
+    sc.heading('Testing the event calendar...')
+
+    calendar = fp.base.Calendar()
+    calendar.schedule('delivery', steps=[9, 9, 10], uids=[0, 4, 7])
+    assert sorted(calendar.pop('delivery', 9).tolist()) == [0, 4] and len(calendar) == 1, 'Wrong events popped'
+    assert len(calendar.pop('delivery', 11)) == 0 and len(calendar) == 0, 'Expected past events to be discarded'
+    ok('Events are popped in the timestep they are due')
+
+    pars = fp.pars('test')
+    people = fp.People(pars, n=3, fertile=True, debut_age=15, pregnant=True, gestation=np.array([1, 5, 9]), preg_dur=9)
+    assert sorted(people.calendar.events['delivery']) == [0, 4, 8], 'Expected deliveries to be scheduled from the gestation'
+    people.i = 4
+    assert people.due('delivery').inds.tolist() == [1], 'Wrong people due to deliver'
+    people.pregnant[2] = False
+    people.i = 0
+    assert len(people.due('delivery')) == 0, 'Expected events for people no longer pregnant to be ignored'
+    ok('Events already due when people are created are scheduled')
+
+    people = fp.People(pars, n=4, fertile=True, debut_age=15, sex=0, age=np.array([10.0, 20.5, 30.95, 60.0]))
+    assert sorted(people.calendar.events['birthday']) == [0, 5, 11], 'Expected birthdays to be scheduled by month of the year up to age_limit_fecundity'
+    people.i = 5
+    people.age += 5/12
+    assert people.birthdays().tolist() == [1], 'Expected a birthday after method_age in this timestep'
+    assert people.calendar.get('birthday', 5).tolist() == [1], 'Expected the birthday to stay in the calendar for the next year'
+    people.i = 11
+    people.age += 6/12
+    assert len(people.birthdays()) == 0, 'Expected no birthdays before method_age'
+    people.i = 23
+    people.age += 1
+    people.pars['method_timestep'] = 12
+    assert people.birthdays().tolist() == [1, 2], 'Expected all the birthdays since the last method update'
+    people.alive[1] = False
+    people.birthdays()
+    assert 1 not in people.calendar.get('birthday', 5), 'Expected dead people to be dropped from the calendar'
+    ok('Birthdays are scheduled for annual method switching')
+
+    sim = fp.Sim(location='test')
+    sim.run()
+    ppl = sim.people
+    preg = ppl.pregnant & ppl.alive
+    assert (ppl.gestation[preg] <= ppl.preg_dur[preg]).all(), 'Expected every scheduled delivery to happen'
+    ok(f'All deliveries happened, with {len(ppl.calendar)} events scheduled at the end')
+
+    return people
+
+
+def test_aggregate_men():
+    ''' Check that counting men by age gives the same population as creating them as agents '''
+    sc.heading('Testing aggregate men...')
+
+    pars = dict(n_agents=2000, start_year=1990, end_year=2020, verbose=0)
+    s1 = fp.Sim(pars=pars, label='Male agents')
+    s2 = fp.Sim(pars=sc.mergedicts(pars, aggregate_men=True), track_children=True, label='Aggregate men')
+    s1.run()
+    s2.run()
+
+    p2 = s2.people
+    assert (p2.sex == 0).all(), 'Expected only women to be created as agents'
+    assert p2.n == p2.alive.sum() + p2.male_counts.sum() == s2.results['pop_size_months'][-1], 'Expected the population size to include men'
+    for key in ['pop_size', 'births', 'deaths']:
+        v1, v2 = s1.results[key].sum(), s2.results[key].sum()
+        assert np.isclose(v1, v2, rtol=0.1), f'Expected similar results for "{key}", not {v1} and {v2}'
+    ok(f'Population size is similar with and without aggregate men ({s1.results["pop_size"][-1]:n} vs. {s2.results["pop_size"][-1]:n})')
+
+    sons = p2.children.values == -1
+    daughters = p2.uid2ind(p2.children.values[~sons])
+    assert sons.sum() > 0, 'Expected some sons to be recorded without a UID'
+    assert np.array_equal(p2.uid[p2.uid2ind(p2.mothers[daughters])], p2.mothers[daughters]), 'Expected daughters to be linked to their mothers'
+    ok('Sons are recorded without a UID, and daughters are linked to their mothers')
+
+    pars = sc.dcp(s2.pars)
+    pars['mortality_probs']['m_probs'] = np.zeros_like(pars['mortality_probs']['m_probs'])
+    people = fp.People(pars, n=0, male_ages=[0, 0.5, 120], fertile=True, debut_age=15)
+    people.init_step_results()
+    people.update_men()
+    assert people.male_counts[[1, 7, -1]].tolist() == [1, 1, 1], 'Expected men to age by one month'
+    ok('Men counted by age are aged correctly')
+
+    return s2
+
+
+def test_sampling_weights(n_seeds=3):
+    ''' Check that oversampling women gives similar results to sampling everyone equally '''
+    sc.heading('Testing sampling weights...')
+
+    pars = dict(n_agents=2000, start_year=1990, end_year=2020, verbose=0)
+    results = sc.objdict()
+    for label,rates in [['equal', None], ['weighted', [0.25, 1]]]:
+        sims = [fp.Sim(pars=sc.mergedicts(pars, seed=seed, sampling_rates=rates)) for seed in range(n_seeds)]
+        for sim in sims:
+            sim.run()
+        results[label] = {k:np.mean([sim.results[k].sum() for sim in sims]) for k in ['births', 'deaths', 'pregnancies']}
+        results[label]['pop_size'] = np.mean([sim.results['pop_size'][-1] for sim in sims])
+        results[label]['mcpr'] = np.mean([sim.results['mcpr'][-1] for sim in sims])
+
+    people = sims[-1].people
+    assert people.sex.mean() < 0.25, 'Expected men to be undersampled'
+    assert np.isclose(people.weight[people.sex == 1].mean(), 4*people.weight[people.sex == 0].mean()), 'Expected men to have four times the weight of women'
+    for key,expected in results.equal.items():
+        actual = results.weighted[key]
+        assert np.isclose(actual, expected, rtol=0.1), f'Weighted agents give {actual:0.3f} for "{key}", but equal sampling gives {expected:0.3f}'
+    ok(f'Weighted and equally sampled agents give similar results: {sc.strjoin([f"{k}={v:0.3f}" for k,v in results.weighted.items()])}')
+
+    sim = fp.Sim(pars=sc.mergedicts(pars, sampling_rates=[0.25, 1], track_as=True))
+    sim.initialize()
+    people = sim.people
+    people.init_step_results()
+    mask = people.sex == 1
+    people.count_age_groups('births', mask)
+    counts = people.step_results['as_counts'][fp.defaults.age_specific_counts.index('births')]
+    expected = [(people.weight * mask * (people.age_by_group == g)).sum() for g in range(len(counts))]
+    assert np.allclose(counts, expected), f'Expected age-specific counts weighted by the sampling weights {expected}, not {counts}'
+    values = np.array([1.0, 2, 3, 4])
+    assert np.allclose(fp.utils.weighted_percentile(values, [25, 50, 75], np.ones(4)), np.percentile(values, [25, 50, 75]))
+    assert fp.utils.weighted_percentile(values, 50, np.array([1.0, 1, 1, 5])) > np.percentile(values, 50), 'Expected a heavier weight to pull the median up'
+    ok('Age-specific counts and percentiles are weighted by the sampling weights')
+
+    with pytest.raises(NotImplementedError):
+        fp.Sim(pars=sc.mergedicts(pars, sampling_rates=[0.25, 1], aggregate_men=True)).initialize()
+    with pytest.raises(ValueError):
+        fp.Sim(pars=sc.mergedicts(pars, sampling_rates=[0, 1])).initialize()
+    ok('Invalid sampling rates raise an error')
+
+    return results
+
+
+def test_dtypes():
+    ''' Check that compact data types give the same results as 64-bit types '''
+    sc.heading('Testing data types...')
+
+    sims = sc.objdict()
+    for mode in ['reference', 'compact', 'compact32']:
+        sims[mode] = fp.Sim(pars=fp.pars('test', dtypes=mode), label=mode)
+        sims[mode].run()
+
+    ref, compact, compact32 = sims.values()
+    assert ref.people.parity.dtype == np.int64 and compact.people.parity.dtype == np.int8, 'Wrong integer data types'
+    assert compact.people.age.dtype == np.float64 and compact32.people.age.dtype == np.float32, 'Wrong float data types'
+    assert compact32.people.dobs.values.dtype == np.float32, 'Expected event histories of ages to use the same type as ages'
+    for key in ['births', 'deaths', 'pop_size', 'mcpr']:
+        assert np.array_equal(ref.results[key], compact.results[key]), f'Results for "{key}" differ with compact data types'
+    ok('Compact data types give the same results as reference data types')
+
+    with pytest.raises(ValueError):
+        fp.Sim(pars=fp.pars('test', dtypes='float16')).initialize()
+    ok('Invalid data type modes raise an error')
+
+    return sims
+
+
+if __name__ == '__main__':
+
+    with sc.timer():
+        sim    = test_compact_dead()
+        people = test_add_people()
+        dobs   = test_ragged()
+        people = test_states()
+        people = test_views()
+        people = test_calendar()
+        sim2   = test_aggregate_men()
+        res    = test_sampling_weights()
+        sims   = test_dtypes()